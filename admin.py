@@ -1,14 +1,28 @@
 import logging
+from datetime import datetime, timedelta, timezone
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from database import Database
-from config import ADMIN_IDS, STATUS_CANCELLED
+from config import ADMIN_IDS, STATUS_CANCELLED, ANALYTICS_CHART_DAYS, ANALYTICS_CHART_HOURS
+from send_queue import PRIORITY_PAYMENT
 
 logger = logging.getLogger(__name__)
 
 class AdminPanel:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, outbox_worker, send_queue, analytics, db_writer):
         self.db = db
+        self.outbox_worker = outbox_worker
+        self.send_queue = send_queue
+        self.db_writer = db_writer
+        # Отчеты читают снимок базы, а не рабочий файл
+        self.analytics = analytics
+    
+    def get_snapshot_note(self) -> str:
+        """Подпись об актуальности данных отчета"""
+        age = self.analytics.age()
+        if age is None:
+            return "🕒 Данные: рабочая база"
+        return f"🕒 Снимок данных: {int(age // 60)} мин. {int(age % 60)} сек. назад"
     
     def get_status_translation(self, status: str) -> str:
         """Перевод статуса сделки на русский язык"""
@@ -41,9 +55,11 @@ class AdminPanel:
         """Админская клавиатура"""
         keyboard = [
             [InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")],
+            [InlineKeyboardButton("📈 Динамика сделок", callback_data="admin_chart")],
             [InlineKeyboardButton("👥 Все пользователи", callback_data="admin_users")],
             [InlineKeyboardButton("💰 Все сделки", callback_data="admin_deals")],
             [InlineKeyboardButton("🔍 Найти сделку", callback_data="admin_find_deal")],
+            [InlineKeyboardButton("💳 Баланс CryptoPay", callback_data="admin_balance")],
             [InlineKeyboardButton("⚙️ Настройки", callback_data="admin_settings")],
             [InlineKeyboardButton("🔙 Главное меню", callback_data="main_menu")]
         ]
@@ -60,12 +76,18 @@ class AdminPanel:
         
         if query.data == "admin_stats":
             await self.show_stats(update, context)
+        elif query.data == "admin_chart":
+            await self.show_chart(update, context)
+        elif query.data == "admin_chart_hourly":
+            await self.show_chart(update, context, hourly=True)
         elif query.data == "admin_users":
             await self.show_users(update, context)
         elif query.data == "admin_deals":
             await self.show_deals(update, context)
         elif query.data == "admin_find_deal":
             await self.show_find_deal(update, context)
+        elif query.data == "admin_balance":
+            await self.show_crypto_balance(update, context)
         elif query.data == "admin_settings":
             await self.show_settings(update, context)
         elif query.data.startswith("admin_deal_"):
@@ -73,12 +95,16 @@ class AdminPanel:
             await self.show_deal_details(update, context, deal_id)
         elif query.data.startswith("admin_resolve_customer_"):
             deal_id = query.data.replace("admin_resolve_customer_", "")
-            await self.resolve_dispute(deal_id, "customer", context)
-            await query.edit_message_text("✅ Спор решен в пользу заказчика!", reply_markup=self.get_admin_keyboard())
+            if await self.resolve_dispute(deal_id, "customer", context):
+                await query.edit_message_text("✅ Спор решен в пользу заказчика!", reply_markup=self.get_admin_keyboard())
+            else:
+                await query.edit_message_text("❌ Спор уже решен или сделка не найдена!", reply_markup=self.get_admin_keyboard())
         elif query.data.startswith("admin_resolve_executor_"):
             deal_id = query.data.replace("admin_resolve_executor_", "")
-            await self.resolve_dispute(deal_id, "executor", context)
-            await query.edit_message_text("✅ Спор решен в пользу исполнителя!", reply_markup=self.get_admin_keyboard())
+            if await self.resolve_dispute(deal_id, "executor", context):
+                await query.edit_message_text("✅ Спор решен в пользу исполнителя!", reply_markup=self.get_admin_keyboard())
+            else:
+                await query.edit_message_text("❌ Спор уже решен или сделка не найдена!", reply_markup=self.get_admin_keyboard())
         elif query.data == "admin_clear_completed":
             await self.show_clear_completed_confirmation(update, context)
         elif query.data == "admin_clear_completed_confirm":
@@ -96,8 +122,7 @@ class AdminPanel:
         query = update.callback_query
         
         # Получаем статистику из базы данных
-        import sqlite3
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.analytics.connect() as conn:
             cursor = conn.cursor()
             
             # Общее количество пользователей
@@ -110,7 +135,8 @@ class AdminPanel:
             
             # Сделки по статусам
             cursor.execute("SELECT status, COUNT(*) FROM deals GROUP BY status")
-            deals_by_status = dict(cursor.fetchall())
+            deals_by_status = {Database.DEAL_STATUS_NAMES.get(status, status): count
+                               for status, count in cursor.fetchall()}
             
             # Общая сумма всех сделок
             cursor.execute("SELECT SUM(amount) FROM deals")
@@ -138,6 +164,7 @@ class AdminPanel:
             }.get(status, '❓')
             status_ru = self.get_status_translation(status)
             stats_text += f"{emoji} {status_ru}: {count}\n"
+        stats_text += f"\n{self.get_snapshot_note()}"
         
         keyboard = [
             [InlineKeyboardButton("🔄 Обновить", callback_data="admin_stats")],
@@ -146,13 +173,69 @@ class AdminPanel:
         
         await query.edit_message_text(stats_text, reply_markup=InlineKeyboardMarkup(keyboard))
     
+    async def show_chart(self, update: Update, context: ContextTypes.DEFAULT_TYPE, hourly: bool = False):
+        """Показать динамику сделок по дням или часам из таблиц сводок"""
+        query = update.callback_query
+        
+        if hourly:
+            table, bucket_format, count, step = 'deal_stats_hourly', '%Y-%m-%d %H:00', ANALYTICS_CHART_HOURS, timedelta(hours=1)
+        else:
+            table, bucket_format, count, step = 'deal_stats_daily', '%Y-%m-%d', ANALYTICS_CHART_DAYS, timedelta(days=1)
+        now = datetime.now(timezone.utc)
+        buckets = [(now - step * i).strftime(bucket_format) for i in reversed(range(count))]
+        
+        # Не более count строк по первичному ключу, независимо от числа сделок
+        with self.analytics.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT bucket, deals_created, deals_completed, deals_disputed, volume, payouts
+                FROM {table}
+                WHERE bucket >= ?
+            """, (buckets[0],))
+            rows = {row[0]: row[1:] for row in cursor.fetchall()}
+        
+        empty = (0, 0, 0, 0.0, 0.0)
+        max_volume = max((rows.get(bucket, empty)[3] for bucket in buckets), default=0) or 1
+        
+        if hourly:
+            chart_text = f"📈 Сделки за {count} ч. (UTC)\n\n"
+        else:
+            chart_text = f"📈 Сделки за {count} дн.\n\n"
+        totals = [0, 0, 0, 0.0, 0.0]
+        for bucket in buckets:
+            created, completed, disputed, volume, payouts = rows.get(bucket, empty)
+            for i, value in enumerate((created, completed, disputed, volume, payouts)):
+                totals[i] += value
+            label = f"{bucket[11:13]}ч" if hourly else f"{bucket[8:10]}.{bucket[5:7]}"
+            bar = "█" * round(volume / max_volume * 10)
+            chart_text += f"{label} {bar or '·'} {created} сд. / {volume:.0f} руб."
+            if completed or disputed:
+                chart_text += f" ✅{completed} ⚠️{disputed}"
+            chart_text += "\n"
+        
+        chart_text += f"\n🆕 Создано: {totals[0]}\n"
+        chart_text += f"✅ Завершено: {totals[1]}\n"
+        chart_text += f"⚠️ Споров: {totals[2]}\n"
+        chart_text += f"💵 Оборот: {totals[3]:.2f} руб.\n"
+        chart_text += f"💸 Выплаты: {totals[4]:.2f} руб.\n\n"
+        chart_text += self.get_snapshot_note()
+        
+        keyboard = [
+            [
+                InlineKeyboardButton("📅 По дням", callback_data="admin_chart"),
+                InlineKeyboardButton("🕐 По часам", callback_data="admin_chart_hourly")
+            ],
+            [InlineKeyboardButton("🔙 Назад", callback_data="admin_panel")]
+        ]
+        
+        await query.edit_message_text(chart_text, reply_markup=InlineKeyboardMarkup(keyboard))
+    
     async def show_users(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать список пользователей"""
         query = update.callback_query
         
         # Получаем пользователей
-        import sqlite3
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.analytics.connect() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT user_id, username, first_name, balance, created_at 
@@ -171,6 +254,7 @@ class AdminPanel:
             users_text += f"📛 Username: @{username or 'Не указан'}\n"
             users_text += f"💳 Баланс: {balance:.2f} руб.\n"
             users_text += f"📅 Регистрация: {created_at}\n\n"
+        users_text += self.get_snapshot_note()
         
         keyboard = [
             [InlineKeyboardButton("🔄 Обновить", callback_data="admin_users")],
@@ -184,8 +268,7 @@ class AdminPanel:
         query = update.callback_query
         
         # Получаем сделки
-        import sqlite3
-        with sqlite3.connect(self.db.db_path) as conn:
+        with self.analytics.connect() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT d.deal_id, d.amount, d.commission, d.status, d.created_at,
@@ -202,6 +285,8 @@ class AdminPanel:
         
         for deal in deals:
             deal_id, amount, commission, status, created_at, customer_name, executor_name = deal
+            status = Database.DEAL_STATUS_NAMES.get(status, status)
+            created_at = Database.format_timestamp(created_at)
             status_emoji = {
                 'pending': '⏳',
                 'paid': '💰',
@@ -211,13 +296,14 @@ class AdminPanel:
                 'cancelled': '❌'
             }.get(status, '❓')
             
-            deals_text += f"{status_emoji} Сделка {deal_id[:8]}...\n"
+            deals_text += f"{status_emoji} Сделка {deal_id}\n"
             deals_text += f"💰 Сумма: {amount} руб.\n"
             deals_text += f"💸 Комиссия: {commission} руб.\n"
             deals_text += f"👤 Заказчик: {customer_name}\n"
             deals_text += f"👷 Исполнитель: {executor_name}\n"
             deals_text += f"📊 Статус: {self.get_status_translation(status)}\n"
             deals_text += f"📅 Создана: {created_at}\n\n"
+        deals_text += self.get_snapshot_note()
         
         # Создаем клавиатуру с кнопками для каждой сделки
         keyboard = []
@@ -230,8 +316,8 @@ class AdminPanel:
                 'completed': '✅',
                 'disputed': '⚠️',
                 'cancelled': '❌'
-            }.get(deal[3], '❓')
-            keyboard.append([InlineKeyboardButton(f"{status_emoji} Сделка {deal_id[:8]}...", callback_data=f"admin_deal_{deal_id}")])
+            }.get(Database.DEAL_STATUS_NAMES.get(deal[3]), '❓')
+            keyboard.append([InlineKeyboardButton(f"{status_emoji} Сделка {deal_id}", callback_data=f"admin_deal_{deal_id}")])
         
         keyboard.extend([
             [InlineKeyboardButton("🔄 Обновить", callback_data="admin_deals")],
@@ -245,6 +331,41 @@ class AdminPanel:
         
         await query.edit_message_text(deals_text, reply_markup=InlineKeyboardMarkup(keyboard))
     
+    async def show_crypto_balance(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показать кэшированный баланс CryptoPay и его возраст"""
+        query = update.callback_query
+        
+        from crypto_bot_api import crypto_api
+        snapshot = crypto_api.get_cached_balance()
+        
+        balance_text = "💳 Баланс CryptoPay\n\n"
+        if snapshot['balances'] is None:
+            balance_text += "⏳ Баланс еще не загружен, попробуйте через несколько секунд."
+        else:
+            shown = 0
+            for item in snapshot['balances']:
+                available = float(item.get('available', 0) or 0)
+                onhold = float(item.get('onhold', 0) or 0)
+                if available == 0 and onhold == 0:
+                    continue
+                balance_text += f"💎 {item.get('currency_code')}: {available:.2f}"
+                if onhold:
+                    balance_text += f" (в резерве: {onhold:.2f})"
+                balance_text += "\n"
+                shown += 1
+            if not shown:
+                balance_text += "💎 Все балансы нулевые\n"
+            balance_text += f"\n🕒 Обновлено {snapshot['age']} сек. назад"
+            if snapshot['dirty']:
+                balance_text += "\n🔄 После перевода баланс обновляется..."
+        
+        keyboard = [
+            [InlineKeyboardButton("🔄 Обновить", callback_data="admin_balance")],
+            [InlineKeyboardButton("🔙 Назад", callback_data="admin_panel")]
+        ]
+        
+        await query.edit_message_text(balance_text, reply_markup=InlineKeyboardMarkup(keyboard))
+    
     async def show_settings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать настройки"""
         query = update.callback_query
@@ -261,6 +382,20 @@ class AdminPanel:
         settings_text += f"📈 Статистика сделок:\n"
         settings_text += f"✅ Выполненных: {completed_count}\n"
         settings_text += f"🔄 Активных: {active_count}\n\n"
+
+        # Метрики лимитера запросов к CryptoPay
+        from crypto_bot_api import crypto_api
+        limiter_stats = crypto_api.get_rate_limit_stats()
+        settings_text += f"📡 Очередь CryptoPay:\n"
+        settings_text += f"⏳ Сейчас в очереди: {limiter_stats['queue_depth']} (максимум {limiter_stats['max_queue_depth']})\n"
+        settings_text += f"⏱️ Среднее ожидание: {limiter_stats['avg_wait']:.2f} сек.\n"
+        settings_text += f"⚠️ Таймаутов: {limiter_stats['timeouts']}\n\n"
+
+        # Метрики очереди исходящих сообщений Telegram
+        send_stats = self.send_queue.get_stats()
+        settings_text += f"📨 Очередь сообщений:\n"
+        settings_text += f"⏳ В очереди: {send_stats['queued']}, отложено: {send_stats['delayed']} (максимум {send_stats['max_depth']})\n"
+        settings_text += f"✅ Отправлено: {send_stats['sent']}, ошибок: {send_stats['failed']}, 429: {send_stats['retry_after']}\n\n"
         settings_text += "Для изменения настроек обратитесь к разработчику."
         
         keyboard = [
@@ -496,7 +631,7 @@ class AdminPanel:
         
         try:
             # Выполняем очистку
-            deleted_count = self.db.clear_completed_deals()
+            deleted_count = await self.db_writer.call(self.db.clear_completed_deals)
             
             result_text = "✅ Очистка выполненных сделок завершена!\n\n"
             result_text += f"🗑️ Удалено сделок: {deleted_count}\n"
@@ -524,9 +659,9 @@ class AdminPanel:
                 ])
             )
     
-    async def resolve_dispute(self, deal_id: str, resolution: str, context: ContextTypes.DEFAULT_TYPE):
-        """Разрешить спор с автоматическим выводом средств через CryptoPay"""
-        from crypto_bot_api import crypto_api
+    async def resolve_dispute(self, deal_id: str, resolution: str, context: ContextTypes.DEFAULT_TYPE) -> bool:
+        """Разрешить спор с автоматическим выводом средств через CryptoPay.
+        Перевод ставится в outbox вместе со сменой статуса и выполняется в фоне"""
         deal = self.db.get_deal(deal_id)
         if not deal:
             return False
@@ -539,44 +674,46 @@ class AdminPanel:
 
         if resolution == "customer":
             # Возврат денег заказчику
+            user_id = deal['customer_id']
+            payout_amount = amount
+            transaction_type = "refund"
             if customer_crypto_id and str(customer_crypto_id).isdigit():
                 # Автоматический вывод через CryptoPay
-                success = crypto_api.transfer(str(customer_crypto_id), amount, "USDT", f"refund_{deal_id}")
-                if success:
-                    self.db.add_transaction(deal_id, deal['customer_id'], amount, "refund", "Автоматический возврат через CryptoPay")
-                else:
-                    self.db.update_balance(deal['customer_id'], amount)
-                    self.db.add_transaction(deal_id, deal['customer_id'], amount, "refund", "Возврат на внутренний баланс (ошибка CryptoPay)")
+                transfer = {
+                    'crypto_user_id': str(customer_crypto_id),
+                    'spend_id': f"refund_{deal_id}",
+                    'description': "Автоматический возврат через CryptoPay",
+                    'fallback_description': "Возврат на внутренний баланс (ошибка CryptoPay)"
+                }
             else:
-                self.db.update_balance(deal['customer_id'], amount)
-                self.db.add_transaction(deal_id, deal['customer_id'], amount, "refund", "Возврат на внутренний баланс (нет crypto user_id)")
+                transfer = None
+            description = "Возврат на внутренний баланс (нет crypto user_id)"
         elif resolution == "executor":
             # Выплата исполнителю
-            executor_amount = amount - commission
+            user_id = deal['executor_id']
+            payout_amount = amount - commission
+            transaction_type = "payout"
             if executor_crypto_id and str(executor_crypto_id).isdigit():
-                success = crypto_api.transfer(str(executor_crypto_id), executor_amount, "USDT", f"payout_{deal_id}")
-                if success:
-                    self.db.add_transaction(deal_id, deal['executor_id'], executor_amount, "payout", "Автоматическая выплата через CryptoPay")
-                else:
-                    self.db.update_balance(deal['executor_id'], executor_amount)
-                    self.db.add_transaction(deal_id, deal['executor_id'], executor_amount, "payout", "Выплата на внутренний баланс (ошибка CryptoPay)")
+                transfer = {
+                    'crypto_user_id': str(executor_crypto_id),
+                    'spend_id': f"payout_{deal_id}",
+                    'description': "Автоматическая выплата через CryptoPay",
+                    'fallback_description': "Выплата на внутренний баланс (ошибка CryptoPay)"
+                }
             else:
-                self.db.update_balance(deal['executor_id'], executor_amount)
-                self.db.add_transaction(deal_id, deal['executor_id'], executor_amount, "payout", "Выплата на внутренний баланс (нет crypto user_id)")
+                transfer = None
+            description = "Выплата на внутренний баланс (нет crypto user_id)"
+        else:
+            return False
 
-        self.db.update_deal_status(deal_id, STATUS_CANCELLED)
+        if not await self.db_writer.call(self.db.resolve_disputed_deal, deal_id, STATUS_CANCELLED, user_id,
+                                         payout_amount, transaction_type, description, transfer):
+            return False
+        if transfer and self.outbox_worker:
+            self.outbox_worker.wake()
 
         # Уведомления участникам
-        try:
-            await context.bot.send_message(
-                deal['customer_id'],
-                f"⚠️ Спор по сделке {deal_id} разрешен администратором."
-            )
-            await context.bot.send_message(
-                deal['executor_id'],
-                f"⚠️ Спор по сделке {deal_id} разрешен администратором."
-            )
-        except Exception as e:
-            logger.error(f"Не удалось отправить уведомления о разрешении спора: {e}")
+        self.send_queue.broadcast((deal['customer_id'], deal['executor_id']),
+                                  f"⚠️ Спор по сделке {deal_id} разрешен администратором.", PRIORITY_PAYMENT)
 
         return True 
\ No newline at end of file
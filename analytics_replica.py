@@ -0,0 +1,57 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional
+from database import Database
+from backup import copy_online
+from config import ANALYTICS_DB_PATH, BACKUP_PAGES, BACKUP_STEP_PAUSE
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyticsReplica:
+    """Снимок базы только для чтения, на котором строятся отчеты админ-панели.
+
+    Снимок периодически обновляется из рабочей базы через backup API
+    во временный файл, который затем атомарно подменяет прежний. Тяжелые
+    агрегаты и сортировки отчетов не держат блокировки рабочей базы,
+    куда пишут платежные обработчики.
+    """
+
+    def __init__(self, db: Database, path: str = ANALYTICS_DB_PATH):
+        self.db = db
+        self.path = path
+        self.updated_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> float:
+        """Обновить снимок. Возвращает длительность в секундах"""
+        started = time.monotonic()
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=directory)
+            os.close(fd)
+            try:
+                copy_online(self.db.db_path, tmp_path, BACKUP_PAGES, BACKUP_STEP_PAUSE)
+                os.replace(tmp_path, self.path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self.updated_at = time.time()
+        elapsed = time.monotonic() - started
+        logger.debug("📊 Снимок аналитики обновлен за %.3f сек.", elapsed)
+        return elapsed
+
+    def age(self) -> Optional[float]:
+        """Возраст снимка в секундах или None, если снимка еще нет"""
+        if self.updated_at is None:
+            return None
+        return time.time() - self.updated_at
+
+    def connect(self) -> sqlite3.Connection:
+        """Соединение только для чтения со снимком (или с рабочей базой, пока снимка нет)"""
+        path = self.path if self.updated_at is not None and os.path.exists(self.path) else self.db.db_path
+        return sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Онлайн-бэкапы базы через SQLite backup API.
+
+Копия снимается по BACKUP_PAGES страниц за шаг с паузой между шагами,
+поэтому бот продолжает писать в базу во время бэкапа. Готовая копия
+проверяется (quick_check), сжимается gzip и ротируется (хранятся
+последние BACKUP_KEEP файлов).
+
+Запуск:
+    python backup.py create                 # снять бэкап сейчас
+    python backup.py list                   # список бэкапов
+    python backup.py verify backups/garant_bot-20250101-040000.db.gz
+    python backup.py restore backups/garant_bot-20250101-040000.db.gz restored.db
+"""
+
+import argparse
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List
+from config import BACKUP_DIR, BACKUP_KEEP, BACKUP_PAGES, BACKUP_STEP_PAUSE, BACKUP_MAX_RESTARTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = "garant_bot.db"
+
+
+def _backup_name(db_path: str) -> str:
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    return f"{stem}-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.db.gz"
+
+
+def list_backups(backup_dir: str = BACKUP_DIR) -> List[str]:
+    """Файлы бэкапов, от новых к старым"""
+    if not os.path.isdir(backup_dir):
+        return []
+    files = [os.path.join(backup_dir, name) for name in os.listdir(backup_dir) if name.endswith(".db.gz")]
+    return sorted(files, reverse=True)
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def copy_online(db_path: str, target_path: str, pages: int, pause: float,
+                max_restarts: int = BACKUP_MAX_RESTARTS) -> int:
+    """Копирование базы backup API по pages страниц за шаг. Возвращает число шагов.
+
+    Запись в базу другим соединением во время паузы заставляет SQLite начать
+    копию заново. Если это случилось больше max_restarts раз, остаток
+    копируется одним шагом, иначе на занятой базе копия может не завершиться."""
+    steps = 0
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal steps, restarts, last_remaining
+        steps += 1
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+        # Между шагами блокировка источника снята - даем писателям отработать
+        if remaining and pause:
+            time.sleep(pause)
+
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress)
+        except _TooManyRestarts:
+            logger.warning("⚠️ Копия базы %s перезапускалась из-за записи %d раз, копируем одним шагом",
+                           db_path, restarts)
+            source.backup(target, pages=-1)
+            steps += 1
+    finally:
+        target.close()
+        source.close()
+    return steps
+
+
+def _check(path: str) -> str:
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute('PRAGMA quick_check').fetchall()
+    finally:
+        conn.close()
+    return "ok" if rows == [("ok",)] else "; ".join(row[0] for row in rows[:10])
+
+
+def create_backup(db_path: str = DEFAULT_DB_PATH, backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP,
+                  pages: int = BACKUP_PAGES, pause: float = BACKUP_STEP_PAUSE) -> Dict[str, Any]:
+    """Снять сжатый бэкап базы и удалить старые сверх keep"""
+    started = time.monotonic()
+    os.makedirs(backup_dir, exist_ok=True)
+    target = os.path.join(backup_dir, _backup_name(db_path))
+
+    fd, raw_path = tempfile.mkstemp(suffix=".db", dir=backup_dir)
+    os.close(fd)
+    try:
+        steps = copy_online(db_path, raw_path, pages, pause)
+        integrity = _check(raw_path)
+        if integrity != "ok":
+            raise RuntimeError(f"бэкап не прошел quick_check: {integrity}")
+
+        partial = target + ".part"
+        with open(raw_path, "rb") as src, gzip.open(partial, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(partial, target)
+        raw_size = os.path.getsize(raw_path)
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+
+    removed = 0
+    for old in list_backups(backup_dir)[keep:]:
+        os.remove(old)
+        removed += 1
+
+    report = {
+        "path": target,
+        "steps": steps,
+        "db_bytes": raw_size,
+        "gz_bytes": os.path.getsize(target),
+        "removed": removed,
+        "seconds": round(time.monotonic() - started, 3),
+    }
+    logger.info("💾 Бэкап базы: %s (%d шагов, %.1f КБ -> %.1f КБ, удалено старых: %d) за %.2f сек.",
+                target, steps, report["db_bytes"] / 1024, report["gz_bytes"] / 1024, removed, report["seconds"])
+    return report
+
+
+def restore_backup(backup_path: str, target_path: str):
+    """Распаковать бэкап в target_path (файл не должен существовать)"""
+    if os.path.exists(target_path):
+        raise FileExistsError(target_path)
+    partial = target_path + ".part"
+    with gzip.open(backup_path, "rb") as src, open(partial, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(partial, target_path)
+
+
+def verify_backup(backup_path: str) -> Dict[str, Any]:
+    """Распаковать бэкап во временный файл, проверить integrity_check и посчитать строки таблиц"""
+    with tempfile.TemporaryDirectory() as tmp:
+        restored = os.path.join(tmp, "restored.db")
+        restore_backup(backup_path, restored)
+        conn = sqlite3.connect(restored)
+        try:
+            integrity = conn.execute('PRAGMA integrity_check').fetchall()
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            )]
+            counts = {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+        finally:
+            conn.close()
+    return {
+        "integrity": "ok" if integrity == [("ok",)] else "; ".join(row[0] for row in integrity[:10]),
+        "tables": counts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бэкапы базы Гарант Бота")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Путь к базе")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="Каталог бэкапов")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("create", help="Снять бэкап")
+    sub.add_parser("list", help="Список бэкапов")
+    verify = sub.add_parser("verify", help="Проверить бэкап")
+    verify.add_argument("backup")
+    restore = sub.add_parser("restore", help="Распаковать бэкап в новый файл")
+    restore.add_argument("backup")
+    restore.add_argument("target")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        report = create_backup(args.db, args.dir)
+        print(f"✅ {report['path']} ({report['gz_bytes'] / 1024:.1f} КБ)")
+    elif args.command == "list":
+        for path in list_backups(args.dir):
+            print(f"{path}\t{os.path.getsize(path) / 1024:.1f} КБ")
+    elif args.command == "verify":
+        result = verify_backup(args.backup)
+        print(f"{'✅' if result['integrity'] == 'ok' else '❌'} integrity_check: {result['integrity']}")
+        for table, count in result["tables"].items():
+            print(f"  {table}: {count}")
+        if result["integrity"] != "ok":
+            sys.exit(1)
+    elif args.command == "restore":
+        restore_backup(args.backup, args.target)
+        print(f"✅ Бэкап распакован в {args.target}. Остановите бота и замените им базу.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк CryptoPayAPI и платежного цикла сделки против локальной заглушки.
+
+Каждая «сделка»: createInvoice -> опрос getInvoices до оплаты -> transfer.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_cryptopay --deals 200 --concurrency 16 --latency 0.05
+"""
+
+import argparse
+import statistics
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_cryptopay import start_fake_server
+from crypto_bot_api import CryptoPayAPI, RateLimiter
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run_deal(api: CryptoPayAPI, n: int, timings, poll_interval: float, max_polls: int) -> bool:
+    started = time.perf_counter()
+    invoice = api.create_invoice(10.0, "USDT", f"Оплата сделки bench_{n}")
+    timings["createInvoice"].append(time.perf_counter() - started)
+    if not invoice:
+        return False
+
+    for _ in range(max_polls):
+        started = time.perf_counter()
+        paid = api.check_payment(str(invoice["invoice_id"]))
+        timings["getInvoices"].append(time.perf_counter() - started)
+        if paid:
+            break
+        time.sleep(poll_interval)
+    else:
+        return False
+
+    started = time.perf_counter()
+    ok = api.transfer("1", 9.0, "USDT", f"payout_bench_{n}")
+    timings["transfer"].append(time.perf_counter() - started)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк CryptoPayAPI против заглушки")
+    parser.add_argument("--deals", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="Задержка заглушки, секунд")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--paid-after", type=float, default=0.0, help="Через сколько секунд инвойс оплачен")
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--rate", type=float, default=None, help="Лимит запросов/сек (по умолчанию из config)")
+    parser.add_argument("--burst", type=int, default=None)
+    args = parser.parse_args()
+
+    server, state, base_url = start_fake_server(
+        latency=args.latency, error_rate=args.error_rate, paid_after=args.paid_after
+    )
+    api = CryptoPayAPI()
+    api.base_url = base_url
+    if args.rate is not None:
+        api.rate_limiter = RateLimiter(args.rate, args.burst or int(args.rate))
+
+    timings = defaultdict(list)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda n: run_deal(api, n, timings, args.poll_interval, 200), range(args.deals)))
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    print(f"Сделок: {args.deals}, успешно: {sum(results)}, параллельность: {args.concurrency}")
+    print(f"Время: {elapsed:.2f} с, {args.deals / elapsed:.1f} сделок/с, запросов к заглушке: {state.requests}")
+    for method, values in timings.items():
+        print(f"{method:<14} n={len(values):<6} "
+              f"p50={percentile(values, 0.5) * 1000:7.1f} мс  "
+              f"p95={percentile(values, 0.95) * 1000:7.1f} мс  "
+              f"p99={percentile(values, 0.99) * 1000:7.1f} мс  "
+              f"mean={statistics.mean(values) * 1000:7.1f} мс")
+    print(f"Лимитер: {api.get_rate_limit_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк создания экземпляров Database.
+
+Замеряются три случая: первая инициализация пустой базы (все миграции),
+открытие актуальной базы новым процессом (одно чтение PRAGMA user_version)
+и повторные экземпляры для того же файла в одном процессе.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_db_init --repeat 200
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from database import Database
+
+
+def timed(make, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        make()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк создания Database")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        counter = iter(range(args.repeat * 2))
+
+        def fresh():
+            Database(os.path.join(tmp, f"fresh-{next(counter)}.db"))
+
+        path = os.path.join(tmp, "bench.db")
+        Database(path)
+
+        def reopen():
+            # Как новый процесс: кеш проверенных файлов пуст
+            Database._checked_paths.discard(os.path.abspath(path))
+            Database(path)
+
+        results = {
+            "новая база": timed(fresh, args.repeat),
+            "актуальная база": timed(reopen, args.repeat),
+            "повторный экземпляр": timed(lambda: Database(path), args.repeat),
+        }
+
+    print(f"Версия схемы: {Database.SCHEMA_VERSION}, повторов: {args.repeat}\n")
+    for label, ms in results.items():
+        print(f"{label:<22}{ms:>10.3f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк записи в базу: каждый вызов отдельной транзакцией (прежний путь,
+asyncio.to_thread на метод Database) против DbWriter с групповым COMMIT.
+
+N конкурентных "обработчиков" выполняют по K шагов сделки; шаг - три
+записи (статус, транзакция, уведомление), как при подтверждении оплаты.
+Печатаются записи в секунду, задержка шага (p50/p99) и средний размер
+транзакции писателя.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_db_writer --writers 1 10 50 --steps 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from config import STATUS_PAID, STATUS_PENDING
+from database import Database
+from db_writer import DbWriter
+
+
+def prepare(path: str, writers: int):
+    db = Database(path)
+    deals = []
+    for n in range(writers):
+        db.add_user(n + 1, f"user{n}", "Bench")
+        deals.append(db.create_deal(n + 1, 100.0, "Бенчмарк"))
+    return db, deals
+
+
+async def step_direct(db: Database, deal_id: str, user_id: int, status: str):
+    await asyncio.to_thread(db.update_deal_status, deal_id, status)
+    await asyncio.to_thread(db.add_transaction, deal_id, user_id, 1.0, "payment", "bench")
+    await asyncio.to_thread(db.add_notification, user_id, deal_id, "deal_paid", "bench")
+
+
+async def step_writer(writer: DbWriter, db: Database, deal_id: str, user_id: int, status: str):
+    await asyncio.gather(
+        writer.submit(db.update_deal_status, deal_id, status),
+        writer.submit(db.add_transaction, deal_id, user_id, 1.0, "payment", "bench"),
+        writer.submit(db.add_notification, user_id, deal_id, "deal_paid", "bench"),
+    )
+
+
+async def run(mode: str, path: str, writers: int, steps: int):
+    db, deals = prepare(path, writers)
+    writer = DbWriter(db)
+    await writer.start()
+    latencies = []
+
+    async def handler(n: int):
+        for k in range(steps):
+            status = STATUS_PAID if k % 2 == 0 else STATUS_PENDING
+            started = time.perf_counter()
+            if mode == "direct":
+                await step_direct(db, deals[n], n + 1, status)
+            else:
+                await step_writer(writer, db, deals[n], n + 1, status)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(n) for n in range(writers)))
+    elapsed = time.perf_counter() - started
+    await writer.stop()
+
+    latencies.sort()
+    writes = writers * steps * 3
+    per_batch = writer.stats["writes"] / writer.stats["batches"] if writer.stats["batches"] else 1.0
+    return {
+        "writes_s": writes / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "per_batch": per_batch,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк группового COMMIT писателя базы")
+    parser.add_argument("--writers", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--steps", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"Шагов на обработчик: {args.steps}, записей на шаг: 3\n")
+    print(f"{'N':>4}{'режим':>9}{'записей/с':>12}{'p50, мс':>10}{'p99, мс':>10}{'вызовов/COMMIT':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for writers in args.writers:
+            for mode in ("direct", "writer"):
+                path = os.path.join(tmp, f"{mode}-{writers}.db")
+                result = asyncio.run(run(mode, path, writers, args.steps))
+                per_batch = f"{result['per_batch']:.1f}" if mode == "writer" else "1.0"
+                print(f"{writers:>4}{mode:>9}{result['writes_s']:>12.0f}{result['p50']:>10.1f}"
+                      f"{result['p99']:>10.1f}{per_batch:>16}")
+
+
+if __name__ == "__main__":
+    main()
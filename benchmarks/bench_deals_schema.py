@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк схемы deals: текстовые статусы и CURRENT_TIMESTAMP против
+целочисленных кодов статусов и epoch-секунд.
+
+Обе базы заполняются одинаковыми сделками и получают одинаковый индекс
+(status, created_at). Сравниваются размер таблицы, размер индекса и время
+типовых запросов: фильтр по статусу, фильтр с сортировкой, сортировка,
+диапазон по времени.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_deals_schema --deals 200000 --repeat 20
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from database import Database
+from config import STATUS_PENDING, STATUS_PAID, STATUS_IN_PROGRESS, STATUS_COMPLETED, STATUS_DISPUTED, STATUS_CANCELLED
+
+TEXT_SCHEMA = '''
+    CREATE TABLE deals (
+        id INTEGER PRIMARY KEY,
+        deal_id TEXT NOT NULL UNIQUE,
+        customer_id INTEGER,
+        amount REAL,
+        status TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+INT_SCHEMA = '''
+    CREATE TABLE deals (
+        id INTEGER PRIMARY KEY,
+        deal_id TEXT NOT NULL UNIQUE,
+        customer_id INTEGER,
+        amount REAL,
+        status INTEGER,
+        created_at INTEGER,
+        updated_at INTEGER
+    )
+'''
+
+# Распределение статусов, близкое к рабочему: большинство сделок завершено
+STATUS_WEIGHTS = {
+    STATUS_COMPLETED: 60, STATUS_CANCELLED: 15, STATUS_PENDING: 10,
+    STATUS_IN_PROGRESS: 8, STATUS_PAID: 5, STATUS_DISPUTED: 2,
+}
+
+
+def generate(count: int, seed: int = 1):
+    rnd = random.Random(seed)
+    now = int(time.time())
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+    for n in range(count):
+        created = now - rnd.randrange(365 * 86400)
+        yield (f"D{n:07d}", rnd.randrange(1, 5000), round(rnd.uniform(1, 1000), 2),
+               rnd.choices(statuses, weights)[0], created, created + rnd.randrange(86400))
+
+
+def to_text(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def pages(conn) -> int:
+    return conn.execute('PRAGMA page_count').fetchone()[0] * conn.execute('PRAGMA page_size').fetchone()[0]
+
+
+def build(path: str, schema: str, rows, as_int: bool):
+    conn = sqlite3.connect(path)
+    conn.execute(schema)
+    if as_int:
+        data = ((deal_id, customer, amount, Database.DEAL_STATUS_CODES[status], created, updated)
+                for deal_id, customer, amount, status, created, updated in rows)
+    else:
+        data = ((deal_id, customer, amount, status, to_text(created), to_text(updated))
+                for deal_id, customer, amount, status, created, updated in rows)
+    conn.executemany(
+        'INSERT INTO deals (deal_id, customer_id, amount, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+        data
+    )
+    conn.commit()
+    table_bytes = pages(conn)
+    conn.execute('CREATE INDEX idx_deals_status ON deals (status, created_at)')
+    conn.commit()
+    index_bytes = pages(conn) - table_bytes
+    conn.execute('ANALYZE')
+    conn.commit()
+    return conn, table_bytes, index_bytes
+
+
+def timed(conn, sql: str, params, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк схемы таблицы deals")
+    parser.add_argument("--deals", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = list(generate(args.deals))
+    week_ago = int(time.time()) - 7 * 86400
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for name, schema, as_int in (("text", TEXT_SCHEMA, False), ("int", INT_SCHEMA, True)):
+            conn, table_bytes, index_bytes = build(os.path.join(tmp, f"{name}.db"), schema, rows, as_int)
+            pending = Database.DEAL_STATUS_CODES[STATUS_PENDING] if as_int else STATUS_PENDING
+            since = week_ago if as_int else to_text(week_ago)
+            queries = {
+                "count по статусу": ('SELECT COUNT(*) FROM deals WHERE status = ?', (pending,)),
+                "статус + сортировка": (
+                    'SELECT deal_id FROM deals WHERE status = ? ORDER BY created_at DESC LIMIT 10', (pending,)
+                ),
+                "сортировка всех": ('SELECT deal_id FROM deals ORDER BY created_at DESC LIMIT 10', ()),
+                "за 7 дней по статусам": (
+                    'SELECT status, COUNT(*) FROM deals WHERE created_at >= ? GROUP BY status', (since,)
+                ),
+            }
+            results[name] = {
+                "таблица": table_bytes,
+                "индекс": index_bytes,
+                **{label: timed(conn, sql, params, args.repeat) for label, (sql, params) in queries.items()},
+            }
+            conn.close()
+
+    print(f"Сделок: {args.deals}, повторов: {args.repeat}\n")
+    print(f"{'':<24}{'text':>12}{'int':>12}{'int/text':>10}")
+    for key in results["text"]:
+        text_value, int_value = results["text"][key], results["int"][key]
+        ratio = int_value / text_value if text_value else 0
+        if key in ("таблица", "индекс"):
+            print(f"{key + ', КБ':<24}{text_value / 1024:>12.0f}{int_value / 1024:>12.0f}{ratio:>10.2f}")
+        else:
+            print(f"{key + ', мс':<24}{text_value:>12.3f}{int_value:>12.3f}{ratio:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк задержки обработчика с разными вариантами логирования.
+
+Обработчик имитирует button_handler/create_deal_start: несколько записей
+в лог на каждый вызов. Сравниваются режимы:
+    off     - логирование отключено
+    sync    - прежний basicConfig: запись в stderr из потока обработчика
+    queue   - logging_setup: QueueHandler + фоновый QueueListener
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_logging --calls 20000 --level INFO
+Вывод логов в режимах sync/queue уходит в файл во временном каталоге.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+import logging_setup
+
+logger = logging.getLogger("bench.handler")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def handler(n: int):
+    logger.debug("🔘 Обработка кнопки: %s", f"deal_{n}")
+    logger.info("✅ Сделка создана deal_id=%s amount=%s", n, 10.0)
+    if n % 100 == 0:
+        logger.warning("⚠️ Неизвестная кнопка: %s", n)
+
+
+async def measure(calls: int):
+    timings = []
+    for n in range(calls):
+        started = time.perf_counter()
+        await handler(n)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def configure(mode: str, level: str, log_path: str):
+    logging_setup.stop_logging()
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+        h.close()
+    logging.disable(logging.NOTSET)
+
+    if mode == "off":
+        logging.disable(logging.CRITICAL)
+    elif mode == "sync":
+        handler_ = logging.FileHandler(log_path, encoding="utf-8")
+        handler_.setFormatter(logging.Formatter(logging_setup.TEXT_FORMAT))
+        root.addHandler(handler_)
+        root.setLevel(level)
+    else:
+        logging_setup.setup_logging(level=level, levels={}, log_file=log_path, json_format=mode == "queue-json")
+        # Заменяем stderr-вывод на /dev/null, чтобы терминал не влиял на замер
+        for h in logging_setup._listener.handlers:
+            if isinstance(h, logging.StreamHandler) and not isinstance(h, logging.FileHandler):
+                h.setStream(open(os.devnull, "w"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк логирования в обработчиках")
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--level", default="DEBUG", help="Корневой уровень логирования")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("off", "sync", "queue", "queue-json"):
+            configure(mode, args.level, os.path.join(tmp, f"{mode}.log"))
+            started = time.perf_counter()
+            timings = asyncio.run(measure(args.calls))
+            total = time.perf_counter() - started
+            logging_setup.stop_logging()
+            flushed = time.perf_counter() - started
+            us = [t * 1e6 for t in timings]
+            print(f"{mode:<11} p50={percentile(us, 0.5):7.1f} мкс  p99={percentile(us, 0.99):7.1f} мкс  "
+                  f"mean={statistics.mean(us):7.1f} мкс  цикл={total:.2f} с  с дозаписью={flushed:.2f} с")
+        logging.disable(logging.NOTSET)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк представления строк Database: словари dict(zip(columns, row))
+против классов строк из rows.py.
+
+Замеряются время построения строк из уже выбранных кортежей, память
+(tracemalloc) на список строк и время доступа к полям. Отдельно -
+полный вызов get_user_deals на временной базе.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_rows --rows 5000 --repeat 50
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from database import Database
+from rows import Deal, fetch_rows
+
+
+def build_dicts(cursor):
+    rows = cursor.fetchall()
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def build_rows(cursor):
+    return fetch_rows(cursor, Deal)
+
+
+def measure(conn, build, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        cursor = conn.execute('SELECT * FROM deals')
+        started = time.perf_counter()
+        build(cursor)
+        timings.append(time.perf_counter() - started)
+
+    cursor = conn.execute('SELECT * FROM deals')
+    tracemalloc.start()
+    result = build(cursor)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        total = 0.0
+        for deal in result:
+            total += deal['amount'] + deal['commission']
+    access = (time.perf_counter() - started) / repeat
+    return statistics.median(timings) * 1000, size, access * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк строк Database")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        db.add_user(1, "bench", "Bench")
+        # Сделки вставляются пачкой, чтобы не ждать по транзакции на строку
+        with sqlite3.connect(db.db_path) as conn:
+            conn.executemany(
+                'INSERT INTO deals (deal_id, customer_id, amount, commission, description, status) '
+                'VALUES (?, 1, ?, ?, ?, 1)',
+                ((f"B{n:07d}", 10.0 + n, 1.0, f"Сделка {n}") for n in range(args.rows))
+            )
+
+        conn = sqlite3.connect(db.db_path)
+        print(f"Строк: {args.rows}, повторов: {args.repeat}\n")
+        print(f"{'':<10}{'построение, мс':>16}{'память, КБ':>13}{'доступ, мс':>12}")
+        for name, build in (("dict", build_dicts), ("Row", build_rows)):
+            build_ms, size, access_ms = measure(conn, build, args.repeat)
+            print(f"{name:<10}{build_ms:>16.2f}{size / 1024:>13.0f}{access_ms:>12.2f}")
+        conn.close()
+
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            db.get_user_deals(1)
+            timings.append(time.perf_counter() - started)
+        print(f"\nget_user_deals: {statistics.median(timings) * 1000:.2f} мс (медиана)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сетевого профиля HTTP-клиента Telegram против локальной заглушки.
+
+Для каждого размера пула отправляется --messages сообщений sendMessage
+с параллельностью --concurrency и выводятся задержки, пропускная
+способность и число ошибок ожидания свободного соединения (pool timeout).
+Заглушка запускается отдельным процессом: в одном процессе с клиентом
+она делила бы с ним GIL и сама ограничивала пропускную способность.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_telegram --messages 2000 --concurrency 200 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import urllib.request
+
+from telegram import Bot
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest
+
+from fake_telegram import start_fake_process
+from config import (
+    TELEGRAM_CONNECTION_POOL_SIZE, TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT,
+    TELEGRAM_WRITE_TIMEOUT, TELEGRAM_POOL_TIMEOUT, TELEGRAM_HTTP_VERSION
+)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run_profile(base_url: str, pool_size: int, pool_timeout: float, messages: int, concurrency: int):
+    request = HTTPXRequest(
+        connection_pool_size=pool_size,
+        connect_timeout=TELEGRAM_CONNECT_TIMEOUT,
+        read_timeout=TELEGRAM_READ_TIMEOUT,
+        write_timeout=TELEGRAM_WRITE_TIMEOUT,
+        pool_timeout=pool_timeout,
+        http_version=TELEGRAM_HTTP_VERSION,
+    )
+    bot = Bot("1:bench", base_url=base_url, request=request)
+    semaphore = asyncio.Semaphore(concurrency)
+    timings, errors = [], {"pool_timeout": 0, "other": 0}
+
+    async def send(n: int):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await bot.send_message(chat_id=n % 1000 + 1, text=f"bench {n}")
+                timings.append(time.perf_counter() - started)
+            except TimedOut:
+                errors["pool_timeout"] += 1
+            except Exception:
+                errors["other"] += 1
+
+    async with bot:
+        started = time.perf_counter()
+        await asyncio.gather(*(send(n) for n in range(messages)))
+        total = time.perf_counter() - started
+    return timings, errors, total
+
+
+def server_stats(base_url: str, reset: bool = False):
+    """Счетчики заглушки (служебный метод _stats)"""
+    url = f"{base_url}1:bench/_stats" + ("?reset=1" if reset else "")
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)["result"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк пула соединений Telegram")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка заглушки, секунд")
+    default_pools = sorted({8, 64, 256, TELEGRAM_CONNECTION_POOL_SIZE})
+    parser.add_argument("--pools", default=",".join(map(str, default_pools)),
+                        help="Размеры пула через запятую")
+    parser.add_argument("--pool-timeout", type=float, default=None,
+                        help="Ожидание свободного соединения (по умолчанию из config)")
+    args = parser.parse_args()
+
+    pool_timeout = TELEGRAM_POOL_TIMEOUT if args.pool_timeout is None else args.pool_timeout
+    process, base_url = start_fake_process(latency=args.latency)
+    try:
+        print(f"Сообщений: {args.messages}, параллельность: {args.concurrency}, "
+              f"задержка заглушки: {args.latency * 1000:.0f} мс, pool_timeout: {pool_timeout} с")
+        for pool_size in (int(p) for p in args.pools.split(",")):
+            server_stats(base_url, reset=True)
+            timings, errors, total = asyncio.run(
+                run_profile(base_url, pool_size, pool_timeout, args.messages, args.concurrency)
+            )
+            ms = [t * 1000 for t in timings]
+            print(f"pool={pool_size:<4} {len(timings) / total:8.1f} сообщ/с  "
+                  f"p50={percentile(ms, 0.5):7.1f} мс  p95={percentile(ms, 0.95):7.1f} мс  "
+                  f"mean={statistics.mean(ms) if ms else 0:7.1f} мс  "
+                  f"pool_timeout={errors['pool_timeout']}  других ошибок={errors['other']}  "
+                  f"одновременно на сервере={server_stats(base_url)['max_in_flight']}")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,37 @@
 import logging
 import asyncio
 import random
+import datetime
+from collections import OrderedDict
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes, ConversationHandler
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters, ContextTypes, ConversationHandler
 from config import BOT_TOKEN, ADMIN_IDS, COMMISSION_PERCENT, STATUS_PENDING, STATUS_PAID, STATUS_IN_PROGRESS, STATUS_COMPLETED, STATUS_DISPUTED, STATUS_CANCELLED
+from config import RATES_REFRESH_INTERVAL, BALANCE_REFRESH_INTERVAL, BALANCE_CHECK_INTERVAL, NOTIFY_INTERVAL, RETENTION_INTERVAL
+from config import MAINTENANCE_HOUR, BACKUP_INTERVAL, ANALYTICS_REFRESH_INTERVAL, KNOWN_USERS_CACHE_SIZE, USERNAME_CACHE_SIZE
+from config import (
+    TELEGRAM_BASE_URL, TELEGRAM_CONNECTION_POOL_SIZE, TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT,
+    TELEGRAM_WRITE_TIMEOUT, TELEGRAM_POOL_TIMEOUT, TELEGRAM_HTTP_VERSION, TELEGRAM_GET_UPDATES_POOL_SIZE,
+    TELEGRAM_GET_UPDATES_READ_TIMEOUT, TELEGRAM_GET_UPDATES_POOL_TIMEOUT
+)
 from database import Database
 from keyboards import Keyboards
 from admin import AdminPanel
+from payment_outbox import OutboxWorker
+from db_writer import DbWriter
+from send_queue import SendQueue, PRIORITY_PAYMENT, PRIORITY_DEAL, PRIORITY_INFO
+from notification_delivery import NotificationDelivery
+from retention import run_retention
+from maintenance import run_maintenance
+from backup import create_backup
+from analytics_replica import AnalyticsReplica
+from rate_service import rate_service
+from logging_setup import setup_logging
 
 import re
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.DEBUG
-)
+# Настройка логирования: запись в очередь, вывод в фоновом потоке
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Состояния для ConversationHandler
@@ -24,12 +41,133 @@ WAITING_FOR_PAYMENT_METHOD, WAITING_FOR_PAYMENT_TYPE, WAITING_FOR_PREPAYMENT_AMO
 class GarantBot:
     def __init__(self):
         self.db = Database()
-        self.admin_panel = AdminPanel(self.db)
-        self.application = Application.builder().token(BOT_TOKEN).build()
+        # Все записи обработчиков идут через единственного писателя группами транзакций
+        self.db_writer = DbWriter(self.db)
+        # user_id -> хеш профиля (username, имя, фамилия), уже записанного в базу
+        self._known_users = {}
+        # Нормализованный username -> user_id (LRU) для поиска получателя сделки
+        self._username_ids = OrderedDict()
+        self.outbox_worker = OutboxWorker(self.db, self.db_writer)
+        self.send_queue = SendQueue()
+        self.notification_delivery = NotificationDelivery(self.db, self.send_queue, self.db_writer)
+        self.analytics = AnalyticsReplica(self.db)
+        self.admin_panel = AdminPanel(self.db, self.outbox_worker, self.send_queue, self.analytics, self.db_writer)
+        self.application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .base_url(TELEGRAM_BASE_URL)
+            # Пул и таймауты для исходящих запросов (send_message, edit_message_text, ...)
+            .connection_pool_size(TELEGRAM_CONNECTION_POOL_SIZE)
+            .connect_timeout(TELEGRAM_CONNECT_TIMEOUT)
+            .read_timeout(TELEGRAM_READ_TIMEOUT)
+            .write_timeout(TELEGRAM_WRITE_TIMEOUT)
+            .pool_timeout(TELEGRAM_POOL_TIMEOUT)
+            .http_version(TELEGRAM_HTTP_VERSION)
+            # Отдельный клиент для long polling
+            .get_updates_connection_pool_size(TELEGRAM_GET_UPDATES_POOL_SIZE)
+            .get_updates_connect_timeout(TELEGRAM_CONNECT_TIMEOUT)
+            .get_updates_read_timeout(TELEGRAM_GET_UPDATES_READ_TIMEOUT)
+            .get_updates_pool_timeout(TELEGRAM_GET_UPDATES_POOL_TIMEOUT)
+            .get_updates_http_version(TELEGRAM_HTTP_VERSION)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
         self.setup_handlers()
+        self.setup_jobs()
+        
+        # Журнал выплат защищает переводы CryptoPay от повторной отправки
+        from crypto_bot_api import crypto_api
+        crypto_api.attach_ledger(self.db)
+    
+    def setup_jobs(self):
+        """Настройка фоновых задач"""
+        job_queue = self.application.job_queue
+        # Обновление курсов валют CryptoPay
+        job_queue.run_repeating(self.refresh_rates_job, interval=RATES_REFRESH_INTERVAL, first=0, name="refresh_rates")
+        # Обновление снимка баланса CryptoPay (по возрасту или после перевода)
+        job_queue.run_repeating(self.refresh_balance_job, interval=BALANCE_CHECK_INTERVAL, first=0, name="refresh_balance")
+        # Доставка уведомлений из таблицы notifications в Telegram
+        job_queue.run_repeating(self.deliver_notifications_job, interval=NOTIFY_INTERVAL, first=NOTIFY_INTERVAL,
+                                name="deliver_notifications")
+        # Удаление устаревших уведомлений, чеков и предложений
+        job_queue.run_repeating(self.retention_job, interval=RETENTION_INTERVAL, first=60, name="retention")
+        # Обслуживание файла базы (ANALYZE/optimize, incremental vacuum, quick_check) в тихий час
+        job_queue.run_daily(self.maintenance_job, time=datetime.time(hour=MAINTENANCE_HOUR, tzinfo=datetime.timezone.utc),
+                            name="db_maintenance")
+        # Онлайн-бэкап базы
+        job_queue.run_repeating(self.backup_job, interval=BACKUP_INTERVAL, first=300, name="db_backup")
+        # Обновление снимка базы для отчетов админ-панели
+        job_queue.run_repeating(self.analytics_job, interval=ANALYTICS_REFRESH_INTERVAL, first=0,
+                                name="analytics_refresh")
+    
+    async def refresh_rates_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Фоновое обновление снимка курсов валют"""
+        await asyncio.to_thread(rate_service.refresh)
+    
+    async def refresh_balance_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Фоновое обновление снимка баланса CryptoPay"""
+        from crypto_bot_api import crypto_api
+        if crypto_api.balance_needs_refresh(BALANCE_REFRESH_INTERVAL):
+            await asyncio.to_thread(crypto_api.refresh_balance)
+    
+    async def deliver_notifications_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Фоновая доставка уведомлений пользователям"""
+        await self.notification_delivery.deliver_pending()
+    
+    async def retention_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Фоновая очистка данных по срокам хранения"""
+        try:
+            await asyncio.to_thread(run_retention, self.db)
+        except Exception as e:
+            logger.error("Ошибка очистки по срокам хранения: %s", e)
+    
+    async def maintenance_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Ежедневное обслуживание базы данных"""
+        try:
+            await asyncio.to_thread(run_maintenance, self.db)
+        except Exception as e:
+            logger.error("Ошибка обслуживания базы данных: %s", e)
+    
+    async def backup_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Периодический бэкап базы данных"""
+        try:
+            await asyncio.to_thread(create_backup, self.db.db_path)
+        except Exception as e:
+            logger.error("❌ Ошибка бэкапа базы данных: %s", e)
+    
+    async def analytics_job(self, context: ContextTypes.DEFAULT_TYPE):
+        """Периодическое обновление снимка базы для отчетов"""
+        try:
+            await asyncio.to_thread(self.analytics.refresh)
+        except Exception as e:
+            logger.error("❌ Ошибка обновления снимка аналитики: %s", e)
+    
+    async def post_init(self, application: Application):
+        """Действия после инициализации приложения, до начала обработки обновлений"""
+        from crypto_bot_api import crypto_api
+        
+        # Досылаем выплаты, прерванные падением бота
+        try:
+            await asyncio.to_thread(crypto_api.resume_payouts)
+        except Exception as e:
+            logger.error(f"Ошибка при возобновлении выплат: {e}")
+        
+        # Запускаем писателя базы, очередь исходящих сообщений и обработку исходящих платежных операций
+        await self.db_writer.start()
+        await self.send_queue.start(application.bot)
+        await self.outbox_worker.start()
+    
+    async def post_shutdown(self, application: Application):
+        """Действия при остановке приложения"""
+        await self.outbox_worker.stop()
+        await self.send_queue.stop()
+        await self.db_writer.stop()
     
     def setup_handlers(self):
         """Настройка обработчиков"""
+        # Профиль отправителя каждого апдейта (группа -1 - до всех остальных обработчиков)
+        self.application.add_handler(TypeHandler(Update, self.track_user), group=-1)
         # Обработчик команды /start (всегда работает вне ConversationHandler)
         self.application.add_handler(CommandHandler("start", self.start_command))
         # Обработчик команды /help
@@ -147,10 +285,48 @@ class GarantBot:
         }
         return status_translations.get(status, status)
     
+    async def remember_user(self, user):
+        """Запись пользователя Telegram в базу, только если он новый или сменил профиль"""
+        profile = hash((user.username, user.first_name, user.last_name))
+        if self._known_users.get(user.id) == profile:
+            return
+        await self.db_writer.call(self.db.add_user, user.id, user.username, user.first_name, user.last_name)
+        # Username мог смениться или перейти к этому пользователю от другого
+        for key in [key for key, user_id in self._username_ids.items() if user_id == user.id]:
+            del self._username_ids[key]
+        self._username_ids.pop(Database.normalize_username(user.username), None)
+        self._known_users.pop(user.id, None)
+        if len(self._known_users) >= KNOWN_USERS_CACHE_SIZE:
+            # Вытесняем самого давно записанного
+            del self._known_users[next(iter(self._known_users))]
+        self._known_users[user.id] = profile
+    
+    async def track_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Запись профиля отправителя любого апдейта (новые пользователи, смена username)"""
+        if update.effective_user is not None:
+            await self.remember_user(update.effective_user)
+    
+    def resolve_username(self, username: str) -> Optional[int]:
+        """user_id по username без учета регистра и @ (с LRU-кешем)"""
+        key = Database.normalize_username(username)
+        if not key:
+            return None
+        user_id = self._username_ids.get(key)
+        if user_id is not None:
+            self._username_ids.move_to_end(key)
+            return user_id
+        user = self.db.get_user_by_username(key)
+        if user is None:
+            return None
+        self._username_ids[key] = user['user_id']
+        if len(self._username_ids) > USERNAME_CACHE_SIZE:
+            self._username_ids.popitem(last=False)
+        return user['user_id']
+    
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /start"""
+        # Пользователь уже записан в базу обработчиком track_user
         user = update.effective_user
-        self.db.add_user(user.id, user.username, user.first_name, user.last_name)
 
         # Получаем количество непрочитанных уведомлений
         unread_count = self.db.get_unread_notifications_count(user.id)
@@ -232,8 +408,22 @@ class GarantBot:
         )
     
     async def rate_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработка команды /rate - показать курс валют"""
-        rate_info = "💱 Курс USD: актуальный\n\n💡 Для точного курса используйте актуальные данные при оплате."
+        """Обработка команды /rate - показать курс валют (из снимка в памяти)"""
+        usd_rub = rate_service.get_rate("USD", "RUB")
+        if usd_rub is None:
+            rate_info = f"💵 USD → RUB: ~{rate_service.get_usd_to_rub_rate():.2f} (примерный курс)\n\n"
+            rate_info += "⏳ Актуальные курсы еще загружаются."
+        else:
+            rate_info = f"💵 USD → RUB: {usd_rub:.2f}\n"
+            for asset in ("USDT", "TON", "BTC"):
+                asset_usd = rate_service.get_rate(asset, "USD")
+                if asset_usd is not None:
+                    rate_info += f"💎 {asset} → USD: {asset_usd:.4f}\n"
+            age = rate_service.age()
+            if rate_service.is_stale():
+                rate_info += f"\n⚠️ Курсы давно не обновлялись ({age // 60} мин. назад)"
+            else:
+                rate_info += f"\n🕒 Обновлено {age} сек. назад"
         
         await update.message.reply_text(
             f"💱 Курс валют\n\n{rate_info}\n\n"
@@ -251,7 +441,7 @@ class GarantBot:
             await query.answer()
         except Exception:
             pass
-        logger.info(f"🔘 Обработка кнопки: {query.data}")
+        logger.debug("🔘 Обработка кнопки: %s", query.data)
         if query.data == "main_menu":
             await self.show_main_menu(update, context)
             return
@@ -351,8 +541,7 @@ class GarantBot:
         elif query.data.startswith("verify_payment_"):
             await self.verify_payment_status(update, context)
         else:
-            logger.warning(f"⚠️ Неизвестная кнопка: {query.data}")
-            logger.warning(f"⚠️ ConversationHandler не перехватил callback: {query.data}")
+            logger.warning("⚠️ Неизвестная кнопка, ConversationHandler не перехватил callback: %s", query.data)
     
     async def show_main_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -409,10 +598,9 @@ class GarantBot:
         """Начало создания сделки"""
         query = update.callback_query
         user_id = update.effective_user.id
-        logger.info(f"🎯 create_deal_start вызван для пользователя {user_id}")
+        logger.debug("🎯 create_deal_start: пользователь %s, роль customer", user_id)
         
         context.user_data['role'] = 'customer'  # По умолчанию создаем как заказчик
-        logger.info("👤 Создание сделки как заказчик")
         
         # Выбираем текст в зависимости от языка
         amount_text = "💰 Введите сумму сделки в долларах:"
@@ -421,7 +609,6 @@ class GarantBot:
             amount_text,
             reply_markup=Keyboards.get_cancel_keyboard()
         )
-        logger.info(f"✅ create_deal_start завершен, возвращаем WAITING_FOR_AMOUNT: {WAITING_FOR_AMOUNT}")
         return WAITING_FOR_AMOUNT
     
 
@@ -455,7 +642,8 @@ class GarantBot:
         amount = context.user_data.get('amount')
         
         # Создаем сделку в базе данных
-        deal_id = self.db.create_deal_extended(
+        deal_id = await self.db_writer.call(
+            self.db.create_deal_extended,
             customer_id=user_id,
             amount=amount,
             payment_amount=amount,
@@ -473,7 +661,8 @@ class GarantBot:
             from crypto_bot_api import crypto_api
             
             # Создаем инвойс через CryptoPay API
-            invoice_data = crypto_api.create_invoice(
+            invoice_data = await asyncio.to_thread(
+                crypto_api.create_invoice,
                 amount=amount,
                 currency="USDT",
                 description=f"Оплата сделки {deal_id}"
@@ -485,7 +674,7 @@ class GarantBot:
                 pay_url = invoice_data.get('pay_url')
                 
                 # Сохраняем информацию о чеке в базе данных
-                self.db.create_check(check_id, user_id, amount, f"Оплата сделки {deal_id}", pay_url)
+                await self.db_writer.call(self.db.create_check, check_id, user_id, amount, f"Оплата сделки {deal_id}", pay_url)
                 
                 # Формируем сообщение о созданной сделке с чеком
                 deal_text = f"✅ Сделка создана!\n\n"
@@ -536,11 +725,7 @@ class GarantBot:
         
         # Отправляем уведомление администратору
         admin_message = f"🆕 Новая сделка #{deal_id}\n\n💰 Сумма: {amount} $\n📝 Описание: {description}\n👤 Заказчик: {update.effective_user.first_name}"
-        try:
-            for admin_id in ADMIN_IDS:
-                await context.bot.send_message(chat_id=admin_id, text=admin_message)
-        except Exception as e:
-            logger.error(f"Не удалось отправить уведомление администратору: {e}")
+        self.send_queue.broadcast(ADMIN_IDS, admin_message, PRIORITY_INFO)
         
         await update.message.reply_text(
             deal_text,
@@ -736,7 +921,8 @@ class GarantBot:
                     try:
                         from crypto_bot_api import crypto_api
                         
-                        invoice_data = crypto_api.create_invoice(
+                        invoice_data = await asyncio.to_thread(
+                            crypto_api.create_invoice,
                             amount=payment_amount,
                             currency="USDT",
                             description=f"Оплата сделки {deal_id}"
@@ -747,7 +933,7 @@ class GarantBot:
                             payment_url = invoice_data.get('pay_url')
                             
                             # Сохраняем чек в базе данных
-                            self.db.create_check(check_id, user_id, payment_amount, f"Оплата сделки {deal_id}", payment_url)
+                            await self.db_writer.call(self.db.create_check, check_id, user_id, payment_amount, f"Оплата сделки {deal_id}", payment_url)
                             
                             deal_text += f"💳 Инструкции по оплате:\n"
                             deal_text += f"🔗 Для оплаты перейдите по ссылке на чек:\n"
@@ -868,7 +1054,8 @@ class GarantBot:
         try:
             from crypto_bot_api import crypto_api
             
-            invoice_data = crypto_api.create_invoice(
+            invoice_data = await asyncio.to_thread(
+                crypto_api.create_invoice,
                 amount=payment_amount,
                 currency="USDT",
                 description=f"Оплата сделки {deal_id}"
@@ -879,7 +1066,7 @@ class GarantBot:
                 payment_url = invoice_data.get('pay_url')
                 
                 # Сохраняем чек в базе данных
-                self.db.create_check(check_id, update.effective_user.id, payment_amount, f"Оплата сделки {deal_id}", payment_url)
+                await self.db_writer.call(self.db.create_check, check_id, update.effective_user.id, payment_amount, f"Оплата сделки {deal_id}", payment_url)
                 
                 # Показываем информацию о чеке и ссылку на оплату
                 payment_text = f"💳 Чек создан для оплаты\n\n"
@@ -955,14 +1142,14 @@ class GarantBot:
             await query.answer("❌ Сделка уже оплачена!")
             return
         
-        # Обновляем статус сделки
+        # Статус сделки, транзакция оплаты и уведомление исполнителю (в Telegram его отправит
+        # NotificationDelivery) записываются атомарно одним вызовом
         payment_amount = deal.get('payment_amount', deal['amount'])
-        self.db.update_deal_status(deal_id, STATUS_PAID)
-        self.db.add_transaction(deal_id, update.effective_user.id, payment_amount, "payment", "Подтвержденная оплата сделки")
-        
-        # Добавляем уведомление исполнителю
         notification_message = f"💰 Сделка {deal_id} оплачена на сумму {payment_amount} $. Можете начинать работу."
-        self.db.add_notification(deal['executor_id'], deal_id, "deal_paid", notification_message)
+        if not await self.db_writer.call(self.db.confirm_deal_payment, deal_id, update.effective_user.id,
+                                         payment_amount, deal['executor_id'], notification_message):
+            await query.answer("❌ Сделка уже оплачена!")
+            return
         
         await query.edit_message_text(
             f"✅ Оплата подтверждена!\n\n"
@@ -974,15 +1161,6 @@ class GarantBot:
             reply_markup=Keyboards.get_main_menu()
         )
         
-        # Уведомление исполнителю
-        try:
-            await context.bot.send_message(
-                deal['executor_id'],
-                f"💰 Сделка {deal_id} оплачена!\n\nМожете начинать работу.",
-                reply_markup=Keyboards.get_main_menu()
-            )
-        except Exception as e:
-            logger.error(f"Не удалось отправить уведомление: {e}")
     
     async def payment_cancelled(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Отмена подтверждения оплаты"""
@@ -1015,11 +1193,11 @@ class GarantBot:
         
         # Проверяем статус через CryptoPay API
         from crypto_bot_api import crypto_api
-        invoice_status = crypto_api.check_payment(invoice['invoice_id'])
+        invoice_status = await asyncio.to_thread(crypto_api.check_payment, invoice['invoice_id'])
         
         if invoice_status:
             # Обновляем статус инвойса
-            self.db.update_invoice_status(invoice['invoice_id'], 'paid')
+            await self.db_writer.call(self.db.update_invoice_status, invoice['invoice_id'], 'paid')
             # Автоматически подтверждаем оплату
             await self.payment_confirmed(update, context)
         else:
@@ -1066,7 +1244,7 @@ class GarantBot:
             from crypto_bot_api import crypto_api
             
             # Получаем детальную информацию о статусе
-            status_info = crypto_api.get_invoice_status(check_id)
+            status_info = await asyncio.to_thread(crypto_api.get_invoice_status, check_id)
             
             if status_info:
                 status = status_info.get('status', 'unknown')
@@ -1151,7 +1329,7 @@ class GarantBot:
             await query.answer("❌ Сделка не оплачена!")
             return
         
-        self.db.update_deal_status(deal_id, STATUS_IN_PROGRESS)
+        await self.db_writer.call(self.db.update_deal_status, deal_id, STATUS_IN_PROGRESS)
         
         await query.edit_message_text(
             f"🚀 Работа начата!\n\n"
@@ -1161,14 +1339,12 @@ class GarantBot:
         )
         
         # Уведомление заказчику
-        try:
-            await context.bot.send_message(
-                deal['customer_id'],
-                f"🚀 Исполнитель начал работу по сделке {deal_id}!",
-                reply_markup=Keyboards.get_main_menu()
-            )
-        except Exception as e:
-            logger.error(f"Не удалось отправить уведомление: {e}")
+        self.send_queue.send(
+            deal['customer_id'],
+            f"🚀 Исполнитель начал работу по сделке {deal_id}!",
+            PRIORITY_DEAL,
+            reply_markup=Keyboards.get_main_menu()
+        )
     
     async def complete_work(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Завершить работу"""
@@ -1208,28 +1384,6 @@ class GarantBot:
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
     
-    async def send_commission_to_crypto_bot(self, deal_id: str, commission_amount: float):
-        """Отправка комиссии на внешнюю криптобиржу"""
-        try:
-            from crypto_bot_api import crypto_api
-            
-            # Комиссия уже в долларах (USDT), конвертация не нужна
-            usdt_commission = commission_amount
-            
-            # Отправляем комиссию через CryptoPay API на внешнюю биржу
-            success = crypto_api.send_commission(usdt_commission, "USDT", f"Deal_{deal_id}")
-            
-            if success:
-                logger.info(f"💰 Комиссия {usdt_commission} USDT успешно отправлена на внешнюю биржу за сделку {deal_id}")
-                return True
-            else:
-                logger.error(f"❌ Не удалось отправить комиссию {usdt_commission} USDT на внешнюю биржу за сделку {deal_id}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"❌ Ошибка при отправке комиссии на внешнюю биржу: {e}")
-            return False
-    
     async def confirm_completion(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Подтвердить выполнение работы"""
         query = update.callback_query
@@ -1283,16 +1437,13 @@ class GarantBot:
             await query.answer("❌ Сделка не завершена!")
             return
         
-        # Выплата исполнителю
+        # Выплата исполнителю и комиссия одной транзакцией,
+        # отправка комиссии на указанный счет уходит в outbox
         executor_amount = deal['amount'] - deal['commission']
-        self.db.update_balance(deal['executor_id'], executor_amount)
-        self.db.add_transaction(deal_id, deal['executor_id'], executor_amount, "payout", "Выплата исполнителю")
-        
-        # Отправка комиссии на указанный счет
-        await self.send_commission_to_crypto_bot(deal_id, deal['commission'])
-        
-        # Комиссия боту
-        self.db.add_transaction(deal_id, 0, deal['commission'], "commission", "Комиссия бота")
+        if not await self.db_writer.call(self.db.settle_completed_deal, deal_id, deal['executor_id'], executor_amount, deal['commission']):
+            await query.answer("❌ Выплата по сделке уже произведена!")
+            return
+        self.outbox_worker.wake()
         
         await query.edit_message_text(
             f"🎉 Деньги получены!\n\n"
@@ -1304,15 +1455,13 @@ class GarantBot:
         )
         
         # Уведомление заказчику
-        try:
-            await context.bot.send_message(
-                deal['customer_id'],
-                f"💰 Исполнитель получил оплату по сделке {deal_id}!\n\n"
-                f"Сделка полностью завершена.",
-                reply_markup=Keyboards.get_main_menu()
-            )
-        except Exception as e:
-            logger.error(f"Не удалось отправить уведомление: {e}")
+        self.send_queue.send(
+            deal['customer_id'],
+            f"💰 Исполнитель получил оплату по сделке {deal_id}!\n\n"
+            f"Сделка полностью завершена.",
+            PRIORITY_PAYMENT,
+            reply_markup=Keyboards.get_main_menu()
+        )
     
     async def finish_deal(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Завершить сделку (универсальная функция)"""
@@ -1385,7 +1534,7 @@ class GarantBot:
             return
         
         # Обновляем статус сделки
-        self.db.update_deal_status(deal_id, STATUS_COMPLETED)
+        await self.db_writer.call(self.db.update_deal_status, deal_id, STATUS_COMPLETED)
         
         # Показываем успешное завершение
         success_text = f"✅ Работа успешно завершена!\n\n"
@@ -1422,9 +1571,10 @@ class GarantBot:
                 [InlineKeyboardButton("🔙 К сделке", callback_data=f"deal_{deal_id}")]
             ]
             
-            await context.bot.send_message(
+            self.send_queue.send(
                 deal['customer_id'],
                 notification_text,
+                PRIORITY_DEAL,
                 reply_markup=InlineKeyboardMarkup(notification_keyboard)
             )
         except Exception as e:
@@ -1444,16 +1594,13 @@ class GarantBot:
             await query.answer("❌ Работа не завершена!")
             return
         
-        # Выплата исполнителю
+        # Выплата исполнителю и комиссия одной транзакцией,
+        # отправка комиссии на указанный счет уходит в outbox
         executor_amount = deal['amount'] - deal['commission']
-        self.db.update_balance(deal['executor_id'], executor_amount)
-        self.db.add_transaction(deal_id, deal['executor_id'], executor_amount, "payout", "Выплата исполнителю")
-        
-        # Отправка комиссии на указанный счет
-        await self.send_commission_to_crypto_bot(deal_id, deal['commission'])
-        
-        # Комиссия боту
-        self.db.add_transaction(deal_id, 0, deal['commission'], "commission", "Комиссия бота")
+        if not await self.db_writer.call(self.db.settle_completed_deal, deal_id, deal['executor_id'], executor_amount, deal['commission']):
+            await query.answer("❌ Выплата по сделке уже произведена!")
+            return
+        self.outbox_worker.wake()
         
         # Показываем успешное завершение
         success_text = f"🎉 Сделка успешно завершена!\n\n"
@@ -1487,9 +1634,10 @@ class GarantBot:
                 [InlineKeyboardButton("🏠 Главное меню", callback_data="main_menu")]
             ]
             
-            await context.bot.send_message(
+            self.send_queue.send(
                 deal['executor_id'],
                 notification_text,
+                PRIORITY_PAYMENT,
                 reply_markup=InlineKeyboardMarkup(notification_keyboard)
             )
         except Exception as e:
@@ -1511,7 +1659,7 @@ class GarantBot:
             return
         
         # Обновляем статус сделки на спор
-        self.db.update_deal_status(deal_id, STATUS_DISPUTED)
+        await self.db_writer.call(self.db.update_deal_status, deal_id, STATUS_DISPUTED)
         
         dispute_text = f"⚠️ Спор открыт по сделке {deal_id}\n\n"
         dispute_text += f"💰 Сумма: {deal['amount']} $\n"
@@ -1531,14 +1679,12 @@ class GarantBot:
         
         # Уведомление другому участнику
         other_user_id = deal['executor_id'] if deal['customer_id'] == user_id else deal['customer_id']
-        try:
-            await context.bot.send_message(
-                other_user_id,
-                f"⚠️ Открыт спор по сделке {deal_id}!\n\nОбратитесь к администратору.",
-                reply_markup=Keyboards.get_main_menu()
-            )
-        except Exception as e:
-            logger.error(f"Не удалось отправить уведомление о споре: {e}")
+        self.send_queue.send(
+            other_user_id,
+            f"⚠️ Открыт спор по сделке {deal_id}!\n\nОбратитесь к администратору.",
+            PRIORITY_DEAL,
+            reply_markup=Keyboards.get_main_menu()
+        )
     
     async def show_balance(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать баланс пользователя"""
@@ -1577,13 +1723,13 @@ class GarantBot:
             username = username[1:]
         
         # Находим пользователя по username
-        user = self.db.get_user_by_username(username)
-        if not user:
+        user_id = self.resolve_username(username)
+        if not user_id:
             await update.message.reply_text("❌ Пользователь с таким username не найден!")
             return WAITING_FOR_USERNAME
         
         # Создаём предложение сделки
-        offer_id = self.db.create_deal_offer(deal_id, update.effective_user.id, user['user_id'])
+        offer_id = await self.db_writer.call(self.db.create_deal_offer, deal_id, update.effective_user.id, user_id)
         
         # Уведомляем исполнителя с кнопками
         from telegram import InlineKeyboardButton, InlineKeyboardMarkup
@@ -1594,9 +1740,10 @@ class GarantBot:
             ]
         ])
         try:
-            await context.bot.send_message(
-                user['user_id'],
+            await self.send_queue.send(
+                user_id,
                 f"📨 Вам поступило предложение сделки!\n\nID: {deal_id}\nПосмотрите детали и примите решение:",
+                PRIORITY_DEAL,
                 reply_markup=keyboard
             )
         except Exception as e:
@@ -1634,13 +1781,13 @@ class GarantBot:
             username = username[1:]
         
         # Находим пользователя по username
-        user = self.db.get_user_by_username(username)
-        if not user:
+        user_id = self.resolve_username(username)
+        if not user_id:
             await update.message.reply_text("❌ Пользователь с таким username не найден!")
             return WAITING_FOR_USERNAME
         
         # Назначаем исполнителя
-        success = self.db.assign_executor(deal_id, user['id'])
+        success = await self.db_writer.call(self.db.assign_executor, deal_id, user_id)
         
         if success:
             await update.message.reply_text(
@@ -1679,29 +1826,25 @@ class GarantBot:
         if username.startswith('@'):
             username = username[1:]
         # Находим пользователя по username
-        user = self.db.get_user_by_username(username)
-        if not user:
+        user_id = self.resolve_username(username)
+        if not user_id:
             await update.message.reply_text("❌ Пользователь с таким username не найден!")
             return WAITING_FOR_USERNAME
         # Предлагаем сделку
-        success = self.db.offer_deal(deal_id, update.effective_user.id, user['id'])
+        success = await self.db_writer.call(self.db.offer_deal, deal_id, update.effective_user.id, user_id)
         if success:
             # Уведомляем заказчика (отправителя)
-            try:
-                await context.bot.send_message(
-                    update.effective_user.id,
-                    f"✅ Ваше предложение сделки отправлено пользователю @{username}!"
-                )
-            except Exception:
-                pass
+            self.send_queue.send(
+                update.effective_user.id,
+                f"✅ Ваше предложение сделки отправлено пользователю @{username}!",
+                PRIORITY_DEAL
+            )
             # Уведомляем получателя (исполнителя)
-            try:
-                await context.bot.send_message(
-                    user['id'],
-                    f"📨 Вам поступило предложение сделки от пользователя @{update.effective_user.username or update.effective_user.id} (ID: {deal_id})"
-                )
-            except Exception:
-                pass
+            self.send_queue.send(
+                user_id,
+                f"📨 Вам поступило предложение сделки от пользователя @{update.effective_user.username or update.effective_user.id} (ID: {deal_id})",
+                PRIORITY_DEAL
+            )
             await update.message.reply_text(
                 f"✅ Сделка {deal_id} предложена пользователю @{username}",
                 reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="main_menu")]])
@@ -1725,18 +1868,16 @@ class GarantBot:
         # Только для групп/каналов
         if chat.type != 'private':
             if '@Almazov_guarantor_robot' not in message.text:
-                try:
-                    # Формируем упоминание пользователя
-                    user = message.from_user
-                    mention = user.mention_html() if hasattr(user, 'mention_html') else f"<a href='tg://user?id={user.id}'>пользователь</a>"
-                    await context.bot.send_message(
-                        chat.id,
-                        f"{mention}, чтобы написать в этот чат, обязательно укажите @Almazov_guarantor_robot в сообщении!",
-                        reply_to_message_id=message.message_id,
-                        parse_mode='HTML'
-                    )
-                except Exception:
-                    pass
+                # Формируем упоминание пользователя
+                user = message.from_user
+                mention = user.mention_html() if hasattr(user, 'mention_html') else f"<a href='tg://user?id={user.id}'>пользователь</a>"
+                self.send_queue.send(
+                    chat.id,
+                    f"{mention}, чтобы написать в этот чат, обязательно укажите @Almazov_guarantor_robot в сообщении!",
+                    PRIORITY_INFO,
+                    reply_to_message_id=message.message_id,
+                    parse_mode='HTML'
+                )
                 try:
                     await message.delete()
                 except Exception:
@@ -1842,17 +1983,15 @@ class GarantBot:
             return
         
         # Принимаем заказ
-        success = self.db.accept_deal(deal_id, user_id)
+        success = await self.db_writer.call(self.db.accept_deal, deal_id, user_id)
         
         if success:
             # Уведомляем заказчика
-            try:
-                await context.bot.send_message(
-                    deal['customer_id'],
-                    f"✅ Ваш заказ {deal_id} принят исполнителем!\n\nОжидайте оплаты для начала работы."
-                )
-            except Exception as e:
-                logger.error(f"Не удалось уведомить заказчика: {e}")
+            self.send_queue.send(
+                deal['customer_id'],
+                f"✅ Ваш заказ {deal_id} принят исполнителем!\n\nОжидайте оплаты для начала работы.",
+                PRIORITY_DEAL
+            )
             
             await query.edit_message_text(
                 f"✅ Заказ {deal_id} успешно принят!\n\nОжидайте оплаты от заказчика для начала работы.",
@@ -1949,22 +2088,21 @@ class GarantBot:
         executor_id = offer['to_user_id']
         customer_id = offer['from_user_id']
         # Сначала обновляем статус предложения
-        self.db.update_deal_offer_status(offer_id, 'accepted')
+        await self.db_writer.call(self.db.update_deal_offer_status, offer_id, 'accepted')
         # Назначаем исполнителя
-        success = self.db.assign_executor(deal_id, executor_id)
+        success = await self.db_writer.call(self.db.assign_executor, deal_id, executor_id)
         if success:
             # Уведомляем обе стороны
-            try:
-                await context.bot.send_message(
-                    executor_id,
-                    f"✅ Вы приняли предложение и назначены исполнителем сделки!\nID: {deal_id}"
-                )
-                await context.bot.send_message(
-                    customer_id,
-                    f"✅ Ваше предложение сделки принято исполнителем!\nID: {deal_id}"
-                )
-            except Exception as e:
-                logger.error(f'Ошибка при уведомлении сторон: {e}')
+            self.send_queue.send(
+                executor_id,
+                f"✅ Вы приняли предложение и назначены исполнителем сделки!\nID: {deal_id}",
+                PRIORITY_DEAL
+            )
+            self.send_queue.send(
+                customer_id,
+                f"✅ Ваше предложение сделки принято исполнителем!\nID: {deal_id}",
+                PRIORITY_DEAL
+            )
             await query.edit_message_text(
                 "✅ Вы приняли предложение!",
                 reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="main_menu")]])
@@ -1986,19 +2124,18 @@ class GarantBot:
         deal_id = offer['deal_id']
         executor_id = offer['to_user_id']
         customer_id = offer['from_user_id']
-        self.db.update_deal_offer_status(offer_id, 'rejected')
+        await self.db_writer.call(self.db.update_deal_offer_status, offer_id, 'rejected')
         # Уведомляем обе стороны
-        try:
-            await context.bot.send_message(
-                executor_id,
-                f"❌ Вы отклонили предложение сделки.\nID: {deal_id}"
-            )
-            await context.bot.send_message(
-                customer_id,
-                f"❌ Ваше предложение сделки было отклонено исполнителем.\nID: {deal_id}"
-            )
-        except Exception as e:
-            logger.error(f'Ошибка при уведомлении сторон: {e}')
+        self.send_queue.send(
+            executor_id,
+            f"❌ Вы отклонили предложение сделки.\nID: {deal_id}",
+            PRIORITY_DEAL
+        )
+        self.send_queue.send(
+            customer_id,
+            f"❌ Ваше предложение сделки было отклонено исполнителем.\nID: {deal_id}",
+            PRIORITY_DEAL
+        )
         await query.edit_message_text(
             "❌ Вы отклонили предложение",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="main_menu")]])
@@ -2015,11 +2152,11 @@ class GarantBot:
             return
         
         # Принимаем предложение
-        success = self.db.accept_deal(offer['deal_id'], offer['to_user_id'])
+        success = await self.db_writer.call(self.db.accept_deal, offer['deal_id'], offer['to_user_id'])
         
         if success:
             # Обновляем статус предложения
-            self.db.update_deal_offer_status(offer_id, 'accepted')
+            await self.db_writer.call(self.db.update_deal_offer_status, offer_id, 'accepted')
             
             await query.edit_message_text(
                 f"✅ Предложение сделки принято!\n\nОжидайте оплаты от заказчика.",
@@ -2042,7 +2179,7 @@ class GarantBot:
             return
         
         # Отклоняем предложение
-        self.db.update_deal_offer_status(offer_id, 'rejected')
+        await self.db_writer.call(self.db.update_deal_offer_status, offer_id, 'rejected')
         
         await query.edit_message_text(
             "❌ Предложение сделки отклонено.",
@@ -2136,7 +2273,7 @@ class GarantBot:
         query = update.callback_query
         user_id = update.effective_user.id
         
-        self.db.mark_all_notifications_read(user_id)
+        await self.db_writer.call(self.db.mark_all_notifications_read, user_id)
         
         await query.edit_message_text(
             "✅ Все уведомления отмечены как прочитанные!",
@@ -8,13 +8,90 @@ BOT_TOKEN = '8358529091:AAGsoEGKWERtoC9_IwmzHyi9PSBpmq5Zfd8'
 # ADMIN_ID = 7726649938
 ADMIN_IDS = [7726649938, 5731003228, 686666666, 7229590364]  # добавлен @almazovp2p
 
+# Сетевой профиль HTTP-клиента Telegram (применяется в GarantBot.__init__)
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "https://api.telegram.org/bot")  # Локальный Bot API или заглушка
+TELEGRAM_CONNECTION_POOL_SIZE = int(os.getenv("TELEGRAM_CONNECTION_POOL_SIZE", "256"))  # Соединения для send_message и т.п. (как по умолчанию в PTB)
+TELEGRAM_CONNECT_TIMEOUT = 5.0   # Установка соединения, секунд
+TELEGRAM_READ_TIMEOUT = 10.0     # Ожидание ответа, секунд
+TELEGRAM_WRITE_TIMEOUT = 10.0    # Отправка запроса (в т.ч. файлов), секунд
+TELEGRAM_POOL_TIMEOUT = 10.0     # Ожидание свободного соединения в пуле, секунд
+TELEGRAM_HTTP_VERSION = os.getenv("TELEGRAM_HTTP_VERSION", "1.1")  # "2" требует пакет httpx[http2]
+# Отдельный пул для long polling getUpdates, чтобы он не занимал соединения исходящих сообщений
+TELEGRAM_GET_UPDATES_POOL_SIZE = 1
+TELEGRAM_GET_UPDATES_READ_TIMEOUT = 30.0
+TELEGRAM_GET_UPDATES_POOL_TIMEOUT = 5.0
+
+# Очередь исходящих сообщений (send_queue.py), лимиты Telegram
+SEND_GLOBAL_RATE = 25.0          # Сообщений в секунду на весь бот (лимит Telegram ~30)
+SEND_GLOBAL_BURST = 25           # Максимальный всплеск
+SEND_CHAT_INTERVAL = 1.0         # Интервал между сообщениями в один личный чат, секунд
+SEND_GROUP_CHAT_INTERVAL = 3.0   # Интервал для групп (лимит Telegram 20 сообщений в минуту)
+SEND_CONCURRENCY = 8             # Одновременных запросов sendMessage
+SEND_MAX_ATTEMPTS = 3            # Попыток при сетевых ошибках
+SEND_RETRY_DELAY = 2.0           # Базовая пауза между попытками, секунд
+
+# Доставка уведомлений из таблицы notifications в Telegram (notification_delivery.py)
+NOTIFY_INTERVAL = 3         # Интервал прохода доставки, секунд
+NOTIFY_COALESCE_WINDOW = 2  # Уведомления моложе этого возраста ждут следующего прохода, секунд
+NOTIFY_BATCH_SIZE = 200     # Уведомлений за один проход
+NOTIFY_MAX_ITEMS = 10       # Сколько уведомлений показывать в одном объединенном сообщении
+
+# Сроки хранения данных (retention.py), очистка фоновой задачей
+RETENTION_INTERVAL = 3600                  # Интервал запуска очистки, секунд
+RETENTION_BATCH_SIZE = 500                 # Строк за одну транзакцию
+RETENTION_BATCH_PAUSE = 0.05               # Пауза между пачками, секунд
+RETENTION_NOTIFICATIONS_READ_DAYS = 30     # Прочитанные уведомления
+RETENTION_NOTIFICATIONS_UNREAD_DAYS = 180  # Непрочитанные уведомления
+RETENTION_CHECKS_DAYS = 30                 # Чеки (кроме чеков сделок, ожидающих оплаты)
+RETENTION_OFFERS_DAYS = 30                 # Отклоненные и принятые предложения сделок
+RETENTION_ROLLUP_HOURLY_DAYS = 90          # Почасовые сводки по сделкам (дневные хранятся всегда)
+
+# Обслуживание SQLite (maintenance.py): ежедневно в тихий час
+MAINTENANCE_HOUR = 4               # Час запуска по UTC
+MAINTENANCE_ANALYSIS_LIMIT = 1000  # PRAGMA analysis_limit: строк на индекс при ANALYZE
+MAINTENANCE_VACUUM_PAGES = 2000    # Страниц, возвращаемых одним incremental_vacuum
+
+# Онлайн-бэкапы базы (backup.py)
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")  # Каталог бэкапов
+BACKUP_INTERVAL = 6 * 3600    # Интервал бэкапов, секунд
+BACKUP_KEEP = 14              # Сколько последних бэкапов хранить
+BACKUP_PAGES = 256            # Страниц за один шаг backup API
+BACKUP_STEP_PAUSE = 0.01      # Пауза между шагами, чтобы не задерживать запись, секунд
+BACKUP_MAX_RESTARTS = 3       # Перезапусков копии из-за записи, после которых копируем одним шагом
+
+# Снимок базы для отчетов админ-панели (analytics_replica.py)
+ANALYTICS_DB_PATH = os.getenv("ANALYTICS_DB_PATH", "analytics.db")  # Файл снимка
+ANALYTICS_REFRESH_INTERVAL = 300  # Интервал обновления снимка, секунд
+ANALYTICS_CHART_DAYS = 14         # Дней на графике динамики сделок
+ANALYTICS_CHART_HOURS = 24        # Часов на почасовом графике
+
 # Настройки комиссии (в процентах)
 COMMISSION_PERCENT = 40.0  # 40% от суммы сделки
 
 # Настройки CryptoPay API
 CRYPTOPAY_API_KEY = '429837:AAwGb3pgcB4UcJgSJDIILXmZhwvBSP3jXSL'
 CRYPTOPAY_WALLET_ID = 5731003228  # ID администратора
-CRYPTOPAY_API_URL = "https://pay.crypt.bot/api"
+CRYPTOPAY_API_URL = os.getenv("CRYPTOPAY_API_URL", "https://pay.crypt.bot/api")  # Для офлайн-тестов: см. fake_cryptopay.py
+
+# Клиентский лимит запросов к CryptoPay API (token bucket, общий для всех методов)
+CRYPTOPAY_RATE_LIMIT = 5.0    # Запросов в секунду в среднем
+CRYPTOPAY_RATE_BURST = 10     # Максимальный всплеск запросов
+CRYPTOPAY_RATE_TIMEOUT = 30.0  # Максимальное ожидание очереди, секунд
+
+# Outbox исходящих платежных операций
+OUTBOX_CONCURRENCY = 4        # Число параллельных воркеров
+OUTBOX_POLL_INTERVAL = 2.0    # Интервал опроса outbox, секунд
+OUTBOX_BATCH_SIZE = 20        # Сколько операций забирать за один опрос
+OUTBOX_MAX_ATTEMPTS = 5       # Попыток до пометки операции как failed
+OUTBOX_RETRY_DELAY = 30       # Пауза перед повторной попыткой, секунд
+
+# Единственный писатель в базу (db_writer.py): записи обработчиков группируются в общие транзакции
+DB_WRITER_TICK = 0.005        # Сколько ждать попутных записей перед COMMIT, секунд
+DB_WRITER_MAX_BATCH = 200     # Максимум вызовов в одной транзакции
+
+# Кеш известных пользователей: /start пишет в базу только для новых и сменивших профиль
+KNOWN_USERS_CACHE_SIZE = 100000  # Сколько пользователей помнить
+USERNAME_CACHE_SIZE = 1000       # LRU-кеш username -> user_id для поиска исполнителя/получателя
 
 # Настройки внешней криптобиржи для комиссии
 EXTERNAL_EXCHANGE_NAME = "Binance"  # Название биржи
@@ -22,9 +99,32 @@ EXTERNAL_EXCHANGE_WALLET_ADDRESS = "TPicyKTC5qkBAACrgki49AiVgBuAr1JDuH"  # Ад
 EXTERNAL_EXCHANGE_API_KEY = ""  # API ключ биржи (если нужен)
 EXTERNAL_EXCHANGE_SECRET = ""  # Секрет API биржи (если нужен)
 
-# Курс валют (можно обновлять через API)
+# Курс валют (резервное значение, пока rate_service не загрузил курсы CryptoPay)
 USD_TO_RUB_RATE = 95.0  # Примерный курс доллара к рублю
 
+# Фоновое обновление курсов CryptoPay (getExchangeRates)
+RATES_REFRESH_INTERVAL = 300  # Интервал обновления, секунд
+RATES_STALE_AFTER = 900       # Через сколько секунд снимок считается устаревшим
+
+# Фоновое обновление снимка баланса CryptoPay (getBalance)
+BALANCE_REFRESH_INTERVAL = 120  # Максимальный возраст снимка, секунд
+BALANCE_CHECK_INTERVAL = 10     # Как часто проверять, нужно ли обновление (например, после перевода)
+
+# Логирование (см. logging_setup.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")           # Корневой уровень
+LOG_FILE = os.getenv("LOG_FILE", "logs/bot.log")     # Пустая строка отключает запись в файл
+LOG_MAX_BYTES = 10 * 1024 * 1024                     # Размер файла до ротации
+LOG_BACKUP_COUNT = 5                                 # Сколько старых файлов хранить
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"         # JSON-строки вместо текстового формата
+LOG_LEVELS = {                  # Уровни логгеров по модулям
+    "crypto_bot_api": "INFO",
+    "crypto_bot_api.http": "WARNING",  # Тела запросов/ответов CryptoPay; DEBUG включает выборку
+    "httpx": "WARNING",
+    "httpcore": "WARNING",
+}
+LOG_BODY_LIMIT = 500            # Максимальная длина тела ответа в логе, символов
+LOG_SUCCESS_SAMPLE_RATE = 0.01  # Доля успешных ответов CryptoPay, тело которых пишется в DEBUG
+
 # Статусы сделок
 STATUS_PENDING = "pending"      # Ожидает оплаты
 STATUS_PAID = "paid"           # Оплачено
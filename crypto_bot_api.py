@@ -1,10 +1,151 @@
 import requests
 import logging
 import json
-from typing import Optional, Dict, Any
-from config import CRYPTOPAY_API_KEY, CRYPTOPAY_WALLET_ID, CRYPTOPAY_API_URL, EXTERNAL_EXCHANGE_WALLET_ADDRESS, EXTERNAL_EXCHANGE_NAME
+import time
+import random
+import heapq
+import itertools
+import threading
+from typing import Optional, Dict, Any, List
+from config import (
+    CRYPTOPAY_API_KEY, CRYPTOPAY_WALLET_ID, CRYPTOPAY_API_URL, EXTERNAL_EXCHANGE_WALLET_ADDRESS, EXTERNAL_EXCHANGE_NAME,
+    CRYPTOPAY_RATE_LIMIT, CRYPTOPAY_RATE_BURST, CRYPTOPAY_RATE_TIMEOUT,
+    LOG_BODY_LIMIT, LOG_SUCCESS_SAMPLE_RATE
+)
 
 logger = logging.getLogger(__name__)
+# Тела запросов и ответов пишутся в отдельный логгер, чтобы их уровень настраивался независимо
+http_logger = logging.getLogger(f"{__name__}.http")
+
+# Классы приоритета запросов (меньше - важнее)
+PRIORITY_PAYOUT = 0   # Переводы и выплаты
+PRIORITY_INVOICE = 1  # Создание инвойсов
+PRIORITY_POLL = 2     # Проверка статусов, баланс и прочие опросы
+
+PRIORITY_NAMES = {
+    PRIORITY_PAYOUT: 'payout',
+    PRIORITY_INVOICE: 'invoice',
+    PRIORITY_POLL: 'poll'
+}
+
+
+def _mask_secret(secret: str) -> str:
+    """Маскирование секрета для логов: видна только часть до двоеточия"""
+    if not secret:
+        return "<empty>"
+    prefix = secret.split(":", 1)[0] if ":" in secret else ""
+    return f"{prefix}:***" if prefix else "***"
+
+
+def _redact(text: str) -> str:
+    """Удаление API токена CryptoPay из текста перед записью в лог"""
+    if CRYPTOPAY_API_KEY and CRYPTOPAY_API_KEY in text:
+        text = text.replace(CRYPTOPAY_API_KEY, _mask_secret(CRYPTOPAY_API_KEY))
+    return text
+
+
+def _truncate(text: str, limit: int = LOG_BODY_LIMIT) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...(+{len(text) - limit} симв.)"
+
+
+class _LogBody:
+    """Тело ответа для лога: обрезка и маскирование выполняются только при форматировании записи"""
+    __slots__ = ("text",)
+
+    def __init__(self, text: Optional[str]):
+        self.text = text or ""
+
+    def __str__(self) -> str:
+        return _truncate(_redact(self.text))
+
+
+class PayoutPending(Exception):
+    """Итог перевода неизвестен (запрос не отправлен, сетевая ошибка, 5xx/429).
+    Выплата остается в журнале в статусе 'pending' и досылается с тем же spend_id"""
+
+
+class RateLimiter:
+    """Token bucket с приоритетной очередью ожидания.
+
+    Общий для всех методов CryptoPayAPI: токены пополняются со скоростью
+    rate в секунду (не больше burst), а при нехватке токенов первым
+    обслуживается самый приоритетный из ожидающих запросов.
+    """
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiters = []  # куча (приоритет, порядковый номер)
+        self._seq = itertools.count()
+        self._depth = {priority: 0 for priority in PRIORITY_NAMES}
+        self._max_depth = 0
+        self._granted = {priority: 0 for priority in PRIORITY_NAMES}
+        self._timeouts = 0
+        self._wait_total = 0.0
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def acquire(self, priority: int = PRIORITY_POLL, timeout: Optional[float] = None) -> bool:
+        """Получить токен. Возвращает False, если не дождались за timeout секунд"""
+        started = time.monotonic()
+        deadline = started + timeout if timeout is not None else None
+        
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            self._depth[priority] = self._depth.get(priority, 0) + 1
+            self._max_depth = max(self._max_depth, len(self._waiters))
+            try:
+                while True:
+                    self._refill()
+                    if self._waiters[0] == ticket and self.tokens >= 1:
+                        heapq.heappop(self._waiters)
+                        self.tokens -= 1
+                        self._granted[priority] = self._granted.get(priority, 0) + 1
+                        self._wait_total += time.monotonic() - started
+                        # Следующий в очереди может забрать оставшиеся токены
+                        self._cond.notify_all()
+                        return True
+                    
+                    wait = None
+                    if self._waiters[0] == ticket:
+                        wait = (1 - self.tokens) / self.rate
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._waiters.remove(ticket)
+                            heapq.heapify(self._waiters)
+                            self._timeouts += 1
+                            self._cond.notify_all()
+                            return False
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self._depth[priority] -= 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики лимитера: глубина очереди, выданные токены, таймауты"""
+        with self._cond:
+            self._refill()
+            granted_total = sum(self._granted.values())
+            return {
+                'tokens': round(self.tokens, 2),
+                'queue_depth': len(self._waiters),
+                'queue_depth_by_priority': {PRIORITY_NAMES.get(p, p): d for p, d in self._depth.items()},
+                'max_queue_depth': self._max_depth,
+                'granted_by_priority': {PRIORITY_NAMES.get(p, p): n for p, n in self._granted.items()},
+                'timeouts': self._timeouts,
+                'avg_wait': self._wait_total / granted_total if granted_total else 0.0
+            }
+
 
 class CryptoPayAPI:
     """Класс для работы с CryptoPay API"""
@@ -13,20 +154,51 @@ class CryptoPayAPI:
         self.api_key = api_key
         self.base_url = CRYPTOPAY_API_URL
         self.session = requests.Session()
-        logger.info(f"Инициализирован CryptoPay API с ключом: {api_key[:10]}...")
+        self.rate_limiter = RateLimiter(CRYPTOPAY_RATE_LIMIT, CRYPTOPAY_RATE_BURST)
+        self.ledger = None  # Журнал выплат, подключается через attach_ledger
+        # Снимок баланса, обновляется фоновой задачей через refresh_balance
+        self._balance_lock = threading.Lock()
+        self._balance: Optional[List[Dict[str, Any]]] = None
+        self._balance_updated_at: Optional[float] = None
+        self._balance_dirty = True
+        logger.info("Инициализирован CryptoPay API url=%s token=%s", self.base_url, _mask_secret(api_key))
+    
+    def _request(self, method: str, params: Optional[Dict[str, Any]] = None,
+                 priority: int = PRIORITY_POLL) -> Optional[requests.Response]:
+        """Выполнение запроса к CryptoPay API через общий лимитер"""
+        if not self.rate_limiter.acquire(priority, timeout=CRYPTOPAY_RATE_TIMEOUT):
+            logger.error("⏳ Превышено время ожидания лимита запросов CryptoPay method=%s", method)
+            return None
+        
+        headers = {
+            "Crypto-Pay-API-Token": self.api_key,
+            "Content-Type": "application/json"
+        }
+        started = time.monotonic()
+        try:
+            response = self.session.get(f"{self.base_url}/{method}", headers=headers, params=params)
+        except Exception as e:
+            logger.error("CryptoPay method=%s error=%s elapsed=%.3f", method, e, time.monotonic() - started)
+            raise
+        elapsed = time.monotonic() - started
+        
+        if response.status_code != 200:
+            logger.warning("CryptoPay method=%s status=%s elapsed=%.3f", method, response.status_code, elapsed)
+        elif http_logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_SUCCESS_SAMPLE_RATE:
+            http_logger.debug("CryptoPay method=%s status=%s elapsed=%.3f params=%s body=%s",
+                              method, response.status_code, elapsed, params, _LogBody(response.text))
+        else:
+            logger.debug("CryptoPay method=%s status=%s elapsed=%.3f", method, response.status_code, elapsed)
+        return response
+    
+    def get_rate_limit_stats(self) -> Dict[str, Any]:
+        """Метрики клиентского лимитера запросов"""
+        return self.rate_limiter.get_stats()
     
     def create_invoice(self, amount: float, currency: str = "USDT", description: str = "") -> Optional[Dict[str, Any]]:
         """Создание инвойса для оплаты через CryptoPay"""
         try:
-            logger.info(f"Создание инвойса: {amount} {currency} для {description}")
-            logger.info(f"Используемый API ключ: {self.api_key[:20]}...")
-            logger.info(f"URL API: {self.base_url}")
-            
-            # Правильный формат запроса к CryptoBot API
-            headers = {
-                "Crypto-Pay-API-Token": self.api_key,
-                "Content-Type": "application/json"
-            }
+            logger.debug("Создание инвойса amount=%s asset=%s description=%s", amount, currency, description)
             
             # Параметры запроса
             params = {
@@ -35,49 +207,41 @@ class CryptoPayAPI:
                 "description": description
             }
             
-            logger.info(f"Заголовки запроса: {headers}")
-            logger.info(f"Параметры запроса: {params}")
-            
-            response = self.session.get(f"{self.base_url}/createInvoice", headers=headers, params=params)
-            logger.info(f"Получен ответ: {response.status_code} - {response.text}")
-            
+            response = self._request("createInvoice", params, PRIORITY_INVOICE)
+            if response is None:
+                return None
             if response.status_code == 200:
                 result = response.json()
                 if result.get("ok"):
                     invoice_data = result.get("result", {})
-                    logger.info(f"✅ Создан инвойс: {invoice_data.get('invoice_id')}")
+                    logger.info("✅ Создан инвойс invoice_id=%s", invoice_data.get('invoice_id'))
                     return invoice_data
                 else:
                     error_info = result.get('error', {})
-                    logger.error(f"❌ Ошибка создания инвойса: {error_info}")
+                    logger.error("❌ Ошибка создания инвойса: %s", error_info)
                     if error_info.get('code') == 401:
                         logger.error("🔑 Ошибка 401: Неверный API токен. Проверьте токен в @CryptoBot -> API")
                     return None
             else:
-                logger.error(f"Ошибка создания инвойса: {response.status_code} - {response.text}")
+                logger.error("Ошибка создания инвойса: %s - %s", response.status_code, _LogBody(response.text))
                 if response.status_code == 401:
                     logger.error("🔑 Ошибка 401: Неверный API токен. Проверьте токен в @CryptoBot -> API")
                 return None
             
         except Exception as e:
-            logger.error(f"Ошибка при создании инвойса: {e}")
+            logger.error("Ошибка при создании инвойса: %s", e)
             return None
     
     def get_invoice_status(self, invoice_id: str) -> Optional[Dict[str, Any]]:
         """Получение статуса инвойса"""
         try:
-            headers = {
-                "Crypto-Pay-API-Token": self.api_key,
-                "Content-Type": "application/json"
-            }
-            
             params = {
                 "invoice_ids": invoice_id
             }
             
-            response = self.session.get(f"{self.base_url}/getInvoices", headers=headers, params=params)
-            logger.info(f"Получен ответ getInvoices: {response.status_code} - {response.text}")
-            
+            response = self._request("getInvoices", params, PRIORITY_POLL)
+            if response is None:
+                return None
             if response.status_code == 200:
                 result = response.json()
                 if result.get("ok"):
@@ -86,19 +250,19 @@ class CryptoPayAPI:
                     invoices = result_data.get("items", [])
                     
                     if invoices:
-                        logger.info(f"✅ Найден инвойс: {invoices[0].get('invoice_id')} со статусом {invoices[0].get('status')}")
+                        logger.debug("✅ Найден инвойс invoice_id=%s status=%s", invoices[0].get('invoice_id'), invoices[0].get('status'))
                         return invoices[0]  # Возвращаем первый инвойс
                     else:
-                        logger.error(f"Инвойс {invoice_id} не найден")
+                        logger.error("Инвойс %s не найден", invoice_id)
                         return None
                 else:
-                    logger.error(f"❌ Ошибка получения статуса инвойса: {result.get('error')}")
+                    logger.error("❌ Ошибка получения статуса инвойса: %s", result.get('error'))
                     return None
             else:
-                logger.error(f"Ошибка получения статуса инвойса: {response.status_code}")
+                logger.error("Ошибка получения статуса инвойса: %s - %s", response.status_code, _LogBody(response.text))
                 return None
         except Exception as e:
-            logger.error(f"Ошибка при получении статуса инвойса: {e}")
+            logger.error("Ошибка при получении статуса инвойса: %s", e)
             return None
     
     def check_payment(self, invoice_id: str) -> bool:
@@ -106,43 +270,103 @@ class CryptoPayAPI:
         try:
             status = self.get_invoice_status(invoice_id)
             if status and status.get("status") == "paid":
-                logger.info(f"✅ Инвойс {invoice_id} оплачен")
+                logger.info("✅ Инвойс %s оплачен", invoice_id)
                 return True
             return False
         except Exception as e:
-            logger.error(f"Ошибка при проверке оплаты: {e}")
+            logger.error("Ошибка при проверке оплаты: %s", e)
             return False
     
+    def attach_ledger(self, ledger):
+        """Подключение журнала выплат (Database) для идемпотентности переводов по spend_id"""
+        self.ledger = ledger
+    
     def transfer(self, user_id: str, amount: float, currency: str = "USDT", description: str = "") -> bool:
-        """Перевод средств пользователю"""
+        """Перевод средств пользователю (описание используется как spend_id).
+        True - перевод проведен, False - CryptoPay окончательно отказал.
+        Если итог неизвестен, выбрасывает PayoutPending: выплата остается в журнале
+        и повторяется с тем же spend_id, который CryptoPay не проведет дважды"""
+        spend_id = description
         try:
-            headers = {
-                "Crypto-Pay-API-Token": self.api_key,
-                "Content-Type": "application/json"
-            }
+            if self.ledger is not None and spend_id:
+                # Повтор или двойное нажатие не должны снова уходить в CryptoPay
+                if not self.ledger.claim_payout(spend_id, str(user_id), currency, amount):
+                    payout = self.ledger.get_payout(spend_id)
+                    state = payout['state'] if payout else 'unknown'
+                    logger.warning("⏭️ Перевод %s уже есть в журнале выплат (статус: %s), запрос не отправлен", spend_id, state)
+                    if state in ('completed', 'failed'):
+                        return state == 'completed'
+                    raise PayoutPending(f"перевод {spend_id} еще не завершен (статус: {state})")
+            
+            state, response_text = self._send_transfer(user_id, amount, currency, spend_id)
             
+            if self.ledger is not None and spend_id:
+                self.ledger.finish_payout(spend_id, state, response_text)
+            if state == 'pending':
+                raise PayoutPending(f"итог перевода {spend_id} неизвестен")
+            if state == 'completed':
+                self.invalidate_balance()
+            return state == 'completed'
+        except PayoutPending:
+            raise
+        except Exception as e:
+            logger.error("Ошибка при переводе %s: %s", spend_id, e)
+            return False
+    
+    def _send_transfer(self, user_id: str, amount: float, currency: str, spend_id: str):
+        """HTTP-запрос transfer. Возвращает (статус выплаты, ответ CryptoPay):
+        'completed', 'failed' при окончательном отказе (4xx или ok: false),
+        'pending', если запрос не ушел или его итог неизвестен"""
+        try:
             params = {
                 "user_id": user_id,
                 "asset": currency,
                 "amount": str(amount),
-                "spend_id": description  # Используем описание как spend_id
+                "spend_id": spend_id
             }
             
-            response = self.session.get(f"{self.base_url}/transfer", headers=headers, params=params)
+            response = self._request("transfer", params, PRIORITY_PAYOUT)
+            if response is None:
+                # Лимитер не выдал токен - запрос не отправлялся
+                return 'pending', None
             if response.status_code == 200:
                 result = response.json()
                 if result.get("ok"):
-                    logger.info(f"✅ Перевод {amount} {currency} успешно отправлен пользователю {user_id}")
-                    return True
-                else:
-                    logger.error(f"❌ Ошибка перевода: {result.get('error')}")
-                    return False
-            else:
-                logger.error(f"Ошибка перевода: {response.status_code} - {response.text}")
-                return False
+                    logger.info("✅ Перевод %s %s успешно отправлен пользователю %s spend_id=%s", amount, currency, user_id, spend_id)
+                    return 'completed', response.text
+                error = result.get('error') or {}
+                logger.error("❌ Ошибка перевода spend_id=%s: %s", spend_id, error)
+                code = error.get('code', 400) if isinstance(error, dict) else 400
+                return ('pending' if code == 429 or code >= 500 else 'failed'), response.text
+            logger.error("Ошибка перевода spend_id=%s: %s - %s", spend_id, response.status_code, _LogBody(response.text))
+            if response.status_code == 429 or response.status_code >= 500:
+                return 'pending', response.text
+            return 'failed', response.text
         except Exception as e:
-            logger.error(f"Ошибка при переводе: {e}")
-            return False
+            # Сетевая ошибка: перевод мог пройти, решит повтор с тем же spend_id
+            logger.error("Ошибка при переводе spend_id=%s: %s", spend_id, e)
+            return 'pending', str(e)
+    
+    def resume_payouts(self) -> int:
+        """Досылка выплат, прерванных падением процесса. Возвращает число завершенных"""
+        if self.ledger is None:
+            return 0
+        
+        payouts = self.ledger.release_unfinished_payouts()
+        if not payouts:
+            return 0
+        
+        logger.info("🔁 Возобновление %d незавершенных выплат", len(payouts))
+        resumed = 0
+        for payout in payouts:
+            # spend_id тот же, поэтому CryptoPay не проведет перевод дважды
+            try:
+                if self.transfer(payout['crypto_user_id'], payout['amount'], payout['asset'], payout['spend_id']):
+                    resumed += 1
+            except PayoutPending as e:
+                logger.warning("⏳ Выплата отложена до следующего запуска: %s", e)
+        logger.info("✅ Возобновлено выплат: %d из %d", resumed, len(payouts))
+        return resumed
     
     def send_commission(self, amount: float, currency: str = "USDT", description: str = "") -> bool:
         """Отправка комиссии на внешнюю криптобиржу"""
@@ -153,19 +377,15 @@ class CryptoPayAPI:
             # Отправляем комиссию на внешний адрес кошелька
             return self.send_to_external_wallet(commission, currency, description)
             
+        except PayoutPending:
+            raise
         except Exception as e:
-            logger.error(f"Ошибка при отправке комиссии: {e}")
+            logger.error("Ошибка при отправке комиссии: %s", e)
             return False
     
     def send_to_external_wallet(self, amount: float, currency: str = "USDT", description: str = "") -> bool:
         """Отправка средств на внешний кошелек (криптобиржу)"""
         try:
-            # Используем CryptoPay API для отправки на внешний адрес
-            headers = {
-                "Crypto-Pay-API-Token": self.api_key,
-                "Content-Type": "application/json"
-            }
-            
             # Для отправки на внешний адрес используем метод withdraw
             params = {
                 "asset": currency,
@@ -174,80 +394,120 @@ class CryptoPayAPI:
                 "spend_id": f"commission_{description}"
             }
             
-            logger.info(f"📤 Отправка {amount} {currency} на {EXTERNAL_EXCHANGE_NAME} кошелек: {EXTERNAL_EXCHANGE_WALLET_ADDRESS}")
+            logger.info("📤 Отправка %s %s на %s кошелек: %s", amount, currency, EXTERNAL_EXCHANGE_NAME, EXTERNAL_EXCHANGE_WALLET_ADDRESS)
             
             # Примечание: Этот метод может отличаться в зависимости от API CryptoPay
             # Возможно потребуется использовать другой endpoint или параметры
-            response = self.session.get(f"{self.base_url}/withdraw", headers=headers, params=params)
+            response = self._request("withdraw", params, PRIORITY_PAYOUT)
+            if response is None:
+                return self.send_commission_fallback(amount, currency, description)
             
             if response.status_code == 200:
                 result = response.json()
                 if result.get("ok"):
-                    logger.info(f"✅ Комиссия {amount} {currency} успешно отправлена на {EXTERNAL_EXCHANGE_NAME} ({EXTERNAL_EXCHANGE_WALLET_ADDRESS})")
+                    logger.info("✅ Комиссия %s %s успешно отправлена на %s (%s)", amount, currency, EXTERNAL_EXCHANGE_NAME, EXTERNAL_EXCHANGE_WALLET_ADDRESS)
+                    self.invalidate_balance()
                     return True
                 else:
-                    logger.error(f"❌ Ошибка отправки комиссии на {EXTERNAL_EXCHANGE_NAME}: {result.get('error')}")
+                    logger.error("❌ Ошибка отправки комиссии на %s: %s", EXTERNAL_EXCHANGE_NAME, result.get('error'))
                     # Fallback: отправляем на внутренний кошелек администратора
                     return self.send_commission_fallback(amount, currency, description)
             else:
-                logger.error(f"Ошибка отправки комиссии на {EXTERNAL_EXCHANGE_NAME}: {response.status_code} - {response.text}")
+                logger.error("Ошибка отправки комиссии на %s: %s - %s", EXTERNAL_EXCHANGE_NAME, response.status_code, _LogBody(response.text))
                 # Fallback: отправляем на внутренний кошелек администратора
                 return self.send_commission_fallback(amount, currency, description)
                 
+        except PayoutPending:
+            # Исход резервного перевода неизвестен - второй попытки не делаем
+            raise
         except Exception as e:
-            logger.error(f"Ошибка при отправке на {EXTERNAL_EXCHANGE_NAME}: {e}")
+            logger.error("Ошибка при отправке на %s: %s", EXTERNAL_EXCHANGE_NAME, e)
             # Fallback: отправляем на внутренний кошелек администратора
             return self.send_commission_fallback(amount, currency, description)
     
     def send_commission_fallback(self, amount: float, currency: str = "USDT", description: str = "") -> bool:
         """Резервный метод отправки комиссии на внутренний кошелек администратора"""
         try:
-            headers = {
-                "Crypto-Pay-API-Token": self.api_key,
-                "Content-Type": "application/json"
-            }
+            logger.info("🔄 Резервная отправка %s %s на внутренний кошелек администратора", amount, currency)
             
-            params = {
-                "user_id": CRYPTOPAY_WALLET_ID,
-                "asset": currency,
-                "amount": str(amount),
-                "spend_id": f"fallback_commission_{description}"
-            }
-            
-            logger.info(f"🔄 Резервная отправка {amount} {currency} на внутренний кошелек администратора")
-            
-            response = self.session.get(f"{self.base_url}/transfer", headers=headers, params=params)
-            if response.status_code == 200:
-                result = response.json()
-                if result.get("ok"):
-                    logger.info(f"✅ Комиссия {amount} {currency} отправлена на резервный кошелек {CRYPTOPAY_WALLET_ID}")
-                    return True
-                else:
-                    logger.error(f"❌ Ошибка резервной отправки комиссии: {result.get('error')}")
-                    return False
+            success = self.transfer(str(CRYPTOPAY_WALLET_ID), amount, currency, f"fallback_commission_{description}")
+            if success:
+                logger.info("✅ Комиссия %s %s отправлена на резервный кошелек %s", amount, currency, CRYPTOPAY_WALLET_ID)
             else:
-                logger.error(f"Ошибка резервной отправки комиссии: {response.status_code} - {response.text}")
-                return False
+                logger.error("❌ Ошибка резервной отправки комиссии на кошелек %s", CRYPTOPAY_WALLET_ID)
+            return success
+        except PayoutPending:
+            raise
         except Exception as e:
-            logger.error(f"Ошибка при резервной отправке комиссии: {e}")
+            logger.error("Ошибка при резервной отправке комиссии: %s", e)
             return False
     
     def get_balance(self) -> Optional[Dict[str, Any]]:
         """Получение баланса"""
         try:
-            headers = {
-                "Crypto-Pay-API-Token": self.api_key,
-                "Content-Type": "application/json"
-            }
-            
-            response = self.session.get(f"{self.base_url}/getBalance", headers=headers)
+            response = self._request("getBalance", priority=PRIORITY_POLL)
+            if response is None:
+                return None
             if response.status_code == 200:
                 return response.json()
             else:
-                logger.error(f"Ошибка получения баланса: {response.status_code}")
+                logger.error("Ошибка получения баланса: %s - %s", response.status_code, _LogBody(response.text))
+                return None
+        except Exception as e:
+            logger.error("Ошибка при получении баланса: %s", e)
+            return None
+    
+    def refresh_balance(self) -> bool:
+        """Обновление снимка баланса из getBalance"""
+        data = self.get_balance()
+        if not data or not data.get("ok"):
+            return False
+        with self._balance_lock:
+            self._balance = data.get("result", [])
+            self._balance_updated_at = time.time()
+            self._balance_dirty = False
+        return True
+    
+    def invalidate_balance(self):
+        """Пометить снимок баланса устаревшим (после перевода средств)"""
+        with self._balance_lock:
+            self._balance_dirty = True
+    
+    def balance_needs_refresh(self, max_age: float) -> bool:
+        """Снимок баланса отсутствует, устарел или помечен после перевода"""
+        with self._balance_lock:
+            if self._balance_dirty or self._balance_updated_at is None:
+                return True
+            return time.time() - self._balance_updated_at >= max_age
+    
+    def get_cached_balance(self) -> Dict[str, Any]:
+        """Снимок баланса без обращения к API: балансы, возраст и признак устаревания"""
+        with self._balance_lock:
+            updated_at = self._balance_updated_at
+            return {
+                'balances': list(self._balance) if self._balance is not None else None,
+                'updated_at': updated_at,
+                'age': int(time.time() - updated_at) if updated_at is not None else None,
+                'dirty': self._balance_dirty
+            }
+    
+    def get_exchange_rates(self) -> Optional[List[Dict[str, Any]]]:
+        """Получение курсов валют (getExchangeRates)"""
+        try:
+            response = self._request("getExchangeRates", priority=PRIORITY_POLL)
+            if response is None:
+                return None
+            if response.status_code == 200:
+                result = response.json()
+                if result.get("ok"):
+                    return result.get("result", [])
+                logger.error("❌ Ошибка получения курсов валют: %s", result.get('error'))
+                return None
+            else:
+                logger.error("Ошибка получения курсов валют: %s - %s", response.status_code, _LogBody(response.text))
                 return None
         except Exception as e:
-            logger.error(f"Ошибка при получении баланса: {e}")
+            logger.error("Ошибка при получении курсов валют: %s", e)
             return None
 
 # Создаем глобальный экземпляр API
@@ -1,171 +1,600 @@
+import os
 import sqlite3
+import threading
 import uuid
-from datetime import datetime
-from typing import List, Dict, Optional
+import re
+import secrets
+from datetime import datetime, timezone
+from typing import Any, Callable, List, Dict, Optional, Tuple
 import logging
+import json
+from rows import User, Deal, Invoice, Notification, DealOffer, DealMessage, Check, Payout, OutboxOperation, fetch_row, fetch_rows
+from config import STATUS_PENDING, STATUS_PAID, STATUS_IN_PROGRESS, STATUS_COMPLETED, STATUS_DISPUTED, STATUS_CANCELLED
+
+class _SavepointConnection:
+    """Соединение пакетной транзакции для одного вызова метода Database.
+    Вызов выполняется в своей точке сохранения: commit() освобождает ее,
+    rollback() и исключение откатывают только изменения этого вызова"""
+    
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self._open = False
+    
+    def __enter__(self):
+        self._conn.execute('SAVEPOINT write_intent')
+        self._open = True
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+    
+    def cursor(self) -> sqlite3.Cursor:
+        return self._conn.cursor()
+    
+    def execute(self, *args) -> sqlite3.Cursor:
+        return self._conn.execute(*args)
+    
+    def commit(self):
+        if self._open:
+            self._conn.execute('RELEASE write_intent')
+            self._open = False
+    
+    def rollback(self):
+        if self._open:
+            self._conn.execute('ROLLBACK TO write_intent')
+            self._conn.execute('RELEASE write_intent')
+            self._open = False
 
 class Database:
+    # Таблицы сводок по сделкам и формат ключа периода (время UTC, как CURRENT_TIMESTAMP)
+    ROLLUP_TABLES = (
+        ('deal_stats_hourly', '%Y-%m-%d %H:00'),
+        ('deal_stats_daily', '%Y-%m-%d'),
+    )
+    
+    # Таблицы, ссылающиеся на сделку по deals.id (колонка deal_ref)
+    DEAL_CHILD_TABLES = ('transactions', 'deal_messages', 'notifications', 'invoices', 'deal_offers')
+    
+    # Алфавит публичного кода сделки: без похожих символов (0/O, 1/I/L)
+    DEAL_CODE_ALPHABET = 'ABCDEFGHJKMNPQRSTUVWXYZ23456789'
+    DEAL_CODE_LENGTH = 8
+    
+    # Коды статусов сделки в базе; наружу отдаются строки config.STATUS_*
+    DEAL_STATUS_CODES = {
+        STATUS_PENDING: 1,
+        STATUS_PAID: 2,
+        STATUS_IN_PROGRESS: 3,
+        STATUS_COMPLETED: 4,
+        STATUS_DISPUTED: 5,
+        STATUS_CANCELLED: 6,
+    }
+    DEAL_STATUS_NAMES = {code: name for name, code in DEAL_STATUS_CODES.items()}
+    
+    # Миграции схемы по порядку: (номер версии, метод). Каждая миграция идемпотентна,
+    # поэтому базы без user_version (созданные до нумерации) проходят их все
+    MIGRATIONS = (
+        (1, '_migration_tables'),
+        (2, '_migration_deal_keys'),
+        (3, '_migration_deal_status'),
+        (4, '_migration_notification_delivery'),
+        (5, '_migration_unread_counter'),
+        (6, '_migration_deal_rollups'),
+        (7, '_migration_username_norm'),
+    )
+    SCHEMA_VERSION = MIGRATIONS[-1][0]
+    
+    # Файлы баз, схема которых уже проверена в этом процессе
+    _checked_paths = set()
+    _schema_lock = threading.Lock()
+    
     def __init__(self, db_path: str = "garant_bot.db"):
         self.db_path = db_path
+        # Преобразования колонок при чтении: код статуса -> config.STATUS_*, epoch -> текст
+        self._deal_converters = {
+            'status': self._status_name,
+            'created_at': self.format_timestamp,
+            'updated_at': self.format_timestamp,
+        }
+        self._offer_converters = {'deal_status': self._status_name}
+        # Соединение пакета DbWriter, выполняемого в текущем потоке
+        self._batch = threading.local()
         self.init_database()
     
     def init_database(self):
-        """Инициализация базы данных"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Создание таблицы пользователей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    balance REAL DEFAULT 0.0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Создание таблицы сделок
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS deals (
-                    deal_id TEXT PRIMARY KEY,
-                    customer_id INTEGER,
-                    executor_id INTEGER,
-                    amount REAL,
-                    commission REAL,
-                    description TEXT,
-                    status TEXT,
-                    payment_amount REAL DEFAULT 0.0,
-                    payment_method TEXT DEFAULT 'crypto',
-                    payment_type TEXT DEFAULT 'full',
-                    remaining_amount REAL DEFAULT 0.0,
-                    customer_payment_method TEXT DEFAULT 'crypto',
-                    customer_payment_address TEXT,
-                    executor_payment_method TEXT DEFAULT 'crypto',
-                    executor_payment_address TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (customer_id) REFERENCES users (user_id),
-                    FOREIGN KEY (executor_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            # Создание таблицы транзакций
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS transactions (
-                    transaction_id TEXT PRIMARY KEY,
-                    deal_id TEXT,
-                    user_id INTEGER,
-                    amount REAL,
-                    transaction_type TEXT,
-                    description TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (deal_id) REFERENCES deals (deal_id),
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            # Создание таблицы сообщений сделок
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS deal_messages (
-                    message_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    deal_id TEXT,
-                    user_id INTEGER,
-                    message_text TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (deal_id) REFERENCES deals (deal_id),
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            # Создание таблицы уведомлений
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS notifications (
-                    notification_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    deal_id TEXT,
-                    notification_type TEXT,
-                    message TEXT,
-                    is_read BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id),
-                    FOREIGN KEY (deal_id) REFERENCES deals (deal_id)
-                )
-            ''')
-            
-            # Создание таблицы инвойсов
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS invoices (
-                    invoice_id TEXT PRIMARY KEY,
-                    deal_id TEXT,
-                    amount REAL,
-                    currency TEXT,
-                    description TEXT,
-                    pay_url TEXT,
-                    status TEXT DEFAULT 'pending',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    paid_at TIMESTAMP,
-                    FOREIGN KEY (deal_id) REFERENCES deals (deal_id)
+        """Приведение схемы базы к SCHEMA_VERSION.
+        Для актуальной базы это одно чтение PRAGMA user_version, а повторные
+        экземпляры Database для того же файла в этом процессе не открывают соединение"""
+        path = os.path.abspath(self.db_path)
+        if path in Database._checked_paths:
+            return
+        with Database._schema_lock:
+            if path in Database._checked_paths:
+                return
+            conn = sqlite3.connect(self.db_path)
+            try:
+                if conn.execute('PRAGMA user_version').fetchone()[0] < self.SCHEMA_VERSION:
+                    self._apply_migrations(conn)
+            finally:
+                conn.close()
+            Database._checked_paths.add(path)
+    
+    def _apply_migrations(self, conn):
+        """Применение недостающих миграций по порядку одной транзакцией"""
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            # Версию перечитываем под блокировкой записи: другой процесс мог уже обновить схему
+            version = cursor.execute('PRAGMA user_version').fetchone()[0]
+            for target, name in self.MIGRATIONS:
+                if target > version:
+                    getattr(self, name)(cursor)
+            cursor.execute(f'PRAGMA user_version = {int(self.SCHEMA_VERSION)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if version < self.SCHEMA_VERSION:
+            logging.info("🗄️ Схема базы обновлена: версия %d -> %d", version, self.SCHEMA_VERSION)
+    
+    def _migration_tables(self, cursor):
+        """Основные таблицы"""
+        # Создание таблицы пользователей
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                last_name TEXT,
+                balance REAL DEFAULT 0.0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Создание таблицы сделок
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS deals (
+                id INTEGER PRIMARY KEY,
+                deal_id TEXT NOT NULL UNIQUE,
+                customer_id INTEGER,
+                executor_id INTEGER,
+                amount REAL,
+                commission REAL,
+                description TEXT,
+                status INTEGER,
+                payment_amount REAL DEFAULT 0.0,
+                payment_method TEXT DEFAULT 'crypto',
+                payment_type TEXT DEFAULT 'full',
+                remaining_amount REAL DEFAULT 0.0,
+                customer_payment_method TEXT DEFAULT 'crypto',
+                customer_payment_address TEXT,
+                executor_payment_method TEXT DEFAULT 'crypto',
+                executor_payment_address TEXT,
+                created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                updated_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                FOREIGN KEY (customer_id) REFERENCES users (user_id),
+                FOREIGN KEY (executor_id) REFERENCES users (user_id)
+            )
+        ''')
+        
+        # Создание таблицы транзакций
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS transactions (
+                transaction_id INTEGER PRIMARY KEY,
+                deal_ref INTEGER,
+                user_id INTEGER,
+                amount REAL,
+                transaction_type TEXT,
+                description TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (deal_ref) REFERENCES deals (id),
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+        
+        # Создание таблицы сообщений сделок
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS deal_messages (
+                message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                deal_ref INTEGER,
+                user_id INTEGER,
+                message_text TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (deal_ref) REFERENCES deals (id),
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+        
+        # Создание таблицы уведомлений
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS notifications (
+                notification_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                deal_ref INTEGER,
+                notification_type TEXT,
+                message TEXT,
+                is_read BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (user_id),
+                FOREIGN KEY (deal_ref) REFERENCES deals (id)
+            )
+        ''')
+        
+        # Создание таблицы инвойсов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS invoices (
+                invoice_id TEXT PRIMARY KEY,
+                deal_ref INTEGER,
+                amount REAL,
+                currency TEXT,
+                description TEXT,
+                pay_url TEXT,
+                status TEXT DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                paid_at TIMESTAMP,
+                FOREIGN KEY (deal_ref) REFERENCES deals (id)
+            )
+        ''')
+        
+        # Создание таблицы предложений сделок
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS deal_offers (
+                offer_id TEXT PRIMARY KEY,
+                deal_ref INTEGER,
+                from_user_id INTEGER,
+                to_user_id INTEGER,
+                status TEXT DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (deal_ref) REFERENCES deals (id),
+                FOREIGN KEY (from_user_id) REFERENCES users (user_id),
+                FOREIGN KEY (to_user_id) REFERENCES users (user_id)
+            )
+        ''')
+        
+        # Создание таблицы чеков
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS checks (
+                check_id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                amount REAL,
+                description TEXT,
+                pay_url TEXT,
+                status TEXT DEFAULT 'pending',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+        
+        # Создание журнала выплат CryptoPay (идемпотентность по spend_id)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payouts (
+                spend_id TEXT PRIMARY KEY,
+                crypto_user_id TEXT,
+                asset TEXT,
+                amount REAL,
+                state TEXT DEFAULT 'pending',
+                response TEXT,
+                attempts INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_payouts_state ON payouts (state)')
+        
+        # Создание outbox для исходящих платежных операций
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                outbox_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                operation TEXT,
+                idempotency_key TEXT UNIQUE,
+                payload TEXT,
+                state TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                last_error TEXT,
+                next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox (state, next_attempt_at)')
+    
+    def _migration_deal_keys(self, cursor):
+        """Целочисленные ключи сделок и ссылки deal_ref (базы, созданные до смены схемы)"""
+        if 'id' not in self._table_columns(cursor, 'deals'):
+            self._migrate_deal_keys(cursor)
+        for table in self.DEAL_CHILD_TABLES:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_deal ON {table} (deal_ref)')
+    
+    def _migration_deal_status(self, cursor):
+        """Целочисленные коды статусов и epoch-время сделок"""
+        if self._table_columns(cursor, 'deals')['status'] != 'INTEGER':
+            self._migrate_deal_status(cursor)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_deals_status ON deals (status, created_at)')
+    
+    def _migration_notification_delivery(self, cursor):
+        """Отметка доставки уведомлений в Telegram (NULL - еще не отправлено)"""
+        cursor.execute('PRAGMA table_info(notifications)')
+        if 'delivered_at' not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute('ALTER TABLE notifications ADD COLUMN delivered_at TIMESTAMP')
+            # Уведомления, созданные до появления доставки, повторно не рассылаем
+            cursor.execute('UPDATE notifications SET delivered_at = created_at')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_notifications_undelivered
+            ON notifications (notification_id) WHERE delivered_at IS NULL
+        ''')
+    
+    def _migration_unread_counter(self, cursor):
+        """Счетчик непрочитанных уведомлений для значка в главном меню"""
+        cursor.execute('PRAGMA table_info(users)')
+        if 'unread_count' not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute('ALTER TABLE users ADD COLUMN unread_count INTEGER DEFAULT 0')
+            cursor.execute('''
+                UPDATE users SET unread_count = (
+                    SELECT COUNT(*) FROM notifications
+                    WHERE notifications.user_id = users.user_id AND is_read = FALSE
                 )
             ''')
-            
-            # Создание таблицы предложений сделок
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS deal_offers (
-                    offer_id TEXT PRIMARY KEY,
-                    deal_id TEXT,
-                    from_user_id INTEGER,
-                    to_user_id INTEGER,
-                    status TEXT DEFAULT 'pending',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (deal_id) REFERENCES deals (deal_id),
-                    FOREIGN KEY (from_user_id) REFERENCES users (user_id),
-                    FOREIGN KEY (to_user_id) REFERENCES users (user_id)
+    
+    def _migration_deal_rollups(self, cursor):
+        """Почасовые и дневные сводки по сделкам, обновляются при записи"""
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'deal_stats_%'")
+        existing_rollups = {row[0] for row in cursor.fetchall()}
+        for table, bucket_format in self.ROLLUP_TABLES:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    bucket TEXT PRIMARY KEY,
+                    deals_created INTEGER DEFAULT 0,
+                    deals_completed INTEGER DEFAULT 0,
+                    deals_disputed INTEGER DEFAULT 0,
+                    volume REAL DEFAULT 0.0,
+                    payouts REAL DEFAULT 0.0
                 )
             ''')
-            
-            # Создание таблицы чеков
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS checks (
-                    check_id TEXT PRIMARY KEY,
-                    user_id INTEGER,
-                    amount REAL,
-                    description TEXT,
-                    pay_url TEXT,
-                    status TEXT DEFAULT 'pending',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+            if table not in existing_rollups:
+                self._backfill_rollup(cursor, table, bucket_format)
+    
+    def _migration_username_norm(self, cursor):
+        """Нормализованный username (без @, в нижнем регистре) для поиска без учета регистра"""
+        if 'username_norm' not in self._table_columns(cursor, 'users'):
+            cursor.execute('ALTER TABLE users ADD COLUMN username_norm TEXT COLLATE NOCASE')
+            # При совпадениях (username сменил владельца) имя получает последний добавленный
+            cursor.execute('''
+                UPDATE users SET username_norm = lower(ltrim(username, '@'))
+                WHERE rowid IN (
+                    SELECT MAX(rowid) FROM users
+                    WHERE username IS NOT NULL AND username != ''
+                    GROUP BY lower(ltrim(username, '@'))
                 )
             ''')
-            
-            conn.commit()
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username_norm ON users (username_norm)')
+    
+    def _rebuild_table(self, cursor, table: str, replacements, select_columns: Dict[str, str],
+                       order_by: str = 'rowid'):
+        """Пересоздание таблицы с измененным описанием колонок.
+        replacements - замены (регулярное выражение, текст) в CREATE TABLE,
+        select_columns - колонка новой таблицы -> выражение над старой"""
+        sql = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()[0]
+        # После ALTER TABLE ... RENAME имя в сохраненном SQL берется в кавычки
+        sql = re.sub(rf'^CREATE TABLE "?{table}"?', f'CREATE TABLE {table}_new', sql, count=1)
+        for pattern, replacement in replacements:
+            sql = re.sub(pattern, replacement, sql, count=1)
+        cursor.execute(sql)
+        cursor.execute(f'INSERT INTO {table}_new ({", ".join(select_columns)}) '
+                       f'SELECT {", ".join(select_columns.values())} FROM {table} ORDER BY {order_by}')
+        cursor.execute(f'DROP TABLE {table}')
+        cursor.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+    
+    def _table_columns(self, cursor, table: str) -> Dict[str, str]:
+        """Колонки таблицы и их объявленные типы"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        return {column[1]: column[2] for column in cursor.fetchall()}
+    
+    def _migrate_deal_keys(self, cursor):
+        """Перестройка deals и дочерних таблиц под целочисленные ключи.
+        Старые сделки сохраняют UUID как публичный код, чтобы кнопки в уже
+        отправленных сообщениях и ключи выплат продолжали работать"""
+        # Дочерние таблицы перестраиваются первыми: им нужно соответствие UUID -> id
+        cursor.execute('''
+            CREATE TEMP TABLE deal_keys AS
+            SELECT ROW_NUMBER() OVER (ORDER BY created_at, rowid) AS id, deal_id FROM deals
+        ''')
+        for table in self.DEAL_CHILD_TABLES:
+            columns = self._table_columns(cursor, table)
+            if 'deal_id' not in columns:
+                continue
+            replacements = [
+                (r'\bdeal_id TEXT\b', 'deal_ref INTEGER'),
+                (r'FOREIGN KEY \(deal_id\) REFERENCES deals \(deal_id\)', 'FOREIGN KEY (deal_ref) REFERENCES deals (id)'),
+            ]
+            select_columns = {column: column for column in columns if column != 'deal_id'}
+            select_columns['deal_ref'] = f'(SELECT id FROM deal_keys WHERE deal_keys.deal_id = {table}.deal_id)'
+            if table == 'transactions':
+                # Случайный текстовый ключ транзакции заменяется на rowid
+                replacements.append((r'\btransaction_id TEXT PRIMARY KEY', 'transaction_id INTEGER PRIMARY KEY'))
+                del select_columns['transaction_id']
+            self._rebuild_table(cursor, table, replacements, select_columns)
+        
+        # Сделки: целочисленный rowid-ключ в порядке создания, UUID остается кодом сделки
+        select_columns = {column: column for column in self._table_columns(cursor, 'deals')}
+        select_columns['id'] = '(SELECT id FROM deal_keys WHERE deal_keys.deal_id = deals.deal_id)'
+        self._rebuild_table(cursor, 'deals', [
+            (r'\bdeal_id TEXT PRIMARY KEY', 'id INTEGER PRIMARY KEY, deal_id TEXT NOT NULL UNIQUE'),
+        ], select_columns, order_by='created_at, rowid')
+        cursor.execute('DROP TABLE deal_keys')
+        logging.info("🔑 Сделки переведены на целочисленные ключи")
+    
+    def _migrate_deal_status(self, cursor):
+        """Перевод статусов сделок в целочисленные коды, а created_at/updated_at - в epoch-секунды"""
+        status_case = 'CASE status ' + ' '.join(
+            f"WHEN '{name}' THEN {code}" for name, code in self.DEAL_STATUS_CODES.items()
+        ) + ' END'
+        select_columns = {column: column for column in self._table_columns(cursor, 'deals')}
+        select_columns['status'] = status_case
+        select_columns['created_at'] = "CAST(strftime('%s', created_at) AS INTEGER)"
+        select_columns['updated_at'] = "CAST(strftime('%s', updated_at) AS INTEGER)"
+        self._rebuild_table(cursor, 'deals', [
+            (r'\bstatus TEXT\b', 'status INTEGER'),
+            (r'\bcreated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP', "created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))"),
+            (r'\bupdated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP', "updated_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))"),
+        ], select_columns)
+        logging.info("🔢 Статусы и время сделок переведены в целочисленный формат")
+    
+    def _connect(self):
+        """Соединение для метода. Внутри пакета DbWriter - точка сохранения
+        в общей транзакции пакета, иначе отдельное соединение"""
+        conn = getattr(self._batch, 'conn', None)
+        if conn is not None:
+            return _SavepointConnection(conn)
+        return sqlite3.connect(self.db_path)
+    
+    def run_batch(self, calls: List[Tuple[Callable, tuple, Dict]]) -> List[Tuple[bool, Any]]:
+        """Выполнение пачки вызовов методов Database одной транзакцией (один COMMIT).
+        calls - список (метод, args, kwargs); ошибка вызова откатывает только его изменения.
+        Возвращает (успех, результат или исключение) по каждому вызову"""
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            self._batch.conn = conn
+            try:
+                for method, args, kwargs in calls:
+                    try:
+                        results.append((True, method(*args, **kwargs)))
+                    except Exception as e:
+                        results.append((False, e))
+            finally:
+                self._batch.conn = None
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return results
+    
+    @staticmethod
+    def normalize_username(username: Optional[str]) -> Optional[str]:
+        """Username для поиска: без пробелов и @, в нижнем регистре"""
+        if not username:
+            return None
+        return username.strip().lstrip('@').lower() or None
+    
+    @staticmethod
+    def format_timestamp(value) -> Optional[str]:
+        """Epoch-секунды в текст 'YYYY-MM-DD HH:MM:SS' (UTC), как у CURRENT_TIMESTAMP"""
+        if value is None or isinstance(value, str):
+            return value
+        return datetime.fromtimestamp(value, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    
+    def _status_name(self, code):
+        """Код статуса сделки -> config.STATUS_*"""
+        return self.DEAL_STATUS_NAMES.get(code, code)
+    
+    def _new_deal_code(self) -> str:
+        """Короткий неугадываемый публичный код сделки"""
+        return ''.join(secrets.choice(self.DEAL_CODE_ALPHABET) for _ in range(self.DEAL_CODE_LENGTH))
+    
+    def _insert_deal(self, cursor, values: Dict) -> str:
+        """Вставка сделки с новым кодом в рамках уже открытой транзакции БД.
+        При совпадении кода (маловероятном) код генерируется заново"""
+        columns = ", ".join(['deal_id', *values])
+        placeholders = ", ".join('?' * (len(values) + 1))
+        while True:
+            deal_id = self._new_deal_code()
+            try:
+                cursor.execute(f'INSERT INTO deals ({columns}) VALUES ({placeholders})', (deal_id, *values.values()))
+                return deal_id
+            except sqlite3.IntegrityError as e:
+                if 'deals.deal_id' not in str(e):
+                    raise
+    
+    def _backfill_rollup(self, cursor, table: str, bucket_format: str):
+        """Заполнение новой таблицы сводок по уже существующим сделкам и транзакциям.
+        Завершение и спор относятся к периоду последнего изменения сделки"""
+        cursor.execute(f'''
+            INSERT INTO {table} (bucket, deals_created, deals_completed, deals_disputed, volume, payouts)
+            SELECT bucket, SUM(created), SUM(completed), SUM(disputed), SUM(volume), SUM(payouts)
+            FROM (
+                SELECT strftime(?, created_at, 'unixepoch') AS bucket, 1 AS created, 0 AS completed, 0 AS disputed,
+                       COALESCE(amount, 0) AS volume, 0 AS payouts
+                FROM deals
+                UNION ALL
+                SELECT strftime(?, updated_at, 'unixepoch'), 0, 1, 0, 0, 0 FROM deals WHERE status = ?
+                UNION ALL
+                SELECT strftime(?, updated_at, 'unixepoch'), 0, 0, 1, 0, 0 FROM deals WHERE status = ?
+                UNION ALL
+                SELECT strftime(?, created_at), 0, 0, 0, 0, COALESCE(amount, 0)
+                FROM transactions WHERE transaction_type = 'payout'
+            )
+            WHERE bucket IS NOT NULL
+            GROUP BY bucket
+        ''', (bucket_format, bucket_format, self.DEAL_STATUS_CODES[STATUS_COMPLETED],
+              bucket_format, self.DEAL_STATUS_CODES[STATUS_DISPUTED], bucket_format))
+    
+    def _bump_rollups(self, cursor, deals_created: int = 0, deals_completed: int = 0, deals_disputed: int = 0,
+                      volume: float = 0.0, payouts: float = 0.0):
+        """Прибавление к сводкам текущего часа и дня в рамках уже открытой транзакции БД"""
+        for table, bucket_format in self.ROLLUP_TABLES:
+            cursor.execute(f'''
+                INSERT INTO {table} (bucket, deals_created, deals_completed, deals_disputed, volume, payouts)
+                VALUES (strftime(?, 'now'), ?, ?, ?, ?, ?)
+                ON CONFLICT (bucket) DO UPDATE SET
+                    deals_created = deals_created + excluded.deals_created,
+                    deals_completed = deals_completed + excluded.deals_completed,
+                    deals_disputed = deals_disputed + excluded.deals_disputed,
+                    volume = volume + excluded.volume,
+                    payouts = payouts + excluded.payouts
+            ''', (bucket_format, deals_created, deals_completed, deals_disputed, volume, payouts))
+    
+    def _bump_status_rollup(self, cursor, status: str):
+        """Учет перехода сделки в статус, который считается в сводках"""
+        if status == STATUS_COMPLETED:
+            self._bump_rollups(cursor, deals_completed=1)
+        elif status == STATUS_DISPUTED:
+            self._bump_rollups(cursor, deals_disputed=1)
     
     def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
-        """Добавление нового пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        """Добавление нового пользователя или обновление изменившегося профиля"""
+        username_norm = self.normalize_username(username)
+        with self._connect() as conn:
             cursor = conn.cursor()
+            if username_norm:
+                # Username в Telegram уникален: прежний владелец его уже сменил
+                cursor.execute('''
+                    UPDATE users SET username_norm = NULL WHERE username_norm = ? AND user_id != ?
+                ''', (username_norm, user_id))
             cursor.execute('''
-                INSERT OR IGNORE INTO users (user_id, username, first_name, last_name)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, username, first_name, last_name))
+                INSERT INTO users (user_id, username, username_norm, first_name, last_name)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    username = excluded.username,
+                    username_norm = excluded.username_norm,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name
+                WHERE users.username IS NOT excluded.username
+                   OR users.username_norm IS NOT excluded.username_norm
+                   OR users.first_name IS NOT excluded.first_name
+                   OR users.last_name IS NOT excluded.last_name
+            ''', (user_id, username, username_norm, first_name, last_name))
             conn.commit()
     
-    def get_user(self, user_id: int) -> Optional[Dict]:
+    def get_user(self, user_id: int) -> Optional[User]:
         """Получение информации о пользователе"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-            row = cursor.fetchone()
-            if row:
-                columns = [description[0] for description in cursor.description]
-                return dict(zip(columns, row))
-            return None
+            return fetch_row(cursor, User)
     
     def update_balance(self, user_id: int, amount: float):
         """Обновление баланса пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE users SET balance = balance + ? WHERE user_id = ?
@@ -174,24 +603,25 @@ class Database:
     
     def get_user_balance(self, user_id: int) -> float:
         """Получение баланса пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT balance FROM users WHERE user_id = ?', (user_id,))
             row = cursor.fetchone()
             return row[0] if row else 0.0
     
     def create_deal(self, customer_id: int, amount: float, description: str) -> str:
-        """Создание новой сделки (без исполнителя)"""
-        deal_id = str(uuid.uuid4())
+        """Создание новой сделки (без исполнителя). Возвращает код сделки"""
         from config import COMMISSION_PERCENT
         commission = amount * (COMMISSION_PERCENT / 100)  # Комиссия из конфига
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO deals (deal_id, customer_id, executor_id, amount, commission, description, status)
-                VALUES (?, ?, NULL, ?, ?, ?, ?)
-            ''', (deal_id, customer_id, amount, commission, description, 'pending'))
+            deal_id = self._insert_deal(cursor, {
+                'customer_id': customer_id, 'executor_id': None, 'amount': amount,
+                'commission': commission, 'description': description,
+                'status': self.DEAL_STATUS_CODES[STATUS_PENDING],
+            })
+            self._bump_rollups(cursor, deals_created=1, volume=amount)
             conn.commit()
         
         return deal_id
@@ -200,102 +630,101 @@ class Database:
                            payment_method: str, payment_type: str, description: str,
                            customer_payment_method: str = 'crypto', customer_payment_address: str = None,
                            executor_payment_method: str = 'crypto', executor_payment_address: str = None) -> str:
-        """Создание новой сделки с расширенными параметрами оплаты"""
-        deal_id = str(uuid.uuid4())
+        """Создание новой сделки с расширенными параметрами оплаты. Возвращает код сделки"""
         from config import COMMISSION_PERCENT
         commission = amount * (COMMISSION_PERCENT / 100)  # Комиссия из конфига
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO deals (
-                    deal_id, customer_id, executor_id, amount, commission, description, status,
-                    payment_amount, payment_method, payment_type, remaining_amount,
-                    customer_payment_method, customer_payment_address,
-                    executor_payment_method, executor_payment_address
-                )
-                VALUES (?, ?, NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (deal_id, customer_id, amount, commission, description, 'pending', 
-                  payment_amount, payment_method, payment_type, amount - payment_amount,
-                  customer_payment_method, customer_payment_address,
-                  executor_payment_method, executor_payment_address))
+            deal_id = self._insert_deal(cursor, {
+                'customer_id': customer_id, 'executor_id': None, 'amount': amount,
+                'commission': commission, 'description': description,
+                'status': self.DEAL_STATUS_CODES[STATUS_PENDING],
+                'payment_amount': payment_amount, 'payment_method': payment_method,
+                'payment_type': payment_type, 'remaining_amount': amount - payment_amount,
+                'customer_payment_method': customer_payment_method,
+                'customer_payment_address': customer_payment_address,
+                'executor_payment_method': executor_payment_method,
+                'executor_payment_address': executor_payment_address,
+            })
+            self._bump_rollups(cursor, deals_created=1, volume=amount)
             conn.commit()
         
         return deal_id
     
-    def get_deal(self, deal_id: str) -> Optional[Dict]:
+    def get_deal(self, deal_id: str) -> Optional[Deal]:
         """Получение информации о сделке"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM deals WHERE deal_id = ?', (deal_id,))
-            row = cursor.fetchone()
-            if row:
-                columns = [description[0] for description in cursor.description]
-                return dict(zip(columns, row))
-            return None
+            return fetch_row(cursor, Deal, self._deal_converters)
     
     def update_deal_status(self, deal_id: str, status: str):
         """Обновление статуса сделки"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                UPDATE deals SET status = ?, updated_at = CURRENT_TIMESTAMP 
-                WHERE deal_id = ?
-            ''', (status, deal_id))
+                UPDATE deals SET status = ?, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE deal_id = ? AND status IS NOT ?
+            ''', (self.DEAL_STATUS_CODES[status], deal_id, self.DEAL_STATUS_CODES[status]))
+            # Повторная установка того же статуса в сводках не учитывается
+            if cursor.rowcount:
+                self._bump_status_rollup(cursor, status)
             conn.commit()
     
-    def get_user_deals(self, user_id: int) -> List[Dict]:
+    def get_user_deals(self, user_id: int) -> List[Deal]:
         """Получение сделок пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM deals 
                 WHERE customer_id = ? OR executor_id = ?
                 ORDER BY created_at DESC
             ''', (user_id, user_id))
-            rows = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            return [dict(zip(columns, row)) for row in rows]
+            return fetch_rows(cursor, Deal, self._deal_converters)
     
     def add_transaction(self, deal_id: str, user_id: int, amount: float, transaction_type: str, description: str):
         """Добавление транзакции"""
-        transaction_id = str(uuid.uuid4())
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO transactions (transaction_id, deal_id, user_id, amount, transaction_type, description)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (transaction_id, deal_id, user_id, amount, transaction_type, description))
+            self._insert_transaction(cursor, deal_id, user_id, amount, transaction_type, description)
             conn.commit()
     
+    def _insert_transaction(self, cursor, deal_id: str, user_id: int, amount: float, transaction_type: str, description: str):
+        """Вставка транзакции в рамках уже открытой транзакции БД"""
+        cursor.execute('''
+            INSERT INTO transactions (deal_ref, user_id, amount, transaction_type, description)
+            VALUES ((SELECT id FROM deals WHERE deal_id = ?), ?, ?, ?, ?)
+        ''', (deal_id, user_id, amount, transaction_type, description))
+        if transaction_type == 'payout':
+            self._bump_rollups(cursor, payouts=amount)
+    
     def add_deal_message(self, deal_id: str, user_id: int, message_text: str):
         """Добавление сообщения в сделку"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO deal_messages (deal_id, user_id, message_text)
-                VALUES (?, ?, ?)
+                INSERT INTO deal_messages (deal_ref, user_id, message_text)
+                VALUES ((SELECT id FROM deals WHERE deal_id = ?), ?, ?)
             ''', (deal_id, user_id, message_text))
             conn.commit()
     
-    def get_deal_messages(self, deal_id: str) -> List[Dict]:
+    def get_deal_messages(self, deal_id: str) -> List[DealMessage]:
         """Получение сообщений сделки"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT dm.*, u.username, u.first_name 
                 FROM deal_messages dm
                 JOIN users u ON dm.user_id = u.user_id
-                WHERE dm.deal_id = ?
+                WHERE dm.deal_ref = (SELECT id FROM deals WHERE deal_id = ?)
                 ORDER BY dm.created_at ASC
             ''', (deal_id,))
-            rows = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            return [dict(zip(columns, row)) for row in rows]
+            return fetch_rows(cursor, DealMessage)
     
-    def get_available_deals(self) -> List[Dict]:
+    def get_available_deals(self) -> List[Deal]:
         """Получение доступных заказов (сделки в статусе pending)"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT d.*, 
@@ -303,16 +732,14 @@ class Database:
                        c.username as customer_username
                 FROM deals d
                 JOIN users c ON d.customer_id = c.user_id
-                WHERE d.status = 'pending' AND d.executor_id IS NULL
+                WHERE d.status = ? AND d.executor_id IS NULL
                 ORDER BY d.created_at DESC
-            ''')
-            rows = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            return [dict(zip(columns, row)) for row in rows]
+            ''', (self.DEAL_STATUS_CODES[STATUS_PENDING],))
+            return fetch_rows(cursor, Deal, self._deal_converters)
     
     def accept_deal(self, deal_id: str, executor_id: int) -> bool:
         """Принятие заказа исполнителем"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Проверяем, что сделка доступна для принятия
@@ -321,7 +748,7 @@ class Database:
             ''', (deal_id,))
             result = cursor.fetchone()
             
-            if not result or result[0] != 'pending':
+            if not result or result[0] != self.DEAL_STATUS_CODES[STATUS_PENDING]:
                 return False
             
             # Если исполнитель уже назначен, нельзя принять
@@ -330,7 +757,7 @@ class Database:
             
             # Назначаем исполнителя
             cursor.execute('''
-                UPDATE deals SET executor_id = ?, updated_at = CURRENT_TIMESTAMP 
+                UPDATE deals SET executor_id = ?, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
                 WHERE deal_id = ?
             ''', (executor_id, deal_id))
             conn.commit()
@@ -338,17 +765,69 @@ class Database:
     
     def add_notification(self, user_id: int, deal_id: str, notification_type: str, message: str):
         """Добавление уведомления"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            self._insert_notification(cursor, user_id, deal_id, notification_type, message)
+            conn.commit()
+    
+    def _insert_notification(self, cursor, user_id: int, deal_id: str, notification_type: str, message: str):
+        """Вставка уведомления и счетчика непрочитанных в рамках уже открытой транзакции БД"""
+        cursor.execute('''
+            INSERT INTO notifications (user_id, deal_ref, notification_type, message)
+            VALUES (?, (SELECT id FROM deals WHERE deal_id = ?), ?, ?)
+        ''', (user_id, deal_id, notification_type, message))
+        cursor.execute('UPDATE users SET unread_count = unread_count + 1 WHERE user_id = ?', (user_id,))
+    
+    def confirm_deal_payment(self, deal_id: str, payer_id: int, amount: float, executor_id: int,
+                             notification_message: str) -> bool:
+        """Подтверждение оплаты одной транзакцией: статус 'paid', транзакция оплаты
+        и уведомление исполнителю. Возвращает False, если сделка уже не ожидает оплаты"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE deals SET status = ?, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE deal_id = ? AND status = ?
+            ''', (self.DEAL_STATUS_CODES[STATUS_PAID], deal_id, self.DEAL_STATUS_CODES[STATUS_PENDING]))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return False
+            self._bump_status_rollup(cursor, STATUS_PAID)
+            self._insert_transaction(cursor, deal_id, payer_id, amount, "payment", "Подтвержденная оплата сделки")
+            self._insert_notification(cursor, executor_id, deal_id, "deal_paid", notification_message)
+            conn.commit()
+            return True
+    
+    def get_undelivered_notifications(self, limit: int = 100, min_age: int = 0) -> List[Notification]:
+        """Уведомления, еще не отправленные в Telegram и созданные не позже min_age секунд назад"""
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO notifications (user_id, deal_id, notification_type, message)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, deal_id, notification_type, message))
+                SELECT * FROM notifications
+                WHERE delivered_at IS NULL AND created_at <= datetime('now', ?)
+                ORDER BY notification_id
+                LIMIT ?
+            ''', (f'-{int(min_age)} seconds', limit))
+            return fetch_rows(cursor, Notification)
+    
+    def mark_notifications_delivered(self, notification_ids: List[int]) -> int:
+        """Отметить уведомления доставленными (один UPDATE на каждые 500 id)"""
+        updated = 0
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(notification_ids), 500):
+                chunk = notification_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f'''
+                    UPDATE notifications SET delivered_at = CURRENT_TIMESTAMP
+                    WHERE notification_id IN ({placeholders})
+                ''', chunk)
+                updated += cursor.rowcount
             conn.commit()
+        return updated
     
-    def get_user_notifications(self, user_id: int, unread_only: bool = False) -> List[Dict]:
+    def get_user_notifications(self, user_id: int, unread_only: bool = False) -> List[Notification]:
         """Получение уведомлений пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             if unread_only:
                 cursor.execute('''
@@ -362,64 +841,65 @@ class Database:
                     WHERE user_id = ?
                     ORDER BY created_at DESC
                 ''', (user_id,))
-            rows = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            return [dict(zip(columns, row)) for row in rows]
+            return fetch_rows(cursor, Notification)
     
     def mark_notification_read(self, notification_id: int):
         """Отметить уведомление как прочитанное"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE notifications SET is_read = TRUE 
-                WHERE notification_id = ?
+                WHERE notification_id = ? AND is_read = FALSE
             ''', (notification_id,))
+            if cursor.rowcount:
+                cursor.execute('''
+                    UPDATE users SET unread_count = MAX(unread_count - 1, 0)
+                    WHERE user_id = (SELECT user_id FROM notifications WHERE notification_id = ?)
+                ''', (notification_id,))
             conn.commit()
     
     def mark_all_notifications_read(self, user_id: int):
         """Отметить все уведомления пользователя как прочитанные"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE notifications SET is_read = TRUE 
-                WHERE user_id = ?
+                WHERE user_id = ? AND is_read = FALSE
             ''', (user_id,))
+            cursor.execute('UPDATE users SET unread_count = 0 WHERE user_id = ?', (user_id,))
             conn.commit()
     
     def get_unread_notifications_count(self, user_id: int) -> int:
-        """Получить количество непрочитанных уведомлений"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT COUNT(*) FROM notifications 
-                WHERE user_id = ? AND is_read = FALSE
-            ''', (user_id,))
-            return cursor.fetchone()[0] 
-    
-    def get_user_by_username(self, username: str) -> Optional[Dict]:
-        """Получение пользователя по username"""
-        with sqlite3.connect(self.db_path) as conn:
+        """Получить количество непрочитанных уведомлений (счетчик в users)"""
+        with self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
+            cursor.execute('SELECT unread_count FROM users WHERE user_id = ?', (user_id,))
             row = cursor.fetchone()
-            if row:
-                columns = [description[0] for description in cursor.description]
-                return dict(zip(columns, row))
+            return row[0] if row else 0
+    
+    def get_user_by_username(self, username: str) -> Optional[User]:
+        """Получение пользователя по username (без учета регистра, @ необязателен)"""
+        username_norm = self.normalize_username(username)
+        if not username_norm:
             return None
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM users WHERE username_norm = ?', (username_norm,))
+            return fetch_row(cursor, User)
     
     def transfer_deal(self, deal_id: str, new_customer_id: int) -> bool:
         """Передача сделки другому пользователю как заказчику"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             # Проверяем, что сделка существует и в статусе pending
             cursor.execute('SELECT status FROM deals WHERE deal_id = ?', (deal_id,))
             row = cursor.fetchone()
-            if not row or row[0] != 'pending':
+            if not row or row[0] != self.DEAL_STATUS_CODES[STATUS_PENDING]:
                 return False
             
             # Обновляем заказчика сделки
             cursor.execute('''
-                UPDATE deals SET customer_id = ?, updated_at = CURRENT_TIMESTAMP 
+                UPDATE deals SET customer_id = ?, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
                 WHERE deal_id = ?
             ''', (new_customer_id, deal_id))
             conn.commit()
@@ -427,12 +907,12 @@ class Database:
     
     def assign_executor(self, deal_id: str, executor_id: int) -> bool:
         """Назначение исполнителя для сделки"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             # Проверяем, что сделка существует и в статусе pending
             cursor.execute('SELECT status, executor_id FROM deals WHERE deal_id = ?', (deal_id,))
             row = cursor.fetchone()
-            if not row or row[0] != 'pending':
+            if not row or row[0] != self.DEAL_STATUS_CODES[STATUS_PENDING]:
                 return False
             
             # Проверяем, что исполнитель еще не назначен
@@ -441,7 +921,7 @@ class Database:
             
             # Назначаем исполнителя
             cursor.execute('''
-                UPDATE deals SET executor_id = ?, updated_at = CURRENT_TIMESTAMP 
+                UPDATE deals SET executor_id = ?, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
                 WHERE deal_id = ?
             ''', (executor_id, deal_id))
             conn.commit()
@@ -449,17 +929,17 @@ class Database:
     
     def remove_executor(self, deal_id: str) -> bool:
         """Удаление назначения исполнителя для сделки"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             # Проверяем, что сделка существует и в статусе pending
             cursor.execute('SELECT status FROM deals WHERE deal_id = ?', (deal_id,))
             row = cursor.fetchone()
-            if not row or row[0] != 'pending':
+            if not row or row[0] != self.DEAL_STATUS_CODES[STATUS_PENDING]:
                 return False
             
             # Удаляем назначение исполнителя
             cursor.execute('''
-                UPDATE deals SET executor_id = NULL, updated_at = CURRENT_TIMESTAMP 
+                UPDATE deals SET executor_id = NULL, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
                 WHERE deal_id = ?
             ''', (deal_id,))
             conn.commit()
@@ -468,29 +948,29 @@ class Database:
     def create_deal_offer(self, deal_id: str, from_user_id: int, to_user_id: int) -> str:
         """Создание предложения сделки"""
         offer_id = str(uuid.uuid4())
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO deal_offers (offer_id, deal_id, from_user_id, to_user_id, status, created_at)
-                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                INSERT INTO deal_offers (offer_id, deal_ref, from_user_id, to_user_id, status, created_at)
+                VALUES (?, (SELECT id FROM deals WHERE deal_id = ?), ?, ?, ?, CURRENT_TIMESTAMP)
             ''', (offer_id, deal_id, from_user_id, to_user_id, 'pending'))
             conn.commit()
         return offer_id
     
-    def get_deal_offer(self, offer_id: str) -> Optional[Dict]:
+    def get_deal_offer(self, offer_id: str) -> Optional[DealOffer]:
         """Получение предложения сделки"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM deal_offers WHERE offer_id = ?', (offer_id,))
-            row = cursor.fetchone()
-            if row:
-                columns = [description[0] for description in cursor.description]
-                return dict(zip(columns, row))
-            return None
+            cursor.execute('''
+                SELECT do.*, d.deal_id FROM deal_offers do
+                LEFT JOIN deals d ON do.deal_ref = d.id
+                WHERE do.offer_id = ?
+            ''', (offer_id,))
+            return fetch_row(cursor, DealOffer, self._offer_converters)
     
     def update_deal_offer_status(self, offer_id: str, status: str) -> bool:
         """Обновление статуса предложения сделки"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE deal_offers SET status = ?, updated_at = CURRENT_TIMESTAMP 
@@ -499,29 +979,29 @@ class Database:
             conn.commit()
             return cursor.rowcount > 0
     
-    def get_user_deal_offers(self, user_id: int, status: str = None) -> List[Dict]:
+    def get_user_deal_offers(self, user_id: int, status: str = None) -> List[DealOffer]:
         """Получение предложений сделок пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             if status:
                 cursor.execute('''
-                    SELECT * FROM deal_offers 
-                    WHERE to_user_id = ? AND status = ?
-                    ORDER BY created_at DESC
+                    SELECT do.*, d.deal_id FROM deal_offers do
+                    LEFT JOIN deals d ON do.deal_ref = d.id
+                    WHERE do.to_user_id = ? AND do.status = ?
+                    ORDER BY do.created_at DESC
                 ''', (user_id, status))
             else:
                 cursor.execute('''
-                    SELECT * FROM deal_offers 
-                    WHERE to_user_id = ?
-                    ORDER BY created_at DESC
+                    SELECT do.*, d.deal_id FROM deal_offers do
+                    LEFT JOIN deals d ON do.deal_ref = d.id
+                    WHERE do.to_user_id = ?
+                    ORDER BY do.created_at DESC
                 ''', (user_id,))
-            rows = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            return [dict(zip(columns, row)) for row in rows] 
+            return fetch_rows(cursor, DealOffer, self._offer_converters)
     
     def delete_deal(self, deal_id: str):
         """Удаление сделки"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM deals WHERE deal_id = ?', (deal_id,))
             conn.commit()
@@ -529,48 +1009,110 @@ class Database:
     def clear_completed_deals(self) -> int:
         """Очистка только выполненных сделок (статус 'completed')
         Возвращает количество удаленных сделок"""
-        with sqlite3.connect(self.db_path) as conn:
+        completed = self.DEAL_STATUS_CODES[STATUS_COMPLETED]
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Сначала получаем количество сделок для удаления
-            cursor.execute('SELECT COUNT(*) FROM deals WHERE status = ?', ('completed',))
+            cursor.execute('SELECT COUNT(*) FROM deals WHERE status = ?', (completed,))
             count = cursor.fetchone()[0]
             
             # Удаляем выполненные сделки и связанные данные
-            cursor.execute('DELETE FROM deal_messages WHERE deal_id IN (SELECT deal_id FROM deals WHERE status = ?)', ('completed',))
-            cursor.execute('DELETE FROM transactions WHERE deal_id IN (SELECT deal_id FROM deals WHERE status = ?)', ('completed',))
-            cursor.execute('DELETE FROM notifications WHERE deal_id IN (SELECT deal_id FROM deals WHERE status = ?)', ('completed',))
-            cursor.execute('DELETE FROM invoices WHERE deal_id IN (SELECT deal_id FROM deals WHERE status = ?)', ('completed',))
-            cursor.execute('DELETE FROM deal_offers WHERE deal_id IN (SELECT deal_id FROM deals WHERE status = ?)', ('completed',))
-            cursor.execute('DELETE FROM deals WHERE status = ?', ('completed',))
+            cursor.execute('DELETE FROM deal_messages WHERE deal_ref IN (SELECT id FROM deals WHERE status = ?)', (completed,))
+            cursor.execute('DELETE FROM transactions WHERE deal_ref IN (SELECT id FROM deals WHERE status = ?)', (completed,))
+            # Счетчики непрочитанных уменьшаем до удаления уведомлений, в той же транзакции
+            cursor.execute('''
+                UPDATE users SET unread_count = MAX(unread_count - (
+                    SELECT COUNT(*) FROM notifications
+                    WHERE notifications.user_id = users.user_id AND is_read = FALSE
+                      AND deal_ref IN (SELECT id FROM deals WHERE status = ?)
+                ), 0)
+                WHERE user_id IN (
+                    SELECT user_id FROM notifications
+                    WHERE is_read = FALSE AND deal_ref IN (SELECT id FROM deals WHERE status = ?)
+                )
+            ''', (completed, completed))
+            cursor.execute('DELETE FROM notifications WHERE deal_ref IN (SELECT id FROM deals WHERE status = ?)', (completed,))
+            cursor.execute('DELETE FROM invoices WHERE deal_ref IN (SELECT id FROM deals WHERE status = ?)', (completed,))
+            cursor.execute('DELETE FROM deal_offers WHERE deal_ref IN (SELECT id FROM deals WHERE status = ?)', (completed,))
+            cursor.execute('DELETE FROM deals WHERE status = ?', (completed,))
             
             conn.commit()
             return count
     
     def get_completed_deals_count(self) -> int:
         """Получение количества выполненных сделок"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM deals WHERE status = ?', ('completed',))
+            cursor.execute('SELECT COUNT(*) FROM deals WHERE status = ?', (self.DEAL_STATUS_CODES[STATUS_COMPLETED],))
             return cursor.fetchone()[0]
     
+    def get_freelist_bytes(self) -> int:
+        """Объем свободных страниц в файле базы, байт"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            freelist_count = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+            page_size = cursor.execute('PRAGMA page_size').fetchone()[0]
+            return freelist_count * page_size
+    
+    def purge_rows(self, table: str, condition: str, params: tuple, limit: int) -> int:
+        """Удаление не более limit строк таблицы по условию одной короткой транзакцией.
+        table и condition задаются политиками хранения в коде, не пользователем"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            if table != 'notifications':
+                cursor.execute(f'''
+                    DELETE FROM {table} WHERE rowid IN (
+                        SELECT rowid FROM {table} WHERE {condition} ORDER BY rowid LIMIT ?
+                    )
+                ''', (*params, limit))
+                deleted = cursor.rowcount
+                conn.commit()
+                return deleted
+            
+            # Пачка выбирается один раз: счетчик непрочитанных уменьшается
+            # ровно по тем уведомлениям, которые удаляются
+            cursor.execute(f'''
+                SELECT notification_id, user_id, is_read FROM notifications
+                WHERE {condition} ORDER BY notification_id LIMIT ?
+            ''', (*params, limit))
+            rows = cursor.fetchall()
+            unread: Dict[int, int] = {}
+            for _, user_id, is_read in rows:
+                if not is_read:
+                    unread[user_id] = unread.get(user_id, 0) + 1
+            cursor.executemany(
+                'UPDATE users SET unread_count = MAX(unread_count - ?, 0) WHERE user_id = ?',
+                [(count, user_id) for user_id, count in unread.items()]
+            )
+            cursor.executemany('DELETE FROM notifications WHERE notification_id = ?',
+                               [(row[0],) for row in rows])
+            conn.commit()
+            return len(rows)
+    
     def get_active_deals_count(self) -> int:
         """Получение количества активных (не выполненных) сделок"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM deals WHERE status != ?', ('completed',))
+            cursor.execute('SELECT COUNT(*) FROM deals WHERE status != ?', (self.DEAL_STATUS_CODES[STATUS_COMPLETED],))
             return cursor.fetchone()[0]
     
     def delete_notification(self, notification_id: int):
         """Удаление уведомления"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE users SET unread_count = MAX(unread_count - 1, 0)
+                WHERE user_id = (
+                    SELECT user_id FROM notifications WHERE notification_id = ? AND is_read = FALSE
+                )
+            ''', (notification_id,))
             cursor.execute('DELETE FROM notifications WHERE notification_id = ?', (notification_id,))
             conn.commit()
     
     def delete_user(self, user_id: int):
         """Удаление пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
             conn.commit()
@@ -578,40 +1120,35 @@ class Database:
     def create_invoice(self, deal_id: str, amount: float, currency: str, description: str, pay_url: str) -> str:
         """Создание инвойса для сделки"""
         invoice_id = f"inv_{deal_id}_{int(amount)}_{currency}"
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO invoices (invoice_id, deal_id, amount, currency, description, pay_url)
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT INTO invoices (invoice_id, deal_ref, amount, currency, description, pay_url)
+                VALUES (?, (SELECT id FROM deals WHERE deal_id = ?), ?, ?, ?, ?)
             ''', (invoice_id, deal_id, amount, currency, description, pay_url))
             conn.commit()
         return invoice_id
     
-    def get_invoice(self, invoice_id: str) -> Optional[Dict]:
+    def get_invoice(self, invoice_id: str) -> Optional[Invoice]:
         """Получение информации об инвойсе"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM invoices WHERE invoice_id = ?', (invoice_id,))
-            row = cursor.fetchone()
-            if row:
-                columns = [description[0] for description in cursor.description]
-                return dict(zip(columns, row))
-            return None
+            return fetch_row(cursor, Invoice)
     
-    def get_deal_invoice(self, deal_id: str) -> Optional[Dict]:
+    def get_deal_invoice(self, deal_id: str) -> Optional[Invoice]:
         """Получение инвойса для сделки"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM invoices WHERE deal_id = ? ORDER BY created_at DESC LIMIT 1', (deal_id,))
-            row = cursor.fetchone()
-            if row:
-                columns = [description[0] for description in cursor.description]
-                return dict(zip(columns, row))
-            return None
+            cursor.execute('''
+                SELECT * FROM invoices WHERE deal_ref = (SELECT id FROM deals WHERE deal_id = ?)
+                ORDER BY created_at DESC LIMIT 1
+            ''', (deal_id,))
+            return fetch_row(cursor, Invoice)
     
     def update_invoice_status(self, invoice_id: str, status: str, paid_at: str = None):
         """Обновление статуса инвойса"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             if paid_at:
                 cursor.execute('''
@@ -625,27 +1162,27 @@ class Database:
     
     def update_customer_payment_info(self, deal_id: str, payment_method: str, payment_address: str):
         """Обновление информации о способе оплаты заказчика"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE deals SET customer_payment_method = ?, customer_payment_address = ?, 
-                updated_at = CURRENT_TIMESTAMP WHERE deal_id = ?
+                updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE deal_id = ?
             ''', (payment_method, payment_address, deal_id))
             conn.commit()
     
     def update_executor_payment_info(self, deal_id: str, payment_method: str, payment_address: str):
         """Обновление информации о способе получения исполнителя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE deals SET executor_payment_method = ?, executor_payment_address = ?, 
-                updated_at = CURRENT_TIMESTAMP WHERE deal_id = ?
+                updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE deal_id = ?
             ''', (payment_method, payment_address, deal_id))
             conn.commit()
     
     def create_check(self, check_id: str, user_id: int, amount: float, description: str, pay_url: str):
         """Создание чека"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO checks (check_id, user_id, amount, description, pay_url, status, created_at)
@@ -653,18 +1190,16 @@ class Database:
             ''', (check_id, user_id, amount, description, pay_url, 'pending'))
             conn.commit()
     
-    def get_user_checks(self, user_id: int) -> List[Dict]:
+    def get_user_checks(self, user_id: int) -> List[Check]:
         """Получение чеков пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM checks 
                 WHERE user_id = ?
                 ORDER BY created_at DESC
             ''', (user_id,))
-            rows = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            return [dict(zip(columns, row)) for row in rows]
+            return fetch_rows(cursor, Check)
     
     def offer_deal(self, deal_id: str, from_user_id: int, to_user_id: int) -> bool:
         """Предложение сделки другому пользователю"""
@@ -675,58 +1210,253 @@ class Database:
             logging.error(f"Ошибка при создании предложения сделки: {e}")
             return False
     
-    def get_deal_offers_for_user(self, user_id: int, status: str = None) -> List[Dict]:
+    def get_deal_offers_for_user(self, user_id: int, status: str = None) -> List[DealOffer]:
         """Получение предложений сделок для пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             if status:
                 cursor.execute('''
-                    SELECT do.*, d.amount, d.description, d.status as deal_status,
+                    SELECT do.*, d.deal_id, d.amount, d.description, d.status as deal_status,
                            u.first_name as from_user_name, u.username as from_user_username
                     FROM deal_offers do
-                    JOIN deals d ON do.deal_id = d.deal_id
+                    JOIN deals d ON do.deal_ref = d.id
                     JOIN users u ON do.from_user_id = u.user_id
                     WHERE do.to_user_id = ? AND do.status = ?
                     ORDER BY do.created_at DESC
                 ''', (user_id, status))
             else:
                 cursor.execute('''
-                    SELECT do.*, d.amount, d.description, d.status as deal_status,
+                    SELECT do.*, d.deal_id, d.amount, d.description, d.status as deal_status,
                            u.first_name as from_user_name, u.username as from_user_username
                     FROM deal_offers do
-                    JOIN deals d ON do.deal_id = d.deal_id
+                    JOIN deals d ON do.deal_ref = d.id
                     JOIN users u ON do.from_user_id = u.user_id
                     WHERE do.to_user_id = ?
                     ORDER BY do.created_at DESC
                 ''', (user_id,))
-            rows = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            return [dict(zip(columns, row)) for row in rows]
+            return fetch_rows(cursor, DealOffer, self._offer_converters)
     
-    def get_sent_deal_offers(self, user_id: int, status: str = None) -> List[Dict]:
+    def get_sent_deal_offers(self, user_id: int, status: str = None) -> List[DealOffer]:
         """Получение предложений сделок, отправленных пользователем"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             if status:
                 cursor.execute('''
-                    SELECT do.*, d.amount, d.description, d.status as deal_status,
+                    SELECT do.*, d.deal_id, d.amount, d.description, d.status as deal_status,
                            u.first_name as to_user_name, u.username as to_user_username
                     FROM deal_offers do
-                    JOIN deals d ON do.deal_id = d.deal_id
+                    JOIN deals d ON do.deal_ref = d.id
                     JOIN users u ON do.to_user_id = u.user_id
                     WHERE do.from_user_id = ? AND do.status = ?
                     ORDER BY do.created_at DESC
                 ''', (user_id, status))
             else:
                 cursor.execute('''
-                    SELECT do.*, d.amount, d.description, d.status as deal_status,
+                    SELECT do.*, d.deal_id, d.amount, d.description, d.status as deal_status,
                            u.first_name as to_user_name, u.username as to_user_username
                     FROM deal_offers do
-                    JOIN deals d ON do.deal_id = d.deal_id
+                    JOIN deals d ON do.deal_ref = d.id
                     JOIN users u ON do.to_user_id = u.user_id
                     WHERE do.from_user_id = ?
                     ORDER BY do.created_at DESC
                 ''', (user_id,))
-            rows = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            return [dict(zip(columns, row)) for row in rows] 
\ No newline at end of file
+            return fetch_rows(cursor, DealOffer, self._offer_converters)
+    
+    def claim_payout(self, spend_id: str, crypto_user_id: str, asset: str, amount: float) -> bool:
+        """Зарегистрировать выплату в журнале и захватить её для отправки.
+        Возвращает False, если выплата с таким spend_id уже отправляется или завершена"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR IGNORE INTO payouts (spend_id, crypto_user_id, asset, amount, state)
+                VALUES (?, ?, ?, ?, 'pending')
+            ''', (spend_id, crypto_user_id, asset, amount))
+            cursor.execute('''
+                UPDATE payouts SET state = 'sending', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE spend_id = ? AND state = 'pending'
+            ''', (spend_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+    
+    def finish_payout(self, spend_id: str, state: str, response: str = None):
+        """Записать итог выплаты ('completed' или 'failed') и ответ CryptoPay.
+        'pending' возвращает выплату с неизвестным итогом в очередь на повтор"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE payouts SET state = ?, response = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE spend_id = ?
+            ''', (state, response, spend_id))
+            conn.commit()
+    
+    def get_payout(self, spend_id: str) -> Optional[Payout]:
+        """Получение записи журнала выплат"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM payouts WHERE spend_id = ?', (spend_id,))
+            return fetch_row(cursor, Payout)
+    
+    def release_unfinished_payouts(self) -> List[Payout]:
+        """Вернуть прерванные выплаты (оставшиеся в 'sending' после падения) в очередь.
+        Возвращает все незавершенные выплаты"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE payouts SET state = 'pending', updated_at = CURRENT_TIMESTAMP
+                WHERE state = 'sending'
+            ''')
+            cursor.execute("SELECT * FROM payouts WHERE state = 'pending' ORDER BY created_at")
+            payouts = fetch_rows(cursor, Payout)
+            conn.commit()
+            return payouts
+    
+    def _enqueue_outbox(self, cursor, operation: str, idempotency_key: str, payload: Dict) -> bool:
+        """Постановка операции в outbox в рамках уже открытой транзакции БД.
+        Возвращает False, если операция с таким ключом уже была поставлена"""
+        cursor.execute('''
+            INSERT OR IGNORE INTO outbox (operation, idempotency_key, payload)
+            VALUES (?, ?, ?)
+        ''', (operation, idempotency_key, json.dumps(payload)))
+        return cursor.rowcount > 0
+    
+    def settle_completed_deal(self, deal_id: str, executor_id: int, executor_amount: float, commission: float) -> bool:
+        """Расчет по завершенной сделке одной транзакцией: выплата на баланс исполнителя,
+        записи транзакций и отправка комиссии через outbox.
+        Возвращает False, если расчет по сделке уже был произведен"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            if not self._enqueue_outbox(cursor, 'commission', f"commission_{deal_id}",
+                                        {'deal_id': deal_id, 'amount': commission}):
+                conn.rollback()
+                return False
+            cursor.execute('''
+                UPDATE users SET balance = balance + ? WHERE user_id = ?
+            ''', (executor_amount, executor_id))
+            self._insert_transaction(cursor, deal_id, executor_id, executor_amount, "payout", "Выплата исполнителю")
+            self._insert_transaction(cursor, deal_id, 0, commission, "commission", "Комиссия бота")
+            conn.commit()
+            return True
+    
+    def resolve_disputed_deal(self, deal_id: str, status: str, user_id: int, amount: float,
+                              transaction_type: str, description: str, transfer: Optional[Dict] = None) -> bool:
+        """Закрытие спора одной транзакцией: смена статуса сделки и выплата.
+        Если передан transfer (crypto_user_id, spend_id, description, fallback_description),
+        перевод ставится в outbox, иначе сумма сразу зачисляется на внутренний баланс.
+        Возвращает False, если сделка не в статусе спора"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE deals SET status = ?, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE deal_id = ? AND status = ?
+            ''', (self.DEAL_STATUS_CODES[status], deal_id, self.DEAL_STATUS_CODES[STATUS_DISPUTED]))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return False
+            self._bump_status_rollup(cursor, status)
+            
+            if transfer:
+                payload = dict(transfer, deal_id=deal_id, user_id=user_id, amount=amount,
+                               transaction_type=transaction_type)
+                self._enqueue_outbox(cursor, 'transfer', transfer['spend_id'], payload)
+            else:
+                cursor.execute('''
+                    UPDATE users SET balance = balance + ? WHERE user_id = ?
+                ''', (amount, user_id))
+                self._insert_transaction(cursor, deal_id, user_id, amount, transaction_type, description)
+            conn.commit()
+            return True
+    
+    def claim_outbox_batch(self, limit: int) -> List[OutboxOperation]:
+        """Захват пачки готовых к обработке операций outbox"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM outbox
+                WHERE state = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY outbox_id
+                LIMIT ?
+            ''', (limit,))
+            operations = fetch_rows(cursor, OutboxOperation, {'payload': json.loads})
+            if operations:
+                cursor.executemany('''
+                    UPDATE outbox SET state = 'processing', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE outbox_id = ?
+                ''', [(operation['outbox_id'],) for operation in operations])
+            conn.commit()
+            return operations
+    
+    def release_processing_outbox(self) -> int:
+        """Вернуть в очередь операции, прерванные падением процесса"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE outbox SET state = 'pending', updated_at = CURRENT_TIMESTAMP
+                WHERE state = 'processing'
+            ''')
+            conn.commit()
+            return cursor.rowcount
+    
+    def complete_outbox(self, outbox_id: int, state: str = 'done', error: str = None):
+        """Завершение операции outbox"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE outbox SET state = ?, last_error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE outbox_id = ?
+            ''', (state, error, outbox_id))
+            conn.commit()
+    
+    def complete_outbox_transfer(self, outbox_id: int, payload: Dict, success: bool):
+        """Завершение перевода из outbox вместе с записью транзакции.
+        При ошибке CryptoPay сумма зачисляется на внутренний баланс"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            if success:
+                description = payload['description']
+            else:
+                description = payload['fallback_description']
+                cursor.execute('''
+                    UPDATE users SET balance = balance + ? WHERE user_id = ?
+                ''', (payload['amount'], payload['user_id']))
+            self._insert_transaction(cursor, payload['deal_id'], payload['user_id'], payload['amount'],
+                                     payload['transaction_type'], description)
+            cursor.execute('''
+                UPDATE outbox SET state = 'done', last_error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE outbox_id = ?
+            ''', (None if success else 'CryptoPay transfer failed', outbox_id))
+            conn.commit()
+    
+    def retry_outbox(self, outbox_id: int, error: str, delay: float, max_attempts: int):
+        """Отложить операцию outbox для повторной попытки или пометить её как failed.
+        Операция не становится failed, пока выплата с её spend_id не завершена в журнале"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE outbox
+                SET state = CASE WHEN attempts >= ? AND NOT EXISTS (
+                        SELECT 1 FROM payouts
+                        WHERE payouts.spend_id = json_extract(outbox.payload, '$.spend_id')
+                          AND payouts.state IN ('pending', 'sending')
+                    ) THEN 'failed' ELSE 'pending' END,
+                    last_error = ?,
+                    next_attempt_at = datetime('now', ?),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE outbox_id = ?
+            ''', (max_attempts, error, f"+{int(delay)} seconds", outbox_id))
+            conn.commit()
+    
+    def defer_outbox(self, outbox_id: int, error: str, delay: float):
+        """Отложить операцию, итог перевода которой неизвестен (PayoutPending).
+        Попытка не расходуется: операция остается в очереди, пока CryptoPay не ответит"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE outbox
+                SET state = 'pending',
+                    attempts = MAX(attempts - 1, 0),
+                    last_error = ?,
+                    next_attempt_at = datetime('now', ?),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE outbox_id = ?
+            ''', (error, f"+{int(delay)} seconds", outbox_id))
+            conn.commit()
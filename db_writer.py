@@ -0,0 +1,118 @@
+import asyncio
+import collections
+import logging
+from typing import Any, Callable, Dict, Optional
+from database import Database
+from config import DB_WRITER_TICK, DB_WRITER_MAX_BATCH
+
+logger = logging.getLogger(__name__)
+
+
+class _Intent:
+    __slots__ = ("method", "args", "kwargs", "future")
+
+    def __init__(self, method: Callable, args: tuple, kwargs: Dict[str, Any], future: asyncio.Future):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+
+
+class DbWriter:
+    """Единственный писатель в базу для обработчиков Telegram и фоновых воркеров.
+
+    Обработчик ставит вызов метода Database в очередь и ждет его future.
+    Писатель собирает вызовы, накопившиеся за tick секунд (не более
+    max_batch), выполняет их в отдельном потоке одной транзакцией, каждый
+    в своей точке сохранения, и после COMMIT разрешает future результатами.
+    Записи одного шага сделки и записи параллельных обработчиков платят за
+    один fsync и не конкурируют за блокировку записи SQLite.
+    """
+
+    def __init__(self, db: Database, tick: float = DB_WRITER_TICK, max_batch: int = DB_WRITER_MAX_BATCH):
+        self.db = db
+        self.tick = tick
+        self.max_batch = max(1, max_batch)
+        self._pending = collections.deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.stats = {"batches": 0, "writes": 0, "failed": 0, "max_batch": 0}
+
+    async def start(self):
+        """Запуск писателя"""
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="db-writer")
+        logger.info("✅ Писатель базы запущен: окно %.0f мс, до %d записей в транзакции",
+                    self.tick * 1000, self.max_batch)
+
+    async def stop(self):
+        """Остановка писателя после записи уже поставленных вызовов"""
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def submit(self, method: Callable, *args, **kwargs) -> asyncio.Future:
+        """Поставить вызов метода Database в очередь записи.
+
+        Возвращает future с результатом метода после COMMIT. Вызовы,
+        поставленные подряд без ожидания, попадают в одну транзакцию
+        и выполняются в порядке постановки.
+        """
+        if self._wakeup is None or self._closing:
+            raise RuntimeError("Писатель базы не запущен")
+        future = asyncio.get_running_loop().create_future()
+        # Помечаем исключение как полученное, если future никто не ждет
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending.append(_Intent(method, args, kwargs, future))
+        self._wakeup.set()
+        return future
+
+    async def call(self, method: Callable, *args, **kwargs) -> Any:
+        """Записать через писателя и дождаться результата"""
+        return await self.submit(method, *args, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики писателя"""
+        return dict(self.stats, queued=len(self._pending))
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self.tick and not self._closing:
+                # Ждем попутные записи, чтобы закоммитить их вместе
+                await asyncio.sleep(self.tick)
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+                await self._commit(batch)
+            if self._closing:
+                return
+
+    async def _commit(self, batch):
+        calls = [(intent.method, intent.args, intent.kwargs) for intent in batch]
+        try:
+            results = await asyncio.to_thread(self.db.run_batch, calls)
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            logger.error("❌ Ошибка транзакции писателя базы (%d вызовов): %s", len(batch), e)
+            for intent in batch:
+                if not intent.future.done():
+                    intent.future.set_exception(e)
+            return
+
+        self.stats["batches"] += 1
+        self.stats["writes"] += len(batch)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+        for intent, (ok, value) in zip(batch, results):
+            if not ok:
+                self.stats["failed"] += 1
+            if intent.future.done():
+                continue
+            if ok:
+                intent.future.set_result(value)
+            else:
+                intent.future.set_exception(value)
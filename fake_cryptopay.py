@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка CryptoPay API для офлайн-тестов и бенчмарков.
+
+Реализует createInvoice, getInvoices, transfer, getBalance и getExchangeRates
+с настраиваемой задержкой, долей ошибок и автоматической оплатой инвойсов.
+
+Запуск:
+    python fake_cryptopay.py --port 8081 --latency 0.05 --error-rate 0.01 --paid-after 10
+    CRYPTOPAY_API_URL=http://127.0.0.1:8081/api python start_bot.py
+"""
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional
+from urllib.parse import urlparse, parse_qsl
+
+DEFAULT_RATES = {
+    ("USDT", "USD"): 1.0,
+    ("USDT", "RUB"): 95.0,
+    ("USDT", "EUR"): 0.92,
+    ("TON", "USD"): 5.2,
+    ("BTC", "USD"): 65000.0,
+}
+
+
+class FakeCryptoPay:
+    """Состояние заглушки: инвойсы, переводы по spend_id и баланс"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 paid_after: Optional[float] = None, balance: float = 10000.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.paid_after = paid_after
+        self.lock = threading.Lock()
+        self.invoices: Dict[int, Dict[str, Any]] = {}
+        self.transfers: Dict[str, Dict[str, Any]] = {}
+        self.balance = {"USDT": balance}
+        self.requests = 0
+        self._ids = itertools.count(1)
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    def _refresh_invoice(self, invoice: Dict[str, Any]):
+        """Переход инвойса в paid через paid_after секунд после создания"""
+        if (invoice["status"] == "active" and self.paid_after is not None
+                and time.time() - invoice["_created"] >= self.paid_after):
+            invoice["status"] = "paid"
+            invoice["paid_at"] = self._now()
+            self.balance[invoice["asset"]] = self.balance.get(invoice["asset"], 0.0) + float(invoice["amount"])
+
+    @staticmethod
+    def _public(invoice: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in invoice.items() if not k.startswith("_")}
+
+    def create_invoice(self, params: Dict[str, str]) -> Dict[str, Any]:
+        invoice_id = next(self._ids)
+        invoice = {
+            "invoice_id": invoice_id,
+            "hash": f"IV{invoice_id:08d}",
+            "status": "active",
+            "asset": params.get("asset", "USDT"),
+            "amount": params.get("amount", "0"),
+            "description": params.get("description", ""),
+            "pay_url": f"https://t.me/CryptoBot?start=IV{invoice_id:08d}",
+            "created_at": self._now(),
+            "_created": time.time(),
+        }
+        with self.lock:
+            self.invoices[invoice_id] = invoice
+        return {"ok": True, "result": self._public(invoice)}
+
+    def get_invoices(self, params: Dict[str, str]) -> Dict[str, Any]:
+        ids = [int(i) for i in params.get("invoice_ids", "").split(",") if i.strip().isdigit()]
+        with self.lock:
+            items = []
+            for invoice_id in ids or list(self.invoices):
+                invoice = self.invoices.get(invoice_id)
+                if invoice:
+                    self._refresh_invoice(invoice)
+                    items.append(self._public(invoice))
+        return {"ok": True, "result": {"items": items}}
+
+    def transfer(self, params: Dict[str, str]) -> Dict[str, Any]:
+        spend_id = params.get("spend_id", "")
+        asset = params.get("asset", "USDT")
+        try:
+            amount = float(params.get("amount", "0"))
+        except ValueError:
+            return {"ok": False, "error": {"code": 400, "name": "AMOUNT_INVALID"}}
+        if not spend_id or not params.get("user_id"):
+            return {"ok": False, "error": {"code": 400, "name": "PARAMS_MISSING"}}
+
+        with self.lock:
+            # Повтор с тем же spend_id возвращает тот же перевод
+            if spend_id in self.transfers:
+                return {"ok": True, "result": self.transfers[spend_id]}
+            if self.balance.get(asset, 0.0) < amount:
+                return {"ok": False, "error": {"code": 400, "name": "NOT_ENOUGH_COINS"}}
+            self.balance[asset] -= amount
+            transfer = {
+                "transfer_id": next(self._ids),
+                "spend_id": spend_id,
+                "user_id": params["user_id"],
+                "asset": asset,
+                "amount": params["amount"],
+                "status": "completed",
+                "completed_at": self._now(),
+            }
+            self.transfers[spend_id] = transfer
+        return {"ok": True, "result": transfer}
+
+    def get_balance(self, params: Dict[str, str]) -> Dict[str, Any]:
+        with self.lock:
+            result = [
+                {"currency_code": asset, "available": f"{amount:.8f}", "onhold": "0"}
+                for asset, amount in self.balance.items()
+            ]
+        return {"ok": True, "result": result}
+
+    def get_exchange_rates(self, params: Dict[str, str]) -> Dict[str, Any]:
+        result = []
+        for (source, target), rate in DEFAULT_RATES.items():
+            # Небольшое колебание курса, чтобы было видно обновление снимка
+            rate *= 1 + random.uniform(-0.002, 0.002)
+            result.append({"is_valid": True, "is_crypto": True, "is_fiat": False,
+                           "source": source, "target": target, "rate": f"{rate:.8f}"})
+        return {"ok": True, "result": result}
+
+    def handle(self, method: str, params: Dict[str, str]):
+        """Обработка вызова метода API. Возвращает (HTTP-статус, тело ответа)"""
+        with self.lock:
+            self.requests += 1
+
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+        if self.error_rate and random.random() < self.error_rate:
+            return 500, {"ok": False, "error": {"code": 500, "name": "INTERNAL_ERROR"}}
+
+        handlers = {
+            "createInvoice": self.create_invoice,
+            "getInvoices": self.get_invoices,
+            "transfer": self.transfer,
+            "getBalance": self.get_balance,
+            "getExchangeRates": self.get_exchange_rates,
+        }
+        handler = handlers.get(method)
+        if handler is None:
+            return 200, {"ok": False, "error": {"code": 405, "name": "METHOD_NOT_FOUND"}}
+        return 200, handler(params)
+
+
+def make_handler(state: FakeCryptoPay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _dispatch(self, params: Dict[str, str]):
+            path = urlparse(self.path).path.rstrip("/")
+            method = path.rsplit("/", 1)[-1]
+            if not self.headers.get("Crypto-Pay-API-Token"):
+                status, body = 401, {"ok": False, "error": {"code": 401, "name": "UNAUTHORIZED"}}
+            else:
+                status, body = state.handle(method, params)
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._dispatch(dict(parse_qsl(urlparse(self.path).query)))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            params = dict(parse_qsl(urlparse(self.path).query))
+            if raw:
+                try:
+                    params.update({k: str(v) for k, v in json.loads(raw).items()})
+                except (ValueError, AttributeError):
+                    pass
+            self._dispatch(params)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_fake_server(host: str = "127.0.0.1", port: int = 0, **options):
+    """Запуск заглушки в фоновом потоке. Возвращает (server, state, base_url)"""
+    state = FakeCryptoPay(**options)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="fake-cryptopay", daemon=True)
+    thread.start()
+    base_url = f"http://{server.server_address[0]}:{server.server_address[1]}/api"
+    return server, state, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка CryptoPay API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа, секунд")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке, секунд")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов с HTTP 500 (0..1)")
+    parser.add_argument("--paid-after", type=float, default=None,
+                        help="Через сколько секунд инвойс становится оплаченным (по умолчанию никогда)")
+    parser.add_argument("--balance", type=float, default=10000.0, help="Начальный баланс USDT")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FakeCryptoPay(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        paid_after=args.paid_after, balance=args.balance
+    )))
+    print(f"🧪 Заглушка CryptoPay слушает http://{args.host}:{args.port}/api")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Заглушка остановлена")
+
+
+if __name__ == "__main__":
+    main()
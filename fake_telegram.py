@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка Telegram Bot API для бенчмарков HTTP-клиента бота.
+
+Реализует getMe, getUpdates (пустой long polling), sendMessage,
+editMessageText и answerCallbackQuery с настраиваемой задержкой.
+Сервер асинхронный (asyncio, HTTP/1.1 keep-alive), поэтому задержка
+ответа не занимает поток и заглушка держит сотни одновременных запросов.
+
+Запуск:
+    python fake_telegram.py --port 8082 --latency 0.05
+    TELEGRAM_BASE_URL=http://127.0.0.1:8082/bot python start_bot.py
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlparse, parse_qsl
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found"}
+
+
+class FakeTelegram:
+    """Состояние заглушки: счетчики запросов и одновременных соединений"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, max_poll: float = 1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.max_poll = max_poll  # Верхняя граница ожидания getUpdates, секунд
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections = 0
+        self._ids = itertools.count(1)
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "message_id": int(params.get("message_id") or next(self._ids)),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+    async def handle(self, method: str, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Обработка вызова метода API. Возвращает (HTTP-статус, тело ответа)"""
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if method == "getUpdates":
+                await asyncio.sleep(min(float(params.get("timeout") or 0), self.max_poll))
+                return 200, {"ok": True, "result": []}
+
+            delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+            if delay > 0 and method != "_stats":
+                await asyncio.sleep(delay)
+
+            if method == "getMe":
+                return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "FakeBot",
+                                                     "username": "fake_bot", "can_join_groups": True,
+                                                     "can_read_all_group_messages": False,
+                                                     "supports_inline_queries": False}}
+            if method in ("sendMessage", "editMessageText"):
+                return 200, {"ok": True, "result": self._message(params)}
+            if method in ("answerCallbackQuery", "deleteWebhook", "setMyCommands"):
+                return 200, {"ok": True, "result": True}
+            if method == "_stats":
+                # Служебный метод для бенчмарков: счетчики заглушки (reset=1 обнуляет пик)
+                stats = {"requests": self.requests, "max_in_flight": self.max_in_flight,
+                         "connections": self.connections}
+                if params.get("reset"):
+                    self.max_in_flight = self.in_flight
+                return 200, {"ok": True, "result": stats}
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"}
+        finally:
+            self.in_flight -= 1
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Обслуживание одного keep-alive соединения"""
+        self.connections += 1
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, params, keep_alive = request
+                status, body = await self.handle(method, params)
+                payload = json.dumps(body).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'OK')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, Dict[str, Any], bool]]:
+        """Разбор запроса: (метод API, параметры, keep-alive) или None при закрытом соединении"""
+        line = await reader.readline()
+        parts = line.decode("latin-1").split(" ", 2)
+        if len(parts) != 3:
+            # Соединение закрыто или строка запроса не похожа на HTTP
+            return None
+        _, target, version = parts
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length") or 0)
+        raw = (await reader.readexactly(length)).decode() if length else ""
+        url = urlparse(target)
+        params = dict(parse_qsl(url.query))
+        if raw:
+            if "json" in headers.get("content-type", ""):
+                try:
+                    params.update(json.loads(raw))
+                except ValueError:
+                    pass
+            else:
+                params.update(parse_qsl(raw))
+
+        keep_alive = headers.get("connection", "").lower() != "close" and version.strip() == "HTTP/1.1"
+        return url.path.rstrip("/").rsplit("/", 1)[-1], params, keep_alive
+
+
+class FakeServer:
+    """Заглушка, запущенная в фоновом потоке со своим циклом событий"""
+
+    def __init__(self, state: FakeTelegram, host: str, port: int):
+        self.state = state
+        self.loop = asyncio.new_event_loop()
+        self._server = self.loop.run_until_complete(
+            asyncio.start_server(state.serve_connection, host, port, backlog=4096)
+        )
+        self.server_address = self._server.sockets[0].getsockname()[:2]
+        self._thread = threading.Thread(target=self.loop.run_forever, name="fake-telegram", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        """Остановка сервера и его потока"""
+        def _stop():
+            self._server.close()
+            self.loop.stop()
+
+        self.loop.call_soon_threadsafe(_stop)
+        self._thread.join()
+
+
+def start_fake_server(host: str = "127.0.0.1", port: int = 0, **options):
+    """Запуск заглушки в фоновом потоке. Возвращает (server, state, base_url)"""
+    state = FakeTelegram(**options)
+    server = FakeServer(state, host, port)
+    base_url = f"http://{server.server_address[0]}:{server.server_address[1]}/bot"
+    return server, state, base_url
+
+
+def start_fake_process(host: str = "127.0.0.1", latency: float = 0.0, jitter: float = 0.0):
+    """Запуск заглушки отдельным процессом, чтобы она не делила GIL с измеряемым клиентом.
+    Возвращает (process, base_url); остановка - process.terminate()"""
+    with socket.socket() as probe:
+        probe.bind((host, 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--host", host, "--port", str(port),
+         "--latency", str(latency), "--jitter", str(jitter)],
+        stdout=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            break
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError("заглушка Telegram не запустилась")
+            time.sleep(0.05)
+    return process, f"http://{host}:{port}/bot"
+
+
+async def serve(host: str, port: int, state: FakeTelegram):
+    server = await asyncio.start_server(state.serve_connection, host, port, backlog=4096)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа, секунд")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке, секунд")
+    args = parser.parse_args()
+
+    state = FakeTelegram(latency=args.latency, jitter=args.jitter)
+    print(f"🧪 Заглушка Telegram Bot API слушает http://{args.host}:{args.port}/bot")
+    try:
+        asyncio.run(serve(args.host, args.port, state))
+    except KeyboardInterrupt:
+        print("\n🛑 Заглушка остановлена")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Обслуживание файла базы SQLite.
+
+Ежедневная задача бота (run_maintenance) обновляет статистику планировщика,
+возвращает свободные страницы через incremental_vacuum и проверяет
+целостность. Перевод базы в auto_vacuum=INCREMENTAL требует полного VACUUM,
+который блокирует запись, поэтому выполняется один раз при остановленном боте:
+    python maintenance.py convert --db garant_bot.db
+"""
+
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from typing import Dict, Any
+from database import Database
+from config import MAINTENANCE_ANALYSIS_LIMIT, MAINTENANCE_VACUUM_PAGES
+
+logger = logging.getLogger(__name__)
+
+AUTO_VACUUM_INCREMENTAL = 2
+DEFAULT_DB_PATH = "garant_bot.db"
+
+
+def _timed(report: Dict[str, Any], step: str, func):
+    started = time.monotonic()
+    result = func()
+    report[f"{step}_sec"] = round(time.monotonic() - started, 3)
+    return result
+
+
+def run_maintenance(db: Database, vacuum_pages: int = MAINTENANCE_VACUUM_PAGES) -> Dict[str, Any]:
+    """Обслуживание файла базы: статистика планировщика, возврат свободных страниц, проверка целостности.
+
+    Рассчитано на запуск в тихие часы при работающем боте: возвращает
+    не более vacuum_pages свободных страниц за раз. Полный VACUUM здесь
+    не выполняется; базу без auto_vacuum=INCREMENTAL переводит convert_to_incremental.
+    """
+    report: Dict[str, Any] = {}
+    # isolation_level=None: VACUUM и PRAGMA выполняются вне транзакции
+    conn = sqlite3.connect(db.db_path, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        page_size = cursor.execute('PRAGMA page_size').fetchone()[0]
+
+        # Статистика для планировщика: полный ANALYZE, если ее еще нет, иначе PRAGMA optimize
+        has_stats = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+        ).fetchone()
+        cursor.execute(f'PRAGMA analysis_limit = {int(MAINTENANCE_ANALYSIS_LIMIT)}')
+        if has_stats:
+            _timed(report, "optimize", lambda: cursor.execute('PRAGMA optimize'))
+        else:
+            _timed(report, "analyze", lambda: cursor.execute('ANALYZE'))
+
+        freelist_before = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+        auto_vacuum = cursor.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if auto_vacuum != AUTO_VACUUM_INCREMENTAL:
+            logger.warning("⚠️ База не в режиме auto_vacuum=INCREMENTAL, свободные страницы не возвращаются. "
+                           "Остановите бота и выполните: python maintenance.py convert --db %s", db.db_path)
+        elif freelist_before:
+            # executescript выполняет PRAGMA до конца; execute освобождает одну страницу за шаг
+            _timed(report, "incremental_vacuum",
+                   lambda: cursor.executescript(f'PRAGMA incremental_vacuum({int(vacuum_pages)});'))
+        freelist_after = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+        report["reclaimed_bytes"] = max(freelist_before - freelist_after, 0) * page_size
+        report["freelist_bytes"] = freelist_after * page_size
+
+        check = _timed(report, "quick_check", lambda: cursor.execute('PRAGMA quick_check').fetchall())
+        report["integrity"] = "ok" if check == [("ok",)] else "; ".join(row[0] for row in check[:10])
+    finally:
+        conn.close()
+
+    if report["integrity"] != "ok":
+        logger.error("❌ PRAGMA quick_check обнаружил ошибки: %s", report["integrity"])
+    logger.info("🛠️ Обслуживание базы: %s",
+                ", ".join(f"{key}={value}" for key, value in report.items() if key != "integrity"))
+    return report
+
+
+def convert_to_incremental(db_path: str) -> bool:
+    """Перевести базу в auto_vacuum=INCREMENTAL полным VACUUM.
+
+    VACUUM перезаписывает весь файл и на это время блокирует запись,
+    поэтому запускать только при остановленном боте. Возвращает False,
+    если база уже в нужном режиме."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+            return False
+        # Режим auto_vacuum меняется только полной перезаписью файла
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    logger.info("🗜️ База %s переведена в auto_vacuum=INCREMENTAL", db_path)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание базы Гарант Бота")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Путь к базе")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("convert", help="Перевести базу в auto_vacuum=INCREMENTAL (бот должен быть остановлен)")
+    sub.add_parser("run", help="Выполнить ежедневное обслуживание сейчас")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        if convert_to_incremental(args.db):
+            print(f"✅ {args.db} переведена в auto_vacuum=INCREMENTAL")
+        else:
+            print(f"✅ {args.db} уже в режиме auto_vacuum=INCREMENTAL")
+    elif args.command == "run":
+        report = run_maintenance(Database(args.db))
+        for key, value in report.items():
+            print(f"{key}: {value}")
+        if report["integrity"] != "ok":
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
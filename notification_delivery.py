@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import Dict, List
+from telegram.error import Forbidden, BadRequest
+from database import Database
+from db_writer import DbWriter
+from keyboards import Keyboards
+from send_queue import SendQueue, PRIORITY_PAYMENT, PRIORITY_DEAL
+from config import NOTIFY_BATCH_SIZE, NOTIFY_COALESCE_WINDOW, NOTIFY_MAX_ITEMS
+
+logger = logging.getLogger(__name__)
+
+# Типы уведомлений, которые отправляются с приоритетом платежных событий
+PAYMENT_NOTIFICATION_TYPES = {'deal_paid', 'payout', 'refund'}
+
+# Максимальная длина текста сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+
+class NotificationDelivery:
+    """Доставка записей таблицы notifications в Telegram.
+
+    Запускается периодической задачей: забирает пачку недоставленных
+    уведомлений, объединяет уведомления одного пользователя в одно
+    сообщение, отправляет через очередь отправки и отмечает доставленные
+    одним UPDATE. Уведомления моложе NOTIFY_COALESCE_WINDOW секунд ждут
+    следующего прохода, чтобы серия событий ушла одним сообщением.
+    """
+
+    def __init__(self, db: Database, send_queue: SendQueue, db_writer: DbWriter, batch_size: int = NOTIFY_BATCH_SIZE,
+                 coalesce_window: int = NOTIFY_COALESCE_WINDOW):
+        self.db = db
+        self.send_queue = send_queue
+        self.db_writer = db_writer
+        self.batch_size = batch_size
+        self.coalesce_window = coalesce_window
+        self._running = False
+
+    async def deliver_pending(self) -> int:
+        """Один проход доставки. Возвращает число отмеченных уведомлений"""
+        if self._running:
+            return 0
+        self._running = True
+        try:
+            notifications = await asyncio.to_thread(
+                self.db.get_undelivered_notifications, self.batch_size, self.coalesce_window
+            )
+            if not notifications:
+                return 0
+
+            by_user: Dict[int, List[Dict]] = {}
+            for notification in notifications:
+                by_user.setdefault(notification['user_id'], []).append(notification)
+
+            # Уведомления без получателя отмечаем сразу, отправлять их некому
+            delivered = [n['notification_id'] for n in by_user.pop(None, [])]
+            user_ids = list(by_user)
+            results = await asyncio.gather(
+                *(self._send(user_id, by_user[user_id]) for user_id in user_ids), return_exceptions=True
+            )
+
+            for user_id, result in zip(user_ids, results):
+                # Недоступный чат не станет доступным при повторе - тоже отмечаем
+                if not isinstance(result, BaseException) or isinstance(result, (Forbidden, BadRequest)):
+                    delivered.extend(n['notification_id'] for n in by_user[user_id])
+
+            if delivered:
+                await self.db_writer.call(self.db.mark_notifications_delivered, delivered)
+            logger.debug("🔔 Доставка уведомлений: %d уведомлений, %d сообщений", len(delivered), len(user_ids))
+            return len(delivered)
+        finally:
+            self._running = False
+
+    def _send(self, user_id: int, notifications: List[Dict]) -> asyncio.Future:
+        priority = PRIORITY_DEAL
+        if any(n['notification_type'] in PAYMENT_NOTIFICATION_TYPES for n in notifications):
+            priority = PRIORITY_PAYMENT
+        return self.send_queue.send(user_id, self.format_message(notifications), priority,
+                                    reply_markup=Keyboards.get_main_menu())
+
+    @staticmethod
+    def format_message(notifications: List[Dict]) -> str:
+        """Текст сообщения: одно уведомление как есть, несколько - списком"""
+        if len(notifications) == 1:
+            return f"🔔 {notifications[0]['message']}"[:MESSAGE_LIMIT]
+
+        text = f"🔔 Новые уведомления ({len(notifications)}):\n"
+        for notification in notifications[:NOTIFY_MAX_ITEMS]:
+            text += f"\n• {notification['message']}"
+        if len(notifications) > NOTIFY_MAX_ITEMS:
+            text += f"\n\n… и еще {len(notifications) - NOTIFY_MAX_ITEMS} в разделе «Уведомления»"
+        return text[:MESSAGE_LIMIT]
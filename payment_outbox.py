@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+from database import Database
+from db_writer import DbWriter
+from rows import OutboxOperation
+from crypto_bot_api import PayoutPending
+from config import (
+    OUTBOX_CONCURRENCY, OUTBOX_POLL_INTERVAL, OUTBOX_BATCH_SIZE,
+    OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_DELAY
+)
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxWorker:
+    """Фоновая обработка исходящих платежных операций из таблицы outbox.
+
+    Обработчики Telegram только записывают операцию в outbox в той же
+    транзакции, что и изменение сделки, а обращения к CryptoPay выполняет
+    пул из concurrency воркеров. Состояние операций пишется через DbWriter.
+    """
+
+    def __init__(self, db: Database, db_writer: DbWriter, concurrency: int = OUTBOX_CONCURRENCY,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL, batch_size: int = OUTBOX_BATCH_SIZE):
+        self.db = db
+        self.db_writer = db_writer
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks = []
+
+    async def start(self):
+        """Запуск опроса outbox и пула воркеров"""
+        released = await self.db_writer.call(self.db.release_processing_outbox)
+        if released:
+            logger.info("🔁 Возвращено в очередь прерванных операций outbox: %s", released)
+
+        self._queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._poll(), name="outbox-poller")]
+        for i in range(self.concurrency):
+            self._tasks.append(asyncio.create_task(self._work(), name=f"outbox-worker-{i}"))
+        logger.info("✅ Outbox запущен: %d воркеров", self.concurrency)
+
+    async def stop(self):
+        """Остановка воркеров. Незавершенные операции будут подняты при следующем запуске"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self):
+        """Разбудить опрос outbox сразу после постановки новой операции"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _poll(self):
+        while True:
+            try:
+                operations = await self.db_writer.call(self.db.claim_outbox_batch, self.batch_size)
+            except Exception as e:
+                logger.error("Ошибка при чтении outbox: %s", e)
+                operations = []
+
+            for operation in operations:
+                await self._queue.put(operation)
+
+            if len(operations) < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _work(self):
+        while True:
+            operation = await self._queue.get()
+            try:
+                await self._process(operation)
+            except PayoutPending as e:
+                # Итог перевода неизвестен: не расходуем попытку и не помечаем failed
+                logger.warning("⏳ Итог перевода операции outbox %s неизвестен, повтор позже: %s",
+                               operation['outbox_id'], e)
+                await self.db_writer.call(self.db.defer_outbox, operation['outbox_id'], str(e),
+                                          OUTBOX_RETRY_DELAY)
+            except Exception as e:
+                logger.error("❌ Ошибка обработки операции outbox %s: %s", operation['outbox_id'], e)
+                await self.db_writer.call(self.db.retry_outbox, operation['outbox_id'], str(e),
+                                          OUTBOX_RETRY_DELAY, OUTBOX_MAX_ATTEMPTS)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, operation: OutboxOperation):
+        handler = {
+            'transfer': self._process_transfer,
+            'commission': self._process_commission
+        }.get(operation['operation'])
+
+        if handler is None:
+            logger.error("Неизвестная операция outbox: %s", operation['operation'])
+            await self.db_writer.call(self.db.complete_outbox, operation['outbox_id'], 'failed', 'unknown operation')
+            return
+
+        await handler(operation['outbox_id'], operation['payload'])
+
+    async def _process_transfer(self, outbox_id: int, payload: Dict):
+        """Перевод через CryptoPay; при отказе CryptoPay - зачисление на внутренний баланс.
+        PayoutPending (итог неизвестен) уходит в _work, и операция откладывается без расхода попытки"""
+        from crypto_bot_api import crypto_api
+
+        success = await asyncio.to_thread(crypto_api.transfer, payload['crypto_user_id'], payload['amount'],
+                                          payload.get('asset', 'USDT'), payload['spend_id'])
+        await self.db_writer.call(self.db.complete_outbox_transfer, outbox_id, payload, success)
+        logger.info("💸 Перевод %s обработан: %s", payload['spend_id'], 'CryptoPay' if success else 'внутренний баланс')
+
+    async def _process_commission(self, outbox_id: int, payload: Dict):
+        """Отправка комиссии на внешнюю криптобиржу"""
+        from crypto_bot_api import crypto_api
+
+        deal_id = payload['deal_id']
+        # Комиссия уже в долларах (USDT), конвертация не нужна
+        success = await asyncio.to_thread(crypto_api.send_commission, payload['amount'], "USDT", f"Deal_{deal_id}")
+
+        if success:
+            logger.info("💰 Комиссия %s USDT успешно отправлена на внешнюю биржу за сделку %s", payload['amount'], deal_id)
+            await self.db_writer.call(self.db.complete_outbox, outbox_id)
+        else:
+            logger.error("❌ Не удалось отправить комиссию %s USDT на внешнюю биржу за сделку %s", payload['amount'], deal_id)
+            await self.db_writer.call(self.db.complete_outbox, outbox_id, 'failed', 'commission transfer failed')
@@ -0,0 +1,111 @@
+import time
+import logging
+import threading
+from typing import Optional, Dict, Tuple, Any
+from config import USD_TO_RUB_RATE, RATES_STALE_AFTER
+
+logger = logging.getLogger(__name__)
+
+# Валюта, через которую считаются кросс-курсы (CryptoPay отдает курсы crypto -> fiat)
+PIVOT_ASSET = "USDT"
+
+
+class RateService:
+    """Снимок курсов валют CryptoPay в памяти.
+
+    Курсы обновляются фоновой задачей через refresh(), а обработчики
+    читают только снимок и никогда не ждут запроса к API.
+    """
+
+    def __init__(self, stale_after: float = RATES_STALE_AFTER):
+        self.stale_after = stale_after
+        self._rates: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self.updated_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def refresh(self) -> bool:
+        """Загрузить свежие курсы из CryptoPay и атомарно заменить снимок"""
+        from crypto_bot_api import crypto_api
+
+        items = crypto_api.get_exchange_rates()
+        if not items:
+            self.last_error = "CryptoPay не вернул курсы"
+            logger.warning("⚠️ Не удалось обновить курсы валют, используется снимок возрастом %s сек.", self.age())
+            return False
+
+        rates = {}
+        for item in items:
+            if not item.get('is_valid', True):
+                continue
+            try:
+                rates[(item['source'], item['target'])] = float(item['rate'])
+            except (KeyError, TypeError, ValueError):
+                continue
+
+        with self._lock:
+            self._rates = rates
+            self.updated_at = time.time()
+            self.last_error = None
+        logger.debug("💱 Курсы валют обновлены: %s пар", len(rates))
+        return True
+
+    def _direct(self, rates: Dict[Tuple[str, str], float], source: str, target: str) -> Optional[float]:
+        if source == target:
+            return 1.0
+        if (source, target) in rates:
+            return rates[(source, target)]
+        inverse = rates.get((target, source))
+        if inverse:
+            return 1 / inverse
+        return None
+
+    def get_rate(self, source: str, target: str) -> Optional[float]:
+        """Курс source -> target из снимка (напрямую или через USDT)"""
+        with self._lock:
+            rates = self._rates
+        rate = self._direct(rates, source, target)
+        if rate is not None:
+            return rate
+        to_pivot = self._direct(rates, source, PIVOT_ASSET)
+        from_pivot = self._direct(rates, PIVOT_ASSET, target)
+        if to_pivot is not None and from_pivot is not None:
+            return to_pivot * from_pivot
+        return None
+
+    def convert(self, amount: float, source: str, target: str) -> Optional[float]:
+        """Конвертация суммы по курсу из снимка"""
+        rate = self.get_rate(source, target)
+        return amount * rate if rate is not None else None
+
+    def get_usd_to_rub_rate(self) -> float:
+        """Курс USD -> RUB; пока снимка нет - значение из config.USD_TO_RUB_RATE"""
+        rate = self.get_rate("USD", "RUB")
+        return rate if rate is not None else USD_TO_RUB_RATE
+
+    def age(self) -> Optional[int]:
+        """Возраст снимка в секундах (None, если курсы еще не загружались)"""
+        if self.updated_at is None:
+            return None
+        return int(time.time() - self.updated_at)
+
+    def is_stale(self) -> bool:
+        """Снимок отсутствует или старше stale_after"""
+        age = self.age()
+        return age is None or age > self.stale_after
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Метаданные снимка для отображения"""
+        with self._lock:
+            pairs = len(self._rates)
+        return {
+            'pairs': pairs,
+            'updated_at': self.updated_at,
+            'age': self.age(),
+            'stale': self.is_stale(),
+            'last_error': self.last_error
+        }
+
+
+# Создаем глобальный экземпляр сервиса курсов
+rate_service = RateService()
@@ -0,0 +1,75 @@
+import logging
+import time
+from typing import Dict, List, Tuple
+from database import Database
+from config import (
+    RETENTION_BATCH_SIZE, RETENTION_BATCH_PAUSE, RETENTION_NOTIFICATIONS_READ_DAYS,
+    RETENTION_NOTIFICATIONS_UNREAD_DAYS, RETENTION_CHECKS_DAYS, RETENTION_OFFERS_DAYS,
+    RETENTION_ROLLUP_HOURLY_DAYS, STATUS_PENDING
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _older_than(days: int) -> str:
+    return f"-{int(days)} days"
+
+
+# Политики хранения: (название, таблица, условие, параметры)
+RETENTION_POLICIES: List[Tuple[str, str, str, tuple]] = [
+    # Прочитанные и уже доставленные уведомления
+    ("notifications_read", "notifications",
+     "is_read = TRUE AND delivered_at IS NOT NULL AND created_at < datetime('now', ?)",
+     (_older_than(RETENTION_NOTIFICATIONS_READ_DAYS),)),
+    # Непрочитанные уведомления, которые так и не открыли
+    ("notifications_unread", "notifications",
+     "is_read = FALSE AND delivered_at IS NOT NULL AND created_at < datetime('now', ?)",
+     (_older_than(RETENTION_NOTIFICATIONS_UNREAD_DAYS),)),
+    # Старые чеки, кроме чеков сделок, которые еще ждут оплаты
+    ("checks", "checks",
+     "created_at < datetime('now', ?) AND NOT EXISTS ("
+     "SELECT 1 FROM deals WHERE deals.status = ? "
+     "AND checks.description = 'Оплата сделки ' || deals.deal_id)",
+     (_older_than(RETENTION_CHECKS_DAYS), Database.DEAL_STATUS_CODES[STATUS_PENDING])),
+    # Отклоненные и принятые предложения сделок
+    ("deal_offers", "deal_offers",
+     "status != 'pending' AND updated_at < datetime('now', ?)",
+     (_older_than(RETENTION_OFFERS_DAYS),)),
+    # Почасовые сводки по сделкам; дневных достаточно для истории
+    ("deal_stats_hourly", "deal_stats_hourly",
+     "bucket < strftime('%Y-%m-%d %H:00', 'now', ?)",
+     (_older_than(RETENTION_ROLLUP_HOURLY_DAYS),)),
+]
+
+
+def run_retention(db: Database, batch_size: int = RETENTION_BATCH_SIZE,
+                  pause: float = RETENTION_BATCH_PAUSE) -> Dict[str, int]:
+    """Удаление устаревших строк пачками по batch_size.
+
+    Каждая пачка - отдельная короткая транзакция, между пачками пауза,
+    чтобы обработчики бота не ждали блокировку базы. Возвращает число
+    удаленных строк по политикам и объем освобожденных страниц (freed_bytes).
+    """
+    started = time.monotonic()
+    freelist_before = db.get_freelist_bytes()
+    report: Dict[str, int] = {}
+
+    for name, table, condition, params in RETENTION_POLICIES:
+        total = 0
+        while True:
+            deleted = db.purge_rows(table, condition, params, batch_size)
+            total += deleted
+            if deleted < batch_size:
+                break
+            time.sleep(pause)
+        report[name] = total
+
+    report["freed_bytes"] = max(db.get_freelist_bytes() - freelist_before, 0)
+    deleted_total = sum(v for k, v in report.items() if k != "freed_bytes")
+    if deleted_total:
+        logger.info("🧹 Очистка по срокам хранения: %s, освобождено %.1f КБ за %.2f сек.",
+                    ", ".join(f"{k}={v}" for k, v in report.items() if k != "freed_bytes"),
+                    report["freed_bytes"] / 1024, time.monotonic() - started)
+    else:
+        logger.debug("🧹 Очистка по срокам хранения: устаревших строк нет")
+    return report
@@ -0,0 +1,123 @@
+from collections import namedtuple
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+
+class Row:
+    """Строка результата запроса: поля доступны как row.amount и как row['amount'].
+
+    Конкретные классы строятся по набору колонок запроса поверх namedtuple
+    (__slots__ = (), значения хранятся в самом кортеже), поэтому строка
+    занимает меньше памяти, чем словарь, и создается одним вызовом.
+    Методы get/keys/items сохраняют совместимость с прежними словарями.
+    Доступ по имени идет через словарь класса колонка -> поле (_index),
+    поэтому методы кортежа (count, index) не выдаются за колонки.
+    """
+
+    __slots__ = ()
+    _index: Dict[str, str] = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return getattr(self, self._index[key])
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        field = self._index.get(key)
+        return default if field is None else getattr(self, field)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._fields
+
+    def values(self) -> tuple:
+        return tuple(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={value!r}" for name, value in self.items())
+        return f"{type(self).__name__}({fields})"
+
+
+class User(Row):
+    __slots__ = ()
+
+
+class Deal(Row):
+    __slots__ = ()
+
+
+class Invoice(Row):
+    __slots__ = ()
+
+
+class Notification(Row):
+    __slots__ = ()
+
+
+class DealOffer(Row):
+    __slots__ = ()
+
+
+class DealMessage(Row):
+    __slots__ = ()
+
+
+class Check(Row):
+    __slots__ = ()
+
+
+class Payout(Row):
+    __slots__ = ()
+
+
+class OutboxOperation(Row):
+    __slots__ = ()
+
+
+# (базовый класс, колонки запроса) -> класс строки
+_row_classes: Dict[Tuple[type, Tuple[str, ...]], type] = {}
+
+
+def row_class(base: Type[Row], columns: Tuple[str, ...]) -> type:
+    """Класс строки для набора колонок; создается один раз и кешируется"""
+    key = (base, columns)
+    cls = _row_classes.get(key)
+    if cls is None:
+        fields = namedtuple(base.__name__, columns, rename=True)
+        # При повторе колонки побеждает последняя, как в dict(zip(columns, row))
+        index = dict(zip(columns, fields._fields))
+        cls = type(base.__name__, (base, fields), {'__slots__': (), '_index': index})
+        _row_classes[key] = cls
+    return cls
+
+
+def fetch_rows(cursor, base: Type[Row], converters: Optional[Dict[str, Callable]] = None) -> List[Row]:
+    """Все строки курсора как объекты base.
+    converters - преобразования значений отдельных колонок (например, код статуса -> строка)"""
+    columns = tuple(description[0] for description in cursor.description)
+    make = row_class(base, columns)._make
+    rows = cursor.fetchall()
+    converted = [(i, converters[name]) for i, name in enumerate(columns) if name in converters] if converters else []
+    if not converted:
+        return list(map(make, rows))
+
+    result = []
+    for row in rows:
+        values = list(row)
+        for i, convert in converted:
+            values[i] = convert(values[i])
+        result.append(make(values))
+    return result
+
+
+def fetch_row(cursor, base: Type[Row], converters: Optional[Dict[str, Callable]] = None) -> Optional[Row]:
+    """Первая строка курсора как объект base или None"""
+    rows = fetch_rows(cursor, base, converters)
+    return rows[0] if rows else None
@@ -0,0 +1,227 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Dict, Any, Optional, Iterable
+from telegram.error import RetryAfter, NetworkError, TimedOut, Forbidden, BadRequest
+from config import (
+    SEND_GLOBAL_RATE, SEND_GLOBAL_BURST, SEND_CHAT_INTERVAL, SEND_GROUP_CHAT_INTERVAL,
+    SEND_CONCURRENCY, SEND_MAX_ATTEMPTS, SEND_RETRY_DELAY
+)
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета исходящих сообщений (меньше - важнее)
+PRIORITY_PAYMENT = 0  # Оплата, выплаты, возвраты
+PRIORITY_DEAL = 1     # Изменения статуса сделки, предложения, споры
+PRIORITY_INFO = 2     # Информационные уведомления (администраторам и т.п.)
+
+
+class _Message:
+    __slots__ = ("priority", "seq", "chat_id", "text", "kwargs", "future", "attempts")
+
+    def __init__(self, priority: int, seq: int, chat_id: int, text: str, kwargs: Dict[str, Any],
+                 future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+
+    def __lt__(self, other: "_Message") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class SendQueue:
+    """Центральная очередь исходящих сообщений Telegram.
+
+    Обработчики ставят сообщение в очередь и сразу продолжают работу.
+    Диспетчер выбирает сообщение с наивысшим приоритетом, соблюдая общий
+    лимит (token bucket) и интервал между сообщениями в один чат. Ответы
+    429 (RetryAfter) откладывают чат на указанное время и возвращают
+    сообщение в очередь, не блокируя обработчики и остальные чаты.
+    """
+
+    def __init__(self, rate: float = SEND_GLOBAL_RATE, burst: int = SEND_GLOBAL_BURST,
+                 chat_interval: float = SEND_CHAT_INTERVAL, group_interval: float = SEND_GROUP_CHAT_INTERVAL,
+                 concurrency: int = SEND_CONCURRENCY):
+        self.rate = rate
+        self.burst = burst
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.concurrency = max(1, concurrency)
+        self.bot = None
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._chat_next: Dict[int, float] = {}  # Время, раньше которого в чат писать нельзя
+        self._ready = []    # Куча готовых к отправке сообщений по (priority, seq)
+        self._delayed = []  # Куча (ready_at, message) для чатов, упершихся в лимит
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sending = set()
+        self.stats = {"sent": 0, "failed": 0, "retry_after": 0, "max_depth": 0}
+
+    async def start(self, bot):
+        """Запуск диспетчера; bot - экземпляр telegram.Bot приложения"""
+        self.bot = bot
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._dispatch(), name="send-queue")
+        logger.info("✅ Очередь отправки запущена: %.0f сообщ/с, %d параллельно", self.rate, self.concurrency)
+
+    async def stop(self):
+        """Остановка диспетчера. Неотправленные сообщения отбрасываются,
+        их future отменяются, чтобы ожидающие обработчики не зависли"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._sending, return_exceptions=True)
+            self._task = None
+        # Новые сообщения после остановки не принимаются
+        self._wakeup = None
+        dropped = self._ready + [message for _, message in self._delayed]
+        self._ready = []
+        self._delayed = []
+        for message in dropped:
+            message.future.cancel()
+        if dropped:
+            logger.warning("⚠️ Очередь отправки остановлена, не отправлено сообщений: %d", len(dropped))
+
+    def send(self, chat_id: int, text: str, priority: int = PRIORITY_INFO, **kwargs) -> asyncio.Future:
+        """Поставить сообщение в очередь.
+
+        Возвращает future с отправленным Message; ожидать его не обязательно,
+        ошибки доставки логируются очередью.
+        """
+        if self._wakeup is None:
+            raise RuntimeError("Очередь отправки не запущена")
+        future = asyncio.get_running_loop().create_future()
+        # Помечаем исключение как полученное, если future никто не ждет
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        heapq.heappush(self._ready, _Message(priority, next(self._seq), chat_id, text, kwargs, future))
+        self.stats["max_depth"] = max(self.stats["max_depth"], len(self._ready) + len(self._delayed))
+        self._wakeup.set()
+        return future
+
+    def broadcast(self, chat_ids: Iterable[int], text: str, priority: int = PRIORITY_INFO,
+                  **kwargs) -> asyncio.Future:
+        """Рассылка одного сообщения нескольким получателям.
+
+        Сообщения уходят параллельно в пределах лимитов очереди (не более
+        concurrency запросов одновременно), ошибка доставки одному получателю
+        не влияет на остальных. Повторяющиеся id отправляются один раз.
+        Возвращает future со словарем {chat_id: Message или исключение}.
+        """
+        recipients = list(dict.fromkeys(chat_id for chat_id in chat_ids if chat_id))
+        futures = [self.send(chat_id, text, priority, **kwargs) for chat_id in recipients]
+        gathered = asyncio.gather(*futures, return_exceptions=True)
+        result = asyncio.get_running_loop().create_future()
+
+        def _collect(f: asyncio.Future):
+            if f.cancelled():
+                result.cancel()
+                return
+            outcomes = dict(zip(recipients, f.result()))
+            failed = sum(isinstance(outcome, BaseException) for outcome in outcomes.values())
+            if failed:
+                logger.warning("⚠️ Рассылка: доставлено %d из %d", len(outcomes) - failed, len(outcomes))
+            result.set_result(outcomes)
+
+        gathered.add_done_callback(_collect)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Метрики очереди отправки"""
+        return dict(self.stats, queued=len(self._ready), delayed=len(self._delayed), sending=len(self._sending))
+
+    def _chat_interval(self, chat_id: int) -> float:
+        # Отрицательные id - группы и каналы, для них лимит Telegram строже
+        return self.group_interval if chat_id < 0 else self.chat_interval
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _promote_delayed(self, now: float):
+        while self._delayed and self._delayed[0][0] <= now:
+            heapq.heappush(self._ready, heapq.heappop(self._delayed)[1])
+
+    def _prune_chats(self, now: float):
+        if len(self._chat_next) > 10000:
+            self._chat_next = {chat: t for chat, t in self._chat_next.items() if t > now}
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            self._promote_delayed(now)
+
+            if not self._ready:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            message = heapq.heappop(self._ready)
+            chat_ready_at = self._chat_next.get(message.chat_id, 0.0)
+            if chat_ready_at > now:
+                # Чат занят - откладываем, не задерживая сообщения в другие чаты
+                heapq.heappush(self._delayed, (chat_ready_at, message))
+                continue
+
+            self._refill(now)
+            if self._tokens < 1:
+                heapq.heappush(self._ready, message)
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+
+            await self._slots.acquire()
+            self._tokens -= 1
+            self._chat_next[message.chat_id] = time.monotonic() + self._chat_interval(message.chat_id)
+            self._prune_chats(now)
+            task = asyncio.create_task(self._send(message))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, message: _Message):
+        try:
+            message.attempts += 1
+            result = await self.bot.send_message(message.chat_id, message.text, **message.kwargs)
+        except RetryAfter as e:
+            self.stats["retry_after"] += 1
+            retry_after = float(e.retry_after)
+            logger.warning("⏳ Telegram RetryAfter chat_id=%s retry_after=%.1f", message.chat_id, retry_after)
+            ready_at = time.monotonic() + retry_after
+            self._chat_next[message.chat_id] = ready_at
+            heapq.heappush(self._delayed, (ready_at, message))
+            self._wakeup.set()
+        except (Forbidden, BadRequest) as e:
+            # Бот заблокирован, чат не найден и т.п. - повтор не поможет
+            self._fail(message, e)
+        except (TimedOut, NetworkError) as e:
+            if message.attempts >= SEND_MAX_ATTEMPTS:
+                self._fail(message, e)
+            else:
+                ready_at = time.monotonic() + SEND_RETRY_DELAY * message.attempts
+                heapq.heappush(self._delayed, (ready_at, message))
+                self._wakeup.set()
+        except Exception as e:
+            self._fail(message, e)
+        else:
+            self.stats["sent"] += 1
+            if not message.future.done():
+                message.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def _fail(self, message: _Message, error: Exception):
+        self.stats["failed"] += 1
+        logger.error("❌ Не удалось отправить сообщение chat_id=%s: %s", message.chat_id, error)
+        if not message.future.done():
+            message.future.set_exception(error)